@@ -0,0 +1,356 @@
+# arc_blueprint.py
+# -*- coding: utf-8 -*-
+"""
+长篇章节目录的两级并行生成：
+1. 一次调用按小说架构把全书划分为若干剧情弧线（章节区间 + 概要），保存为 Novel_arcs.txt；
+2. 各弧线并行生成目录：弧线内部仍按块依次生成（每块以本弧线已生成的末尾几章为衔接参考），
+   弧线的第一块以前一弧线的概要为衔接参考；
+3. 合并后校验章节编号：缺失的章节以真实的前文目录为参考补写，重复/越界的条目丢弃；
+   最后在弧线衔接处并行做一次连贯性修订，写入 Novel_directory.txt。
+各弧线的中间结果保存在 blueprint_arcs/ 下，中断后重新调用从未完成的块继续。
+"""
+import os
+import re
+import math
+import shutil
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cancellation import OperationCancelled
+from chapter_directory_parser import split_blueprint_entries
+from prompt_definitions import arc_outline_prompt, arc_chapter_blueprint_prompt, blueprint_seam_prompt
+from utils import read_file, clear_file_content, save_string_to_txt
+
+ARC_OUTLINE_FILE = "Novel_arcs.txt"
+ARC_WORK_DIR = "blueprint_arcs"
+# 需要的分块数不少于该值时，自动改用按弧线并行生成
+ARC_PARALLEL_MIN_CHUNKS = 4
+# 衔接参考与衔接修订所用的章节数
+TAIL_ENTRIES = 5
+SEAM_ENTRIES = 3
+
+_ARC_HEAD = re.compile(r'^\s*第\s*(\d+)\s*弧\s*[-—:：]?\s*\[?(.*?)\]?\s*$', re.MULTILINE)
+_ARC_RANGE = re.compile(r'第\s*(\d+)\s*章\s*[-—~～至到]+\s*第?\s*(\d+)\s*章?')
+_ARC_SUMMARY = re.compile(r'弧线概要[:：]\s*\[?(.*?)\]?\s*$', re.MULTILINE)
+
+
+def should_use_arc_mode(number_of_chapters: int, chunk_size: int) -> bool:
+    return math.ceil(number_of_chapters / max(1, chunk_size)) >= ARC_PARALLEL_MIN_CHUNKS
+
+
+def suggested_arc_count(number_of_chapters: int, chunk_size: int) -> int:
+    """每个弧线约两块目录，弧线越多可并行的调用越多。"""
+    return max(2, math.ceil(number_of_chapters / max(1, 2 * chunk_size)))
+
+
+# ============ 弧线划分 ============
+
+def parse_arc_outline(outline_text: str) -> List[dict]:
+    """解析弧线划分文本，返回 [{"title", "start", "end", "summary"}, ...]（未做区间修正）。"""
+    heads = list(_ARC_HEAD.finditer(outline_text))
+    arcs = []
+    for i, m in enumerate(heads):
+        block_end = heads[i + 1].start() if i + 1 < len(heads) else len(outline_text)
+        block = outline_text[m.end():block_end]
+        r = _ARC_RANGE.search(block)
+        if not r:
+            continue
+        s = _ARC_SUMMARY.search(block)
+        arcs.append({
+            "title": m.group(2).strip() or f"第{m.group(1)}弧",
+            "start": int(r.group(1)),
+            "end": int(r.group(2)),
+            "summary": s.group(1).strip() if s else ""
+        })
+    return arcs
+
+
+def normalize_arcs(arcs: List[dict], number_of_chapters: int, fallback_count: int) -> List[dict]:
+    """
+    修正弧线区间，使其按顺序首尾相接并恰好覆盖 1..number_of_chapters；
+    完全落在前一弧线区间内的弧线直接丢弃（不再缩成只有一章的弧线）；
+    解析不到任何可用弧线时按 fallback_count 等分。
+    """
+    arcs = sorted((a for a in arcs if a["start"] <= number_of_chapters), key=lambda a: a["start"])
+    kept = []
+    covered = 0
+    for arc in arcs:
+        if arc["end"] <= covered or arc["end"] < 1:
+            logging.warning(f"Arc '{arc['title']}' ({arc['start']}-{arc['end']}) overlaps the previous arc, dropped.")
+            continue
+        kept.append(arc)
+        covered = arc["end"]
+    arcs = kept
+    if not arcs:
+        size = math.ceil(number_of_chapters / max(1, fallback_count))
+        arcs = [
+            {"title": f"第{i + 1}部分", "start": start, "end": min(start + size - 1, number_of_chapters), "summary": ""}
+            for i, start in enumerate(range(1, number_of_chapters + 1, size))
+        ]
+    fixed = []
+    next_start = 1
+    for arc in arcs:
+        if next_start > number_of_chapters:
+            break
+        end = min(max(arc["end"], next_start), number_of_chapters)
+        fixed.append(dict(arc, start=next_start, end=end))
+        next_start = end + 1
+    fixed[-1]["end"] = number_of_chapters
+    for i, arc in enumerate(fixed):
+        arc["index"] = i
+    return fixed
+
+
+def format_arc(arc: Optional[dict]) -> str:
+    if not arc:
+        return ""
+    return f"第{arc['index'] + 1}弧 - {arc['title']}\n章节区间：第{arc['start']}章-第{arc['end']}章\n弧线概要：{arc['summary']}"
+
+
+def load_or_generate_arcs(
+    invoke: Callable[[str], str],
+    filepath: str,
+    architecture_text: str,
+    number_of_chapters: int,
+    chunk_size: int
+) -> List[dict]:
+    """读取已保存的弧线划分（区间与当前章节数一致时），否则调用一次模型生成并保存。"""
+    outline_file = os.path.join(filepath, ARC_OUTLINE_FILE)
+    arc_count = suggested_arc_count(number_of_chapters, chunk_size)
+    saved = parse_arc_outline(read_file(outline_file))
+    if saved and saved[0]["start"] == 1 and saved[-1]["end"] == number_of_chapters:
+        logging.info(f"Reusing arc outline from {ARC_OUTLINE_FILE} ({len(saved)} arcs).")
+        return normalize_arcs(saved, number_of_chapters, arc_count)
+
+    logging.info(f"Generating arc outline ({arc_count} arcs suggested) ...")
+    outline_text = invoke(arc_outline_prompt.format(
+        novel_architecture=architecture_text,
+        number_of_chapters=number_of_chapters,
+        arc_count=arc_count
+    ))
+    arcs = normalize_arcs(parse_arc_outline(outline_text), number_of_chapters, arc_count)
+    clear_file_content(outline_file)
+    save_string_to_txt("\n\n".join(format_arc(a) for a in arcs), outline_file)
+    logging.info(f"Arc outline saved: {len(arcs)} arcs.")
+    return arcs
+
+
+# ============ 各弧线目录 ============
+
+def entries_in_range(text: str, start: int, end: int) -> Dict[int, str]:
+    """取 start..end 范围内的条目，同一章号只保留第一次出现的。"""
+    result = {}
+    for number, entry in split_blueprint_entries(text):
+        if start <= number <= end and number not in result:
+            result[number] = entry
+    return result
+
+
+def join_entries(entries: Dict[int, str]) -> str:
+    return "\n\n".join(entries[k] for k in sorted(entries))
+
+
+def tail_text(entries: Dict[int, str], before: int, count: int = TAIL_ENTRIES) -> str:
+    numbers = sorted(k for k in entries if k < before)[-count:]
+    return "\n\n".join(entries[k] for k in numbers)
+
+
+def generate_range(
+    invoke: Callable[[str], str],
+    architecture_text: str,
+    number_of_chapters: int,
+    arcs_text: str,
+    arc: dict,
+    next_arc: Optional[dict],
+    previous_tail: str,
+    start: int,
+    end: int
+) -> Dict[int, str]:
+    logging.info(f"Generating chapters [{start}..{end}] of arc {arc['index'] + 1} ...")
+    result = invoke(arc_chapter_blueprint_prompt.format(
+        novel_architecture=architecture_text,
+        number_of_chapters=number_of_chapters,
+        arc_outline=arcs_text,
+        current_arc=format_arc(arc),
+        next_arc=format_arc(next_arc),
+        previous_tail=previous_tail,
+        n=start,
+        m=end
+    ))
+    return entries_in_range(result, start, end)
+
+
+def generate_arc(
+    invoke: Callable[[str], str],
+    work_dir: str,
+    architecture_text: str,
+    number_of_chapters: int,
+    arcs: List[dict],
+    arc: dict,
+    chunk_size: int
+) -> Dict[int, str]:
+    """生成一个弧线的目录，逐块追加到 blueprint_arcs/arc_{i}.txt，返回 {章号: 条目}。"""
+    work_file = os.path.join(work_dir, f"arc_{arc['index']}.txt")
+    entries = entries_in_range(read_file(work_file), arc["start"], arc["end"])
+    arcs_text = "\n\n".join(format_arc(a) for a in arcs)
+    prev_arc = arcs[arc["index"] - 1] if arc["index"] > 0 else None
+    next_arc = arcs[arc["index"] + 1] if arc["index"] + 1 < len(arcs) else None
+
+    current = max(entries) + 1 if entries else arc["start"]
+    while current <= arc["end"]:
+        end = min(current + chunk_size - 1, arc["end"])
+        if entries:
+            previous_tail = tail_text(entries, current)
+        elif prev_arc:
+            previous_tail = "上一弧线：\n" + format_arc(prev_arc)
+        else:
+            previous_tail = ""
+        chunk = generate_range(
+            invoke, architecture_text, number_of_chapters, arcs_text, arc, next_arc, previous_tail, current, end
+        )
+        if not chunk:
+            logging.warning(f"Arc {arc['index'] + 1}: chunk [{current}..{end}] is empty, stopped.")
+            break
+        entries.update(chunk)
+        clear_file_content(work_file)
+        save_string_to_txt(join_entries(entries), work_file)
+        # 模型漏掉的章节留给合并后的校验补写
+        current = max(chunk) + 1
+    return entries
+
+
+# ============ 合并与校验 ============
+
+def missing_ranges(entries: Dict[int, str], number_of_chapters: int) -> List[Tuple[int, int]]:
+    ranges = []
+    start = None
+    for number in range(1, number_of_chapters + 2):
+        if number <= number_of_chapters and number not in entries:
+            if start is None:
+                start = number
+        elif start is not None:
+            ranges.append((start, number - 1))
+            start = None
+    return ranges
+
+
+def arc_of(arcs: List[dict], chapter: int) -> dict:
+    for arc in arcs:
+        if arc["start"] <= chapter <= arc["end"]:
+            return arc
+    return arcs[-1]
+
+
+def fill_missing(
+    invoke: Callable[[str], str],
+    architecture_text: str,
+    number_of_chapters: int,
+    arcs: List[dict],
+    entries: Dict[int, str],
+    chunk_size: int,
+    max_rounds: int = 2
+):
+    """补写缺失的章节，以已有的前文目录为衔接参考；最多尝试 max_rounds 轮。"""
+    arcs_text = "\n\n".join(format_arc(a) for a in arcs)
+    for _ in range(max_rounds):
+        gaps = missing_ranges(entries, number_of_chapters)
+        if not gaps:
+            return
+        logging.info(f"Blueprint validation: filling missing chapters {gaps}")
+        for gap_start, gap_end in gaps:
+            current = gap_start
+            while current <= gap_end:
+                arc = arc_of(arcs, current)
+                end = min(current + chunk_size - 1, gap_end, arc["end"])
+                next_arc = arcs[arc["index"] + 1] if arc["index"] + 1 < len(arcs) else None
+                chunk = generate_range(
+                    invoke, architecture_text, number_of_chapters, arcs_text, arc, next_arc,
+                    tail_text(entries, current), current, end
+                )
+                entries.update(chunk)
+                current = end + 1
+
+
+def smooth_seam(invoke: Callable[[str], str], entries: Dict[int, str], arc: dict) -> Dict[int, str]:
+    """修订 arc 开头几章，使其承接前一弧线的结尾；输出编号不完整时不采用。"""
+    start = arc["start"]
+    end = min(arc["end"], start + SEAM_ENTRIES - 1)
+    next_numbers = [k for k in range(start, end + 1) if k in entries]
+    if len(next_numbers) != end - start + 1:
+        return {}
+    result = invoke(blueprint_seam_prompt.format(
+        previous_entries=tail_text(entries, start, SEAM_ENTRIES),
+        next_arc_title=arc["title"],
+        next_arc_summary=arc["summary"],
+        next_entries=join_entries({k: entries[k] for k in next_numbers}),
+        n=start,
+        m=end
+    ))
+    revised = entries_in_range(result, start, end)
+    return revised if len(revised) == len(next_numbers) else {}
+
+
+def Arc_blueprint_generate(
+    invoke: Callable[[str], str],
+    filepath: str,
+    architecture_text: str,
+    number_of_chapters: int,
+    chunk_size: int,
+    max_workers: int = 4,
+    smooth_seams: bool = True
+) -> bool:
+    """
+    按弧线并行生成全书目录并写入 Novel_directory.txt，成功返回 True。
+    invoke(prompt) 负责调用模型并返回清理后的文本（可在多个线程中同时调用）。
+    """
+    arcs = load_or_generate_arcs(invoke, filepath, architecture_text, number_of_chapters, chunk_size)
+    work_dir = os.path.join(filepath, ARC_WORK_DIR)
+    os.makedirs(work_dir, exist_ok=True)
+
+    entries: Dict[int, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(arcs))), thread_name_prefix="arc") as executor:
+        futures = [
+            executor.submit(generate_arc, invoke, work_dir, architecture_text, number_of_chapters, arcs, arc, chunk_size)
+            for arc in arcs
+        ]
+        for arc, future in zip(arcs, futures):
+            try:
+                entries.update(future.result())
+            except OperationCancelled:
+                # 各弧线已完成的块都已写入中间结果，继续生成时从断点开始
+                raise
+            except Exception as e:
+                logging.warning(f"Arc {arc['index'] + 1} generation failed: {e}")
+                traceback.print_exc()
+
+    fill_missing(invoke, architecture_text, number_of_chapters, arcs, entries, chunk_size)
+    gaps = missing_ranges(entries, number_of_chapters)
+    if gaps:
+        logging.warning(f"Blueprint is still missing chapters {gaps}; rerun to continue.")
+        # 补写的章节也保存下来，下次只需补齐剩余部分
+        for arc in arcs:
+            arc_entries = {k: v for k, v in entries.items() if arc["start"] <= k <= arc["end"]}
+            work_file = os.path.join(work_dir, f"arc_{arc['index']}.txt")
+            clear_file_content(work_file)
+            save_string_to_txt(join_entries(arc_entries), work_file)
+        return False
+
+    if smooth_seams and len(arcs) > 1:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(arcs) - 1)), thread_name_prefix="seam") as executor:
+            futures = [executor.submit(smooth_seam, invoke, dict(entries), arc) for arc in arcs[1:]]
+            for arc, future in zip(arcs[1:], futures):
+                try:
+                    entries.update(future.result())
+                except OperationCancelled:
+                    raise
+                except Exception as e:
+                    logging.warning(f"Seam revision before arc {arc['index'] + 1} failed, kept as is: {e}")
+
+    directory_file = os.path.join(filepath, "Novel_directory.txt")
+    clear_file_content(directory_file)
+    save_string_to_txt(join_entries(entries), directory_file)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    logging.info(f"Novel_directory.txt has been generated successfully ({len(arcs)} arcs in parallel).")
+    return True
@@ -0,0 +1,458 @@
+# batch_cli.py
+# -*- coding: utf-8 -*-
+"""
+无界面批量生成：读取 config.json，对指定章节范围执行 草稿 ->（可选）扩写 -> 定稿，
+加 --setup 时先补齐缺失的架构与章节目录。各阶段作为依赖图中的节点交给 pipeline_scheduler 调度，
+每个节点的开始/完成记录在 <保存路径>/pipeline_journal.jsonl，进程中断后重新运行会从未完成的节点继续。
+不导入任何 GUI 依赖，可在无显示器的服务器上运行。
+
+用法：
+    python batch_cli.py --start 1 --end 20
+    python batch_cli.py --config config.json --start 5 --end 8 --enrich
+    python batch_cli.py --setup --start 1 --end 10 --workers 3
+    python batch_cli.py --status
+
+退出码：
+    0  全部章节完成
+    1  有节点生成失败（已完成的节点保留在日志中，可直接重跑续做）
+    2  参数或配置错误
+    3  缺少前置文件（Novel_architecture.txt / Novel_directory.txt）且未指定 --setup
+    4  该项目已有其他进程在运行
+    130 被中断（Ctrl+C）：正在进行的模型调用通过取消令牌立即停止，已提交的结果保留
+"""
+import os
+import sys
+import signal
+import logging
+import argparse
+from typing import List, Optional
+
+from config_manager import load_config
+from utils import read_file, clear_file_content, save_string_to_txt, count_chinese_and_english
+from pipeline_scheduler import PipelineNode, PipelineBusyError, run_pipeline, journal_status, format_journal_status
+from cancellation import CancelToken
+from finalize_parts import clear_committed_parts
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_MISSING_INPUT = 3
+EXIT_BUSY = 4
+EXIT_INTERRUPTED = 130
+
+ARCH_PREFIX = "arch:"
+ARCH_NODE = "architecture"
+
+
+# ============ 配置 ============
+
+def build_run_config(cfg: dict, args) -> dict:
+    """把 config.json（与 GUI 保存的格式相同）与命令行参数合并为一次运行所需的参数。"""
+    filepath = (args.filepath or cfg.get("filepath", "")).strip()
+    if not filepath:
+        raise ValueError("filepath is not set in config.json and --filepath was not given.")
+    for key in ("api_key", "base_url", "model_name", "interface_format"):
+        if key not in cfg:
+            raise ValueError(f"'{key}' is missing in config.json.")
+    return {
+        "filepath": filepath,
+        "api_key": cfg.get("api_key", ""),
+        "base_url": cfg.get("base_url", ""),
+        "model_name": cfg.get("model_name", ""),
+        "interface_format": cfg.get("interface_format", "OpenAI"),
+        "temperature": float(cfg.get("temperature", 0.7)),
+        "max_tokens": int(cfg.get("max_tokens", 8192)),
+        "timeout": int(cfg.get("timeout", 600)),
+        "embedding_api_key": cfg.get("embedding_api_key", ""),
+        "embedding_url": cfg.get("embedding_url", ""),
+        "embedding_interface_format": cfg.get("embedding_interface_format", "OpenAI"),
+        "embedding_model_name": cfg.get("embedding_model_name", ""),
+        "embedding_retrieval_k": int(cfg.get("embedding_retrieval_k", 4)),
+        # 各集合的检索条数与权重，未填写时由 retrieval_collections_from_config 使用默认值
+        "knowledge_retrieval_k": cfg.get("knowledge_retrieval_k"),
+        "chapter_retrieval_weight": cfg.get("chapter_retrieval_weight"),
+        "knowledge_retrieval_weight": cfg.get("knowledge_retrieval_weight"),
+        "enable_rerank": bool(cfg.get("enable_rerank", False)),
+        "topic": cfg.get("topic", ""),
+        "genre": cfg.get("genre", ""),
+        "num_chapters": int(cfg.get("num_chapters", 10)),
+        "word_number": int(args.word_number or cfg.get("word_number", 3000)),
+        "user_guidance": cfg.get("user_guidance", ""),
+        "characters_involved": cfg.get("characters_involved", ""),
+        "key_items": cfg.get("key_items", ""),
+        "scene_location": cfg.get("scene_location", ""),
+        "time_constraint": cfg.get("time_constraint", ""),
+        "chapter_lang_format": cfg.get("chapter_lang_format", "中文"),
+        "scene_parallel": bool(cfg.get("scene_parallel", False)),
+        "blueprint_workers": max(1, int(getattr(args, "blueprint_workers", 4))),
+    }
+
+
+def create_run_llm_adapter(rc: dict, cancel_token: Optional[CancelToken] = None):
+    from llm_adapters import create_llm_adapter
+    return create_llm_adapter(
+        interface_format=rc["interface_format"],
+        base_url=rc["base_url"],
+        model_name=rc["model_name"],
+        api_key=rc["api_key"],
+        temperature=rc["temperature"],
+        max_tokens=rc["max_tokens"],
+        timeout=rc["timeout"],
+        cancel_token=cancel_token
+    )
+
+
+# ============ 架构与目录节点 ============
+
+def build_setup_nodes(rc: dict, cancel_token: Optional[CancelToken] = None) -> List[PipelineNode]:
+    """
+    架构各步骤（依赖关系同 build_architecture_steps）-> 写入 Novel_architecture.txt -> 按块依次生成章节目录
+    （长篇改为按剧情弧线并行生成，见 arc_blueprint）。
+    已存在的架构文件、目录中已覆盖的章节块（例如在界面中生成过）直接视为完成；
+    界面中断留下的 partial_architecture.json 中已完成的步骤也会复用。
+    """
+    from novel_generator import (
+        build_architecture_steps, load_partial_architecture_data, save_initial_character_state,
+        write_architecture_file, compute_chunk_size, max_blueprint_chapter, generate_blueprint_chunk,
+        invoke_with_cleaning
+    )
+    from arc_blueprint import Arc_blueprint_generate, should_use_arc_mode
+    from prompt_definitions import chapter_blueprint_prompt
+
+    filepath = rc["filepath"]
+    arch_file = os.path.join(filepath, "Novel_architecture.txt")
+    directory_file = os.path.join(filepath, "Novel_directory.txt")
+    n = rc["num_chapters"]
+    llm_adapter = create_run_llm_adapter(rc, cancel_token)
+
+    def arch_exists():
+        return {"existing": True} if read_file(arch_file).strip() else None
+
+    def arch_data(r: dict) -> dict:
+        return {k[len(ARCH_PREFIX):]: v for k, v in r.items() if k.startswith(ARCH_PREFIX)}
+
+    partial = load_partial_architecture_data(filepath)
+    nodes = []
+    arch_steps = build_architecture_steps(llm_adapter, rc["topic"], rc["genre"], n, rc["word_number"])
+    for step in arch_steps:
+        def run(r, step=step):
+            result = step.run(arch_data(r))
+            if step.name == "character_state_result" and result and result.strip():
+                save_initial_character_state(filepath, result)
+            return result
+
+        def existing(step=step):
+            return arch_exists() or partial.get(step.name)
+
+        nodes.append(PipelineNode(
+            ARCH_PREFIX + step.name, [ARCH_PREFIX + d for d in step.deps], run, step.label, existing
+        ))
+
+    def write_architecture(r):
+        write_architecture_file(filepath, rc["topic"], rc["genre"], n, rc["word_number"], arch_data(r))
+        return {"file": "Novel_architecture.txt"}
+
+    nodes.append(PipelineNode(
+        ARCH_NODE, [ARCH_PREFIX + s.name for s in arch_steps], write_architecture,
+        "Write Novel_architecture.txt", arch_exists
+    ))
+
+    chunk_size = compute_chunk_size(n, rc["max_tokens"])
+    if not read_file(directory_file).strip() and should_use_arc_mode(n, chunk_size):
+        # 长篇按剧情弧线并行生成，整份目录作为一个节点（其内部的中间结果自行断点续跑）
+        def run_arcs(r):
+            ok = Arc_blueprint_generate(
+                lambda prompt: invoke_with_cleaning(llm_adapter, prompt),
+                filepath, read_file(arch_file).strip(), n, chunk_size, max_workers=rc["blueprint_workers"]
+            )
+            return {"chapters": [1, n], "arcs": True} if ok else None
+
+        nodes.append(PipelineNode(
+            f"blueprint:1-{n}", [ARCH_NODE], run_arcs, "Blueprint by arcs",
+            lambda: {"chapters": [1, n], "existing": True} if max_blueprint_chapter(read_file(directory_file)) >= n else None
+        ))
+        return nodes
+
+    # 每块目录以之前已生成的目录为上下文，因此块之间串行；章节草稿只需等待覆盖它的那一块
+    prev = ARCH_NODE
+    for start in range(1, n + 1, chunk_size):
+        end = min(start + chunk_size - 1, n)
+
+        def run_chunk(r, start=start, end=end):
+            existing_blueprint = read_file(directory_file).strip()
+            if max_blueprint_chapter(existing_blueprint) >= end:
+                return {"chapters": [start, end]}
+            architecture_text = read_file(arch_file).strip()
+            if start == 1 and end == n:
+                chunk = invoke_with_cleaning(llm_adapter, chapter_blueprint_prompt.format(
+                    novel_architecture=architecture_text,
+                    number_of_chapters=n
+                )).strip()
+            else:
+                chunk = generate_blueprint_chunk(llm_adapter, architecture_text, existing_blueprint, n, start, end)
+            if not chunk:
+                return None
+            blueprint = (existing_blueprint + "\n\n" + chunk).strip() if existing_blueprint else chunk
+            clear_file_content(directory_file)
+            save_string_to_txt(blueprint, directory_file)
+            return {"chapters": [start, end]}
+
+        def chunk_exists(start=start, end=end):
+            if max_blueprint_chapter(read_file(directory_file)) >= end:
+                return {"chapters": [start, end], "existing": True}
+            return None
+
+        name = f"blueprint:{start}-{end}"
+        nodes.append(PipelineNode(name, [prev], run_chunk, f"Blueprint chapters [{start}..{end}]", chunk_exists))
+        prev = name
+    return nodes
+
+
+def blueprint_node_for(nodes: List[PipelineNode], chapter: int) -> str:
+    """覆盖第 chapter 章的目录块节点名，没有时返回空串。"""
+    for node in nodes:
+        if node.name.startswith("blueprint:"):
+            start, end = (int(x) for x in node.name.split(":", 1)[1].split("-"))
+            if start <= chapter <= end:
+                return node.name
+    return ""
+
+
+# ============ 章节节点 ============
+
+def build_chapter_nodes(
+    rc: dict,
+    start: int,
+    end: int,
+    enrich: bool = False,
+    enrich_ratio: float = 0.8,
+    atomic: bool = False,
+    setup_nodes: List[PipelineNode] = (),
+    cancel_token: Optional[CancelToken] = None
+) -> List[PipelineNode]:
+    """
+    每章 draft:N ->（enrich:N）-> finalize:N；下一章草稿依赖上一章定稿后的摘要与角色状态，
+    因此 draft:N+1 依赖 finalize:N。带架构/目录节点时，draft:N 还依赖覆盖第 N 章的目录块，
+    前几章的草稿可与后面的目录块并发生成。
+    定稿按部分记录断点，中断后重跑 finalize:N 只执行尚未提交的部分；重新生成草稿时清除该章的断点。
+    """
+    from novel_generator import (
+        generate_chapter_draft, enrich_chapter_text, finalize_chapter, retrieval_collections_from_config
+    )
+
+    filepath = rc["filepath"]
+    nodes = []
+    for chapter in range(start, end + 1):
+        chapter_file = os.path.join(filepath, "chapters", f"chapter_{chapter}.txt")
+
+        def draft(r, chapter=chapter):
+            # 新草稿需要重新定稿，清除上一版本留下的定稿断点
+            clear_committed_parts(filepath, [chapter])
+            text = generate_chapter_draft(
+                api_key=rc["api_key"],
+                base_url=rc["base_url"],
+                model_name=rc["model_name"],
+                filepath=filepath,
+                novel_number=chapter,
+                word_number=rc["word_number"],
+                temperature=rc["temperature"],
+                user_guidance=rc["user_guidance"],
+                characters_involved=rc["characters_involved"],
+                key_items=rc["key_items"],
+                scene_location=rc["scene_location"],
+                time_constraint=rc["time_constraint"],
+                embedding_api_key=rc["embedding_api_key"],
+                embedding_url=rc["embedding_url"],
+                embedding_interface_format=rc["embedding_interface_format"],
+                embedding_model_name=rc["embedding_model_name"],
+                embedding_retrieval_k=rc["embedding_retrieval_k"],
+                retrieval_collections=retrieval_collections_from_config(rc),
+                enable_rerank=rc["enable_rerank"],
+                interface_format=rc["interface_format"],
+                max_tokens=rc["max_tokens"],
+                timeout=rc["timeout"],
+                chapter_lang_format=rc["chapter_lang_format"],
+                cancel_token=cancel_token,
+                scene_parallel=rc["scene_parallel"]
+            )
+            if not text or not text.strip():
+                return None
+            return {"words": count_chinese_and_english(text)}
+
+        def enrich_step(r, chapter_file=chapter_file):
+            text = read_file(chapter_file).strip()
+            words = count_chinese_and_english(text)
+            if words >= enrich_ratio * rc["word_number"]:
+                return {"words": words, "enriched": False}
+            logging.info(f"{words} words < {enrich_ratio:.0%} of target, enriching {chapter_file} ...")
+            enriched = enrich_chapter_text(
+                chapter_text=text,
+                word_number=rc["word_number"],
+                api_key=rc["api_key"],
+                base_url=rc["base_url"],
+                model_name=rc["model_name"],
+                temperature=rc["temperature"],
+                interface_format=rc["interface_format"],
+                max_tokens=rc["max_tokens"],
+                timeout=rc["timeout"],
+                cancel_token=cancel_token,
+                scene_parallel=rc["scene_parallel"],
+                chapter_lang_format=rc["chapter_lang_format"]
+            )
+            if not enriched or not enriched.strip() or enriched == text:
+                return {"words": words, "enriched": False}
+            clear_file_content(chapter_file)
+            save_string_to_txt(enriched, chapter_file)
+            return {"words": count_chinese_and_english(enriched), "enriched": True}
+
+        def finalize(r, chapter=chapter):
+            status = finalize_chapter(
+                novel_number=chapter,
+                word_number=rc["word_number"],
+                api_key=rc["api_key"],
+                base_url=rc["base_url"],
+                model_name=rc["model_name"],
+                temperature=rc["temperature"],
+                filepath=filepath,
+                embedding_api_key=rc["embedding_api_key"],
+                embedding_url=rc["embedding_url"],
+                embedding_interface_format=rc["embedding_interface_format"],
+                embedding_model_name=rc["embedding_model_name"],
+                interface_format=rc["interface_format"],
+                max_tokens=rc["max_tokens"],
+                timeout=rc["timeout"],
+                atomic=atomic,
+                cancel_token=cancel_token,
+                checkpoint=True
+            )
+            # 摘要与角色状态是下一章草稿的输入，二者都提交后才算定稿完成
+            if not status or not (status.get("summary") and status.get("character_state")):
+                raise RuntimeError(f"finalize incomplete: {status}")
+            return status
+
+        draft_deps = [f"finalize:{chapter - 1}"] if chapter > start else []
+        blueprint_dep = blueprint_node_for(list(setup_nodes), chapter)
+        if blueprint_dep:
+            draft_deps.append(blueprint_dep)
+        elif setup_nodes:
+            draft_deps.append(ARCH_NODE)
+        nodes.append(PipelineNode(f"draft:{chapter}", draft_deps, draft, f"[Chapter {chapter}] draft"))
+        finalize_dep = f"draft:{chapter}"
+        if enrich:
+            nodes.append(PipelineNode(f"enrich:{chapter}", [finalize_dep], enrich_step, f"[Chapter {chapter}] enrich"))
+            finalize_dep = f"enrich:{chapter}"
+        nodes.append(PipelineNode(f"finalize:{chapter}", [finalize_dep], finalize, f"[Chapter {chapter}] finalize"))
+    return nodes
+
+
+def chapter_node_names(start: int, end: int) -> List[str]:
+    return [f"{stage}:{c}" for c in range(start, end + 1) for stage in ("draft", "enrich", "finalize")]
+
+
+def run_batch(rc: dict, start: int, end: int, enrich: bool = False, enrich_ratio: float = 0.8,
+              atomic: bool = False, force: bool = False, setup: bool = False, workers: int = 2,
+              cancel_token: Optional[CancelToken] = None) -> int:
+    """构建节点图并运行，返回退出码。cancel_token 被取消时各节点正在进行的模型调用立即停止。"""
+    filepath = rc["filepath"]
+    if not setup:
+        for name in ("Novel_architecture.txt", "Novel_directory.txt"):
+            if not read_file(os.path.join(filepath, name)).strip():
+                logging.error(f"{name} not found in '{filepath}', generate it first or pass --setup.")
+                return EXIT_MISSING_INPUT
+    elif not read_file(os.path.join(filepath, "Novel_architecture.txt")).strip() and not rc["topic"]:
+        logging.error("'topic' is empty in config.json, cannot generate the novel architecture.")
+        return EXIT_USAGE
+    os.makedirs(os.path.join(filepath, "chapters"), exist_ok=True)
+
+    setup_nodes = build_setup_nodes(rc, cancel_token) if setup else []
+    nodes = setup_nodes + build_chapter_nodes(rc, start, end, enrich, enrich_ratio, atomic, setup_nodes, cancel_token)
+    reset = chapter_node_names(start, end) if force else ()
+    try:
+        ok = run_pipeline(filepath, nodes, max_workers=workers, reset=reset)
+    except PipelineBusyError as e:
+        logging.error(str(e))
+        return EXIT_BUSY
+    if not ok:
+        logging.error("Pipeline stopped on a failed node; rerun the same command to resume.")
+        return EXIT_FAILED
+    logging.info(f"Chapters {start}-{end} completed.")
+    return EXIT_OK
+
+
+def print_status(filepath: str) -> int:
+    """输出项目流水线日志中各节点的状态（只读，可在批量进程运行时查看进度）。"""
+    for line in format_journal_status(journal_status(filepath)):
+        print(line)
+    return EXIT_OK
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="AI_NovelGenerator 无界面批量生成（草稿 -> 扩写 -> 定稿）")
+    parser.add_argument("--config", default="config.json", help="配置文件路径（与界面保存的 config.json 相同）")
+    parser.add_argument("--start", type=int, help="起始章节号（--status 时不需要）")
+    parser.add_argument("--end", type=int, help="结束章节号（含），默认等于起始章节号")
+    parser.add_argument("--filepath", default="", help="覆盖配置中的小说保存路径")
+    parser.add_argument("--word-number", type=int, default=0, help="覆盖配置中的每章目标字数")
+    parser.add_argument("--setup", action="store_true", help="缺少架构或章节目录时先生成")
+    parser.add_argument("--enrich", action="store_true", help="字数不足时自动扩写")
+    parser.add_argument("--enrich-ratio", type=float, default=0.8, help="低于目标字数的该比例时扩写（默认 0.8）")
+    parser.add_argument("--atomic-finalize", action="store_true", help="定稿任一部分失败时不提交任何结果")
+    parser.add_argument("--force", action="store_true", help="清除该范围章节的已完成记录，全部重新生成")
+    parser.add_argument("--workers", type=int, default=2, help="同时运行的节点数上限（默认 2）")
+    parser.add_argument("--blueprint-workers", type=int, default=4, help="按弧线并行生成目录时的并发数（默认 4）")
+    parser.add_argument("--log-file", default="", help="同时把日志写入该文件")
+    parser.add_argument("--status", action="store_true", help="只显示各节点的完成情况，不运行")
+    args = parser.parse_args(argv)
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if args.log_file:
+        handlers.append(logging.FileHandler(args.log_file, encoding="utf-8"))
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s",
+                        handlers=handlers, force=True)
+
+    if args.status:
+        cfg = load_config(args.config) if os.path.exists(args.config) else {}
+        filepath = (args.filepath or cfg.get("filepath", "")).strip()
+        if not filepath:
+            logging.error("filepath is not set in config.json and --filepath was not given.")
+            return EXIT_USAGE
+        return print_status(filepath)
+    if args.start is None:
+        logging.error("--start is required unless --status is given.")
+        return EXIT_USAGE
+
+    end = args.end if args.end is not None else args.start
+    if args.start < 1 or end < args.start or args.workers < 1:
+        logging.error("Invalid chapter range or worker count.")
+        return EXIT_USAGE
+    if not os.path.exists(args.config):
+        logging.error(f"Config file not found: {args.config}")
+        return EXIT_USAGE
+    try:
+        rc = build_run_config(load_config(args.config), args)
+    except (ValueError, TypeError) as e:
+        logging.error(f"Invalid config: {e}")
+        return EXIT_USAGE
+
+    # Ctrl+C 时先取消令牌再抛出 KeyboardInterrupt：调度线程退出前要等待正在运行的节点，
+    # 令牌取消后这些节点的模型调用立即停止，不必等到调用完成
+    token = CancelToken()
+
+    def on_interrupt(signum, frame):
+        token.cancel("interrupted")
+        raise KeyboardInterrupt
+
+    previous_handler = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        return run_batch(rc, args.start, end, enrich=args.enrich, enrich_ratio=args.enrich_ratio,
+                         atomic=args.atomic_finalize, force=args.force, setup=args.setup, workers=args.workers,
+                         cancel_token=token)
+    except KeyboardInterrupt:
+        logging.warning("Interrupted, completed nodes are kept in the pipeline journal.")
+        return EXIT_INTERRUPTED
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
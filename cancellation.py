@@ -0,0 +1,103 @@
+# cancellation.py
+# -*- coding: utf-8 -*-
+"""
+协作式取消与截止时间：
+界面的每个操作创建一个 CancelToken，沿生成流程传入各阶段函数并挂在 LLM 适配器上。
+- 适配器在带令牌时改用流式输出，每收到一段检查一次，取消后立即关闭连接，不再继续消耗 token；
+- invoke_with_cleaning 在后台线程中等待模型返回，调用方每 0.2 秒检查一次令牌，取消后在一秒内返回；
+- 各阶段在写入断点文件之前检查令牌，取消时只保留已完整写入的断点（与中途失败的处理相同）。
+令牌到达截止时间视同取消。
+"""
+import time
+import threading
+from typing import Any, Callable, Optional
+
+# 等待后台调用时检查令牌的间隔（秒）
+POLL_INTERVAL = 0.2
+
+
+class OperationCancelled(Exception):
+    """操作被用户取消或超过截止时间。重试逻辑不应重试该异常。"""
+
+
+class CancelToken:
+    """
+    可在多个线程间共享的取消令牌。
+    deadline_seconds 为从创建起允许运行的总秒数，None 表示不限。
+    parent 不为空时，父令牌被取消（或到期）时本令牌随之取消；取消本令牌不影响父令牌。
+    """
+
+    def __init__(self, deadline_seconds: Optional[float] = None, parent: Optional["CancelToken"] = None):
+        self._event = threading.Event()
+        self.reason = ""
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        self.parent = parent
+
+    def cancel(self, reason: str = "cancelled by user"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.parent is not None and self.parent.cancelled:
+            self.cancel(self.parent.reason)
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+            return True
+        return False
+
+    def remaining(self) -> Optional[float]:
+        """距截止时间的秒数，不限时返回 None。"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise OperationCancelled(self.reason)
+
+    def wait(self, seconds: float) -> bool:
+        """最多等待 seconds 秒（可被取消或截止时间提前唤醒），返回是否已取消。"""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self._event.wait(max(0.0, seconds))
+        return self.cancelled
+
+
+def check_cancelled(token: Optional[CancelToken]):
+    """token 为 None 时什么都不做，便于在可选参数上直接调用。"""
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def run_cancellable(func: Callable[[], Any], token: Optional[CancelToken]) -> Any:
+    """
+    在后台线程中执行 func 并等待结果；期间令牌被取消（或到期）时立即抛出 OperationCancelled，
+    后台线程自行结束（适配器流式读取时会在下一段输出到达时停止），其结果被丢弃。
+    token 为 None 时直接在当前线程执行。
+    """
+    if token is None:
+        return func()
+    token.raise_if_cancelled()
+    outcome = {}
+    done = threading.Event()
+
+    def runner():
+        try:
+            outcome["value"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=runner, daemon=True, name=f"{threading.current_thread().name}-call").start()
+    while not done.wait(POLL_INTERVAL):
+        token.raise_if_cancelled()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
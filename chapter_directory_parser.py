@@ -130,3 +130,18 @@ def get_chapter_info_from_blueprint(blueprint_text: str, target_chapter_number:
         "plot_twist_level": "",
         "chapter_summary": ""
     }
+
+
+_ENTRY_HEAD_PATTERN = re.compile(r'^\s*第\s*(\d+)\s*章', re.MULTILINE)
+
+def split_blueprint_entries(blueprint_text: str):
+    """
+    按行首的“第X章”把目录文本切成逐章条目，返回 [(章号, 条目原文), ...]（保持原有顺序）。
+    只匹配行首，条目内容中提到的“第X章”不会被误切。
+    """
+    heads = list(_ENTRY_HEAD_PATTERN.finditer(blueprint_text))
+    entries = []
+    for i, m in enumerate(heads):
+        end = heads[i + 1].start() if i + 1 < len(heads) else len(blueprint_text)
+        entries.append((int(m.group(1)), blueprint_text[m.start():end].strip()))
+    return entries
@@ -0,0 +1,158 @@
+# context_prefetch.py
+# -*- coding: utf-8 -*-
+"""
+下一章上下文的预取缓存：
+定稿第 N 章后，在后台预先计算第 N+1 章草稿所需的近期摘要（一次 LLM 调用）与向量检索结果。
+每项结果按输入哈希（近期章节正文、模型参数、检索参数、向量库文件状态等）作为键存放在对应的槽位中，
+生成草稿时输入未变即直接复用（预取仍在进行时等待其完成），输入已变化则丢弃旧结果重新计算。
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+# 最多保留的槽位数（每个槽位对应 项目/章节/类型）
+MAX_PREFETCH_SLOTS = 32
+
+
+def hash_inputs(*parts: Any) -> str:
+    """把若干输入（字符串、数字、列表、字典等）稳定地哈希为一个键。"""
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, str):
+            part = json.dumps(part, ensure_ascii=False, sort_keys=True, default=str)
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def vector_store_stamp(store_dir: str) -> str:
+    """
+    向量库目录的状态戳（各文件的相对路径、大小、修改时间）。
+    写入、删除、清空、恢复快照都会改变该值；只读检索不会（忽略 SQLite 的共享内存文件）。
+    """
+    if not os.path.isdir(store_dir):
+        return "empty"
+    entries = []
+    for root, _, files in os.walk(store_dir):
+        for name in files:
+            if name.endswith("-shm"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((os.path.relpath(path, store_dir), st.st_size, st.st_mtime_ns))
+    entries.sort()
+    return hash_inputs(entries)
+
+
+class _Entry:
+    def __init__(self, key: str):
+        self.key = key
+        self.future: Future = Future()
+
+
+class PrefetchCache:
+    """按槽位保存最近一次计算（或正在计算）的结果，键不一致时视为过期。"""
+
+    def __init__(self, max_slots: int = MAX_PREFETCH_SLOTS):
+        self.max_slots = max_slots
+        self.lock = threading.Lock()
+        self.slots: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _claim(self, slot: Hashable, key: str) -> _Entry:
+        """在锁内调用：登记一个由调用方负责计算的新条目，替换该槽位的旧条目。"""
+        entry = _Entry(key)
+        self.slots[slot] = entry
+        self.slots.move_to_end(slot)
+        while len(self.slots) > self.max_slots:
+            self.slots.popitem(last=False)
+        return entry
+
+    def _drop(self, slot: Hashable, entry: _Entry):
+        with self.lock:
+            if self.slots.get(slot) is entry:
+                del self.slots[slot]
+
+    def get_or_compute(
+        self,
+        slot: Hashable,
+        key: str,
+        compute: Callable[[], Any],
+        is_valid: Callable[[Any], bool] = bool
+    ) -> Any:
+        """
+        槽位中有相同键的结果时直接返回（正在计算时等待其完成）；
+        否则在当前线程计算并登记。计算失败或结果无效时不保留。
+        """
+        with self.lock:
+            entry = self.slots.get(slot)
+            if entry is not None and entry.key != key:
+                logging.info(f"Prefetched {slot} is stale, discarded.")
+                entry = None
+            owner = entry is None
+            if owner:
+                entry = self._claim(slot, key)
+
+        if not owner:
+            try:
+                value = entry.future.result()
+                if is_valid(value):
+                    self.hits += 1
+                    logging.info(f"Prefetched {slot} reused.")
+                    return value
+            except Exception:
+                pass
+            # 预取失败或结果无效，重新计算
+            with self.lock:
+                entry = self._claim(slot, key)
+
+        self.misses += 1
+        try:
+            value = compute()
+        except BaseException as e:
+            entry.future.set_exception(e)
+            self._drop(slot, entry)
+            raise
+        entry.future.set_result(value)
+        if not is_valid(value):
+            self._drop(slot, entry)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.slots.clear()
+
+
+_cache = PrefetchCache()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_prefetch_cache() -> PrefetchCache:
+    return _cache
+
+
+def submit_prefetch(fn: Callable, *args, **kwargs) -> Future:
+    """在单个后台线程中执行预取任务（多个预取按提交顺序排队），异常只记录日志。"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+    def run():
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            logging.warning(f"Speculative prefetch failed: {e}")
+            return None
+
+    return _executor.submit(run)
@@ -0,0 +1,188 @@
+# draft_candidates.py
+# -*- coding: utf-8 -*-
+"""
+多候选草稿的本地打分与保存：
+同一提示词并发生成的多份草稿，用几项廉价的本地信号打分并排序，不再额外调用模型：
+- 字数：与目标字数 word_number 的接近程度；
+- 重复率：字符 n-gram 的重复比例（模型陷入复读时明显升高）；
+- 要素覆盖：核心人物、关键道具在正文中出现的比例；
+- 摘要相似度：正文与本章目录简述的向量余弦相似度（Embedding 不可用时跳过该项）。
+未提供的信号不参与加权，其余权重按比例放大。排序结果保存在 draft_candidates/chapter_{N}.json，供界面切换采用。
+"""
+import os
+import re
+import json
+import math
+import logging
+import traceback
+from typing import List, Optional
+
+from utils import count_chinese_and_english
+
+CANDIDATES_DIR = "draft_candidates"
+
+# 各项信号的权重
+WEIGHTS = {
+    "length": 0.3,
+    "repetition": 0.25,
+    "coverage": 0.25,
+    "similarity": 0.2,
+}
+# 重复率按该长度的字符 n-gram 统计
+REPETITION_NGRAM = 8
+# 重复率达到该值时重复项得 0 分
+REPETITION_CEILING = 0.25
+# 计算相似度时正文截取的最大字符数（避免超出 Embedding 接口的长度限制）
+SIMILARITY_MAX_CHARS = 4000
+
+
+# ============ 单项信号 ============
+
+def length_score(text: str, word_number: int) -> float:
+    """字数在目标的 90%~130% 之间得满分，过短按比例扣分，过长超出部分线性扣分。"""
+    if word_number <= 0:
+        return 1.0
+    ratio = count_chinese_and_english(text) / word_number
+    if ratio < 0.9:
+        return max(0.0, ratio / 0.9)
+    if ratio > 1.3:
+        return max(0.0, 1.0 - (ratio - 1.3))
+    return 1.0
+
+
+def repetition_rate(text: str, n: int = REPETITION_NGRAM) -> float:
+    """重复出现的 n-gram 占全部 n-gram 的比例（忽略空白）。"""
+    compact = re.sub(r"\s+", "", text)
+    total = len(compact) - n + 1
+    if total <= 0:
+        return 0.0
+    unique = len({compact[i:i + n] for i in range(total)})
+    return 1.0 - unique / total
+
+
+def split_required_terms(text: str) -> List[str]:
+    """把“核心人物/关键道具”输入框中的内容按常见分隔符拆成词条。"""
+    terms = [t.strip() for t in re.split(r"[,，、;；/|\s]+", text or "")]
+    return list(dict.fromkeys(t for t in terms if t))
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def summary_similarities(embedding_adapter, summary: str, texts: List[str]) -> Optional[List[float]]:
+    """各候选与本章简述的余弦相似度；没有简述或 Embedding 调用失败时返回 None。"""
+    if embedding_adapter is None or not summary.strip():
+        return None
+    try:
+        query_vector = embedding_adapter.embed_query(summary)
+        vectors = embedding_adapter.embed_documents([t[:SIMILARITY_MAX_CHARS] for t in texts])
+        if not query_vector or not vectors or len(vectors) != len(texts):
+            return None
+        return [cosine_similarity(query_vector, v) if v else 0.0 for v in vectors]
+    except Exception as e:
+        logging.warning(f"Failed to embed draft candidates, similarity is skipped: {e}")
+        traceback.print_exc()
+        return None
+
+
+# ============ 打分与排序 ============
+
+def score_draft_candidates(
+    texts: List[str],
+    word_number: int,
+    characters_involved: str = "",
+    key_items: str = "",
+    chapter_summary: str = "",
+    embedding_adapter=None
+) -> List[dict]:
+    """
+    对候选草稿打分，按总分从高到低返回：
+    [{"index", "text", "score", "words", "length", "repetition", "coverage", "missing", "similarity"}]
+    空候选排在最后且得 0 分。
+    """
+    required = split_required_terms(characters_involved) + split_required_terms(key_items)
+    valid = [i for i, t in enumerate(texts) if t and t.strip()]
+    similarities = summary_similarities(embedding_adapter, chapter_summary, [texts[i] for i in valid])
+    similarity_of = dict(zip(valid, similarities)) if similarities else {}
+
+    ranked = []
+    for index, text in enumerate(texts):
+        text = text or ""
+        item = {
+            "index": index,
+            "text": text,
+            "score": 0.0,
+            "words": count_chinese_and_english(text),
+            "length": None,
+            "repetition": None,
+            "coverage": None,
+            "missing": [],
+            "similarity": None,
+        }
+        if index in valid:
+            signals = {
+                "length": length_score(text, word_number),
+                "repetition": max(0.0, 1.0 - repetition_rate(text) / REPETITION_CEILING),
+            }
+            item["length"] = signals["length"]
+            item["repetition"] = repetition_rate(text)
+            if required:
+                item["missing"] = [t for t in required if t not in text]
+                signals["coverage"] = item["coverage"] = 1.0 - len(item["missing"]) / len(required)
+            if index in similarity_of:
+                item["similarity"] = similarity_of[index]
+                signals["similarity"] = max(0.0, similarity_of[index])
+            total_weight = sum(WEIGHTS[k] for k in signals)
+            item["score"] = sum(WEIGHTS[k] * v for k, v in signals.items()) / total_weight
+        ranked.append(item)
+    ranked.sort(key=lambda c: (-c["score"], c["index"]))
+    return ranked
+
+
+def describe_candidate(rank: int, candidate: dict) -> str:
+    """一行的打分说明，用于日志与界面。"""
+    parts = [f"#{rank} 得分 {candidate['score']:.2f}", f"字数 {candidate['words']}"]
+    if candidate["repetition"] is not None:
+        parts.append(f"重复率 {candidate['repetition']:.1%}")
+    if candidate["coverage"] is not None:
+        missing = f"（缺少：{'、'.join(candidate['missing'])}）" if candidate["missing"] else ""
+        parts.append(f"要素覆盖 {candidate['coverage']:.0%}{missing}")
+    if candidate["similarity"] is not None:
+        parts.append(f"摘要相似度 {candidate['similarity']:.2f}")
+    return " | ".join(parts)
+
+
+# ============ 保存与读取 ============
+
+def candidates_file(filepath: str, novel_number: int) -> str:
+    return os.path.join(filepath, CANDIDATES_DIR, f"chapter_{novel_number}.json")
+
+
+def save_draft_candidates(filepath: str, novel_number: int, ranked: List[dict]):
+    path = candidates_file(filepath, novel_number)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(ranked, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.warning(f"Failed to save draft candidates for chapter {novel_number}: {e}")
+        traceback.print_exc()
+
+
+def load_draft_candidates(filepath: str, novel_number: int) -> List[dict]:
+    """读取已保存的候选排序，没有时返回空列表。"""
+    path = candidates_file(filepath, novel_number)
+    if not os.path.isfile(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, list) else []
+    except Exception as e:
+        logging.warning(f"Failed to load draft candidates for chapter {novel_number}: {e}")
+        return []
@@ -2,8 +2,9 @@
 # -*- coding: utf-8 -*-
 import logging
 import requests
+import threading
 import traceback
-from typing import List
+from typing import Dict, List, Optional
 from langchain_openai import OpenAIEmbeddings, AzureOpenAIEmbeddings
 
 def ensure_openai_base_url_has_v1(url: str) -> str:
@@ -23,6 +24,9 @@ class BaseEmbeddingAdapter:
     """
     Embedding 接口统一基类
     """
+    # 模型指纹（接口格式:模型名），由工厂函数设置，写入向量库集合元数据用于识别换模型
+    fingerprint: str = ""
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         raise NotImplementedError
 
@@ -187,6 +191,42 @@ class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
             logging.error(f"Gemini embed_content parse error: {e}\n{traceback.format_exc()}")
             return []
 
+class LocalEmbeddingAdapter(BaseEmbeddingAdapter):
+    """
+    本地 sentence_transformers 模型（输出已归一化）。
+    模型名与切分模型相同时直接复用切分模型实例，切分阶段合成的分段向量也可直接写入向量库，
+    不必再编码一遍。
+    """
+    def __init__(self, model_name: str):
+        from text_splitter import SPLITTER_MODEL_NAME
+        self.model_name = model_name.strip() or SPLITTER_MODEL_NAME
+        self.shares_splitter_model = self.model_name == SPLITTER_MODEL_NAME
+        self._model = None
+
+    def _get_model(self):
+        if self.shares_splitter_model:
+            from text_splitter import get_splitter_model
+            return get_splitter_model()
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        from text_splitter import normalize_embeddings
+        if not texts:
+            return []
+        try:
+            vectors = self._get_model().encode(list(texts), convert_to_numpy=True)
+            return normalize_embeddings(vectors).tolist()
+        except Exception as e:
+            logging.error(f"Local embedding error: {e}\n{traceback.format_exc()}")
+            return []
+
+    def embed_query(self, query: str) -> List[float]:
+        vectors = self.embed_documents([query])
+        return vectors[0] if vectors else []
+
 def create_embedding_adapter(
     interface_format: str,
     api_key: str,
@@ -198,14 +238,46 @@ def create_embedding_adapter(
     """
     fmt = interface_format.strip().lower()
     if fmt == "openai":
-        return OpenAIEmbeddingAdapter(api_key, base_url, model_name)
+        adapter = OpenAIEmbeddingAdapter(api_key, base_url, model_name)
     elif fmt == "azure openai":
-        return AzureOpenAIEmbeddingAdapter(api_key, base_url, model_name)
+        adapter = AzureOpenAIEmbeddingAdapter(api_key, base_url, model_name)
     elif fmt == "ollama":
-        return OllamaEmbeddingAdapter(model_name, base_url)
+        adapter = OllamaEmbeddingAdapter(model_name, base_url)
     elif fmt == "ml studio":
-        return MLStudioEmbeddingAdapter(api_key, base_url, model_name)
+        adapter = MLStudioEmbeddingAdapter(api_key, base_url, model_name)
     elif fmt == "gemini":
-        return GeminiEmbeddingAdapter(api_key, model_name, base_url)
+        adapter = GeminiEmbeddingAdapter(api_key, model_name, base_url)
+    elif fmt == "local":
+        adapter = LocalEmbeddingAdapter(model_name)
     else:
         raise ValueError(f"Unknown embedding interface_format: {interface_format}")
+    adapter.fingerprint = get_embedding_fingerprint(interface_format, model_name)
+    with _registry_lock:
+        _adapters_by_fingerprint[adapter.fingerprint] = adapter
+    return adapter
+
+# 本次运行中创建过的适配器（按模型指纹）；更换模型后重建索引期间，用原模型的适配器查询旧集合
+_adapters_by_fingerprint: Dict[str, BaseEmbeddingAdapter] = {}
+_registry_lock = threading.Lock()
+
+def get_adapter_for_fingerprint(fingerprint: str) -> Optional[BaseEmbeddingAdapter]:
+    """
+    返回能生成与该指纹相同向量空间的适配器：优先取本次运行中创建过的适配器，
+    本地模型不需要密钥，可直接创建；都不满足时返回 None。
+    """
+    if not fingerprint:
+        return None
+    with _registry_lock:
+        adapter = _adapters_by_fingerprint.get(fingerprint)
+    if adapter is not None:
+        return adapter
+    interface_format, _, model_name = fingerprint.partition(":")
+    if interface_format == "local":
+        return create_embedding_adapter("local", "", "", model_name)
+    return None
+
+def get_embedding_fingerprint(interface_format: str, model_name: str) -> str:
+    """
+    生成 Embedding 模型指纹：接口格式与模型名决定向量空间，二者任一变化都需要重建索引。
+    """
+    return f"{interface_format.strip().lower()}:{model_name.strip()}"
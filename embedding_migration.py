@@ -0,0 +1,226 @@
+# embedding_migration.py
+# -*- coding: utf-8 -*-
+"""
+更换 Embedding 模型后的后台重建索引：
+用库中已存的分段文本按批次重新向量化，写入影子集合，完成后整体替换原集合。
+重建期间原集合保持不动；重建中断后再次启动会跳过影子集合中已有的分段继续。
+"""
+import logging
+import threading
+import time
+import traceback
+from typing import Callable, List, Optional
+
+from embedding_adapters import get_adapter_for_fingerprint
+from novel_generator import (
+    call_with_retry,
+    get_shadow_collection_name,
+    get_store_lock,
+    REINDEX_SUFFIX
+)
+from vectorstore_maintenance import (
+    get_chroma_client,
+    list_collection_names,
+    iter_collection_items,
+    normalize_batch_metadatas
+)
+
+# 每个项目同一时间只允许一个重建任务
+_active_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def find_mismatched_collections(embedding_adapter, filepath: str) -> List[str]:
+    """返回记录的模型指纹与当前 Embedding 配置不一致的集合名（不含影子集合）。"""
+    current = getattr(embedding_adapter, "fingerprint", "")
+    if not current:
+        return []
+    client = get_chroma_client(filepath)
+    mismatched = []
+    for name in list_collection_names(client):
+        if name.endswith(REINDEX_SUFFIX):
+            continue
+        stored = (client.get_collection(name).metadata or {}).get("embedding_fingerprint", "")
+        if stored and stored != current:
+            mismatched.append(name)
+    return mismatched
+
+
+def find_unsearchable_collections(filepath: str, collection_names: List[str]) -> List[str]:
+    """
+    collection_names 中重建完成前无法参与检索的集合：
+    检索时需用原模型生成查询向量，原模型不是本地模型且本次运行中未创建过其适配器时无法做到。
+    """
+    client = get_chroma_client(filepath)
+    unsearchable = []
+    for name in collection_names:
+        stored = (client.get_collection(name).metadata or {}).get("embedding_fingerprint", "")
+        if stored and get_adapter_for_fingerprint(stored) is None:
+            unsearchable.append(name)
+    return unsearchable
+
+
+def reindex_collection(
+    embedding_adapter,
+    filepath: str,
+    collection_name: str,
+    batch_size: int = 64,
+    throttle_seconds: float = 0.5,
+    progress_callback: Optional[Callable[[str], None]] = None
+) -> bool:
+    """
+    用当前 embedding_adapter 重建单个集合：
+      1. 创建（或续用）带新模型指纹的影子集合；
+      2. 分批读取原集合的分段文本重新向量化写入影子集合，每批之间休眠 throttle_seconds 以限速；
+      3. 再补一轮重建期间原集合新增的分段；
+      4. 持有向量库锁：补齐最后新增的分段、删除原集合中已不存在的分段，
+         再重命名替换：原集合 -> __old，影子集合 -> 原名，然后删除 __old。
+    任一批向量化失败则中止，原集合保持可用；改名失败时原集合改回原名。
+    """
+    fingerprint = embedding_adapter.fingerprint
+    client = get_chroma_client(filepath)
+    source = client.get_collection(collection_name)
+    shadow_name = get_shadow_collection_name(collection_name)
+
+    shadow = None
+    if shadow_name in list_collection_names(client):
+        shadow = client.get_collection(shadow_name)
+        if (shadow.metadata or {}).get("embedding_fingerprint") != fingerprint:
+            # 上次未完成的重建用的是另一个模型，不能续用
+            client.delete_collection(shadow_name)
+            shadow = None
+    if shadow is None:
+        shadow = client.create_collection(
+            name=shadow_name,
+            metadata={"embedding_fingerprint": fingerprint},
+            embedding_function=None
+        )
+
+    done_ids = set()
+    for item_id, _, _, _ in iter_collection_items(shadow, include_embeddings=False):
+        done_ids.add(item_id)
+
+    def report(message: str):
+        logging.info(message)
+        if progress_callback:
+            progress_callback(message)
+
+    def copy_pass() -> bool:
+        batch = []
+        for item in iter_collection_items(source, include_embeddings=False):
+            if item[0] in done_ids:
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                if not flush(batch):
+                    return False
+                batch = []
+        return flush(batch)
+
+    def flush(batch) -> bool:
+        if not batch:
+            return True
+        ids = [b[0] for b in batch]
+        texts = [b[1] for b in batch]
+        vectors = call_with_retry(
+            func=embedding_adapter.embed_documents,
+            max_retries=3,
+            fallback_return=[],
+            texts=texts
+        )
+        if len(vectors) != len(texts) or any(not v for v in vectors):
+            logging.warning(f"Re-index of '{collection_name}' aborted: embedding failed for a batch of {len(texts)}.")
+            return False
+        shadow.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=texts,
+            metadatas=normalize_batch_metadatas([b[2] for b in batch])
+        )
+        done_ids.update(ids)
+        report(f"[Re-index] {collection_name}: {len(done_ids)}/{source.count()} segments re-embedded.")
+        if throttle_seconds > 0:
+            time.sleep(throttle_seconds)
+        return True
+
+    report(f"[Re-index] Start re-indexing '{collection_name}' with '{fingerprint}'.")
+    # 第二轮补上重建期间写入原集合的分段
+    if not copy_pass() or not copy_pass():
+        return False
+
+    old_name = collection_name + "__old"
+    with get_store_lock(filepath):
+        # 锁内不会再有本进程的写入与打开：补上最后新增的分段，并去掉重建期间从原集合删除的分段
+        if not copy_pass():
+            return False
+        source_ids = {item[0] for item in iter_collection_items(source, include_embeddings=False)}
+        removed = [i for i in done_ids if i not in source_ids]
+        if removed:
+            shadow.delete(ids=removed)
+            done_ids.difference_update(removed)
+            logging.info(f"[Re-index] {len(removed)} segments deleted from '{collection_name}' during re-index dropped.")
+
+        if old_name in list_collection_names(client):
+            client.delete_collection(old_name)
+        source.modify(name=old_name)
+        try:
+            shadow.modify(name=collection_name)
+        except Exception as e:
+            logging.error(f"[Re-index] Failed to switch '{collection_name}', restoring the original collection: {e}")
+            traceback.print_exc()
+            try:
+                # 其他进程在改名间隙新建的空集合会占用原名，先删除再改回
+                if collection_name in list_collection_names(client) and \
+                        client.get_collection(collection_name).count() == 0:
+                    client.delete_collection(collection_name)
+                source.modify(name=collection_name)
+            except Exception as restore_error:
+                logging.error(
+                    f"[Re-index] Failed to restore '{collection_name}', the data is kept in '{old_name}': {restore_error}"
+                )
+                traceback.print_exc()
+            return False
+        client.delete_collection(old_name)
+    report(f"[Re-index] '{collection_name}' switched to '{fingerprint}'.")
+    return True
+
+
+def start_background_reindex(
+    embedding_adapter,
+    filepath: str,
+    collection_names: Optional[List[str]] = None,
+    progress_callback: Optional[Callable[[str], None]] = None,
+    on_done: Optional[Callable[[bool], None]] = None,
+    **kwargs
+) -> Optional[threading.Thread]:
+    """
+    在后台线程中依次重建 collection_names（为空时重建所有模型不一致的集合）。
+    同一项目已有重建任务在运行时返回 None。on_done(success) 在任务结束时调用。
+    """
+    with _jobs_lock:
+        running = _active_jobs.get(filepath)
+        if running and running.is_alive():
+            logging.info("A re-index job is already running for this project.")
+            return None
+
+        def job():
+            success = False
+            try:
+                names = collection_names or find_mismatched_collections(embedding_adapter, filepath)
+                success = all(
+                    reindex_collection(embedding_adapter, filepath, name, progress_callback=progress_callback, **kwargs)
+                    for name in names
+                )
+            except Exception as e:
+                logging.error(f"Re-index job failed: {e}")
+                traceback.print_exc()
+            finally:
+                with _jobs_lock:
+                    _active_jobs.pop(filepath, None)
+                if on_done:
+                    on_done(success)
+
+        thread = threading.Thread(target=job, daemon=True)
+        _active_jobs[filepath] = thread
+        thread.start()
+        return thread
@@ -0,0 +1,167 @@
+# finalize_parts.py
+# -*- coding: utf-8 -*-
+"""
+定稿各部分（全局摘要、角色状态、向量准备）的并发执行与结果收集：
+各部分共用一个截止时间，到期或被取消时通过子令牌停止仍在进行的模型调用，
+再把每个部分归纳为“是否可提交”与未提交的原因，供定稿提交与界面提示使用。
+批量生成时每个部分提交后记入断点文件，中断后重跑同一章的定稿只执行尚未提交的部分，
+摘要与角色状态不会被同一章重复更新。
+"""
+import os
+import json
+import logging
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from cancellation import CancelToken, OperationCancelled
+
+# 定稿的三个部分及其在界面中的名称
+FINALIZE_PARTS = {"summary": "全局摘要", "character_state": "角色状态", "vectors": "向量库"}
+# 部分未提交的原因
+FINALIZE_ERROR_TIMEOUT = "timeout"
+FINALIZE_ERROR_FAILED = "failed"
+FINALIZE_ERROR_ABORTED = "aborted"
+FINALIZE_ERROR_EMPTY_CHAPTER = "empty chapter"
+_FINALIZE_ERROR_TEXT = {
+    FINALIZE_ERROR_TIMEOUT: "超过截止时间",
+    FINALIZE_ERROR_FAILED: "生成或写入失败",
+    FINALIZE_ERROR_ABORTED: "其他部分失败，整体未提交",
+    FINALIZE_ERROR_EMPTY_CHAPTER: "章节内容为空",
+}
+# 等待期间检查取消的间隔（秒）
+POLL_INTERVAL = 0.5
+# 各章已提交部分的断点文件（位于小说保存路径下）
+CHECKPOINT_FILE_NAME = "finalize_checkpoint.json"
+_checkpoint_lock = threading.Lock()
+
+
+# ============ 并发执行与结果归纳 ============
+
+def run_parts_until_deadline(
+    parts: Dict[str, Callable[[], Any]],
+    part_token: CancelToken,
+    cancel_token: Optional[CancelToken] = None
+) -> Dict[str, Future]:
+    """
+    并发执行各部分，等到全部完成、part_token 到期或 cancel_token 被取消为止。
+    仍未完成的部分通过 part_token 取消（其模型调用随即停止），不再等待，返回各部分的 Future。
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, len(parts)), thread_name_prefix="finalize")
+    futures = {name: executor.submit(func) for name, func in parts.items()}
+    while not (cancel_token is not None and cancel_token.cancelled):
+        left = part_token.remaining()
+        if left is not None and left <= 0:
+            break
+        _, not_done = wait(list(futures.values()), timeout=POLL_INTERVAL if left is None else min(left, POLL_INTERVAL))
+        if not not_done:
+            break
+    if not all(f.done() for f in futures.values()):
+        reason = cancel_token.reason if cancel_token is not None and cancel_token.cancelled else "finalize deadline exceeded"
+        part_token.cancel(reason)
+    executor.shutdown(wait=False)
+    return futures
+
+
+def collect_part_results(
+    futures: Dict[str, Future],
+    allow_empty: Iterable[str] = ()
+) -> Tuple[Dict[str, Any], Dict[str, bool], Dict[str, str]]:
+    """
+    归纳各部分的结果，返回 (结果, 是否可提交, 未提交原因)。
+    未完成的部分记为超时；抛出异常或结果为空的部分记为失败（allow_empty 中的部分只要求没有异常）。
+    """
+    allow_empty = set(allow_empty)
+    results, ok, errors = {}, {}, {}
+    for name, future in futures.items():
+        if not future.done():
+            logging.warning(f"Finalize part '{name}' missed the deadline.")
+            ok[name] = False
+            errors[name] = FINALIZE_ERROR_TIMEOUT
+            continue
+        error = future.exception()
+        if isinstance(error, OperationCancelled):
+            # 截止时间到达后被子令牌中止的调用
+            logging.warning(f"Finalize part '{name}' was stopped at the deadline.")
+            results[name] = None
+            ok[name] = False
+            errors[name] = FINALIZE_ERROR_TIMEOUT
+            continue
+        if error is not None:
+            logging.warning(f"Finalize part '{name}' failed: {error}")
+            traceback.print_exception(type(error), error, error.__traceback__)
+            results[name] = None
+            ok[name] = False
+        else:
+            results[name] = future.result()
+            if name in allow_empty:
+                ok[name] = True
+            else:
+                ok[name] = bool(results[name] and str(results[name]).strip())
+        if not ok[name]:
+            errors[name] = FINALIZE_ERROR_FAILED
+    return results, ok, errors
+
+
+# ============ 已提交部分的断点 ============
+
+def _checkpoint_path(filepath: str) -> str:
+    return os.path.join(filepath, CHECKPOINT_FILE_NAME)
+
+
+def _load_checkpoint(filepath: str) -> Dict[str, List[str]]:
+    path = _checkpoint_path(filepath)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Failed to read finalize checkpoint, all parts will run again: {e}")
+        return {}
+
+
+def _save_checkpoint(filepath: str, data: Dict[str, List[str]]):
+    path = _checkpoint_path(filepath)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_committed_parts(filepath: str, chapter: int) -> List[str]:
+    """第 chapter 章已提交的部分（此前中断的定稿留下的断点）。"""
+    with _checkpoint_lock:
+        return list(_load_checkpoint(filepath).get(str(chapter), []))
+
+
+def mark_part_committed(filepath: str, chapter: int, part: str):
+    """某部分写入完成后立即调用，重跑时跳过该部分。"""
+    with _checkpoint_lock:
+        data = _load_checkpoint(filepath)
+        parts = data.setdefault(str(chapter), [])
+        if part not in parts:
+            parts.append(part)
+            _save_checkpoint(filepath, data)
+
+
+def clear_committed_parts(filepath: str, chapters: Iterable[int]):
+    """清除指定章节的断点（重新定稿这些章节之前调用）。"""
+    with _checkpoint_lock:
+        data = _load_checkpoint(filepath)
+        removed = [data.pop(str(c)) for c in chapters if str(c) in data]
+        if removed:
+            _save_checkpoint(filepath, data)
+
+
+def describe_finalize_status(status: dict) -> List[str]:
+    """未提交部分的说明（每部分一行），全部提交时返回空列表。"""
+    errors = status.get("errors", {})
+    return [
+        f"{label}未更新（{_FINALIZE_ERROR_TEXT.get(errors.get(name), '未完成')}）"
+        for name, label in FINALIZE_PARTS.items() if not status.get(name)
+    ]
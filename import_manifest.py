@@ -0,0 +1,175 @@
+# import_manifest.py
+# -*- coding: utf-8 -*-
+"""
+知识库导入清单：记录每个已导入文件的内容哈希、大小、写入的分段 id 与 Embedding 模型指纹。
+- 文件未变化（或相同内容已从其他路径导入过）时直接跳过；
+- 文件变化时重新切分，分段 id 由文件与分段内容决定，未变的分段不再写入，只写入新增分段并删除已不存在的旧分段。
+清单保存在向量库目录下，随向量库一起清空、快照和恢复。
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import traceback
+from typing import Dict, List, Optional, Set, Tuple
+
+MANIFEST_FILE_NAME = "import_manifest.json"
+
+# 导入计划
+PLAN_SKIP = "skip"
+PLAN_NEW = "new"
+PLAN_CHANGED = "changed"
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """流式计算文件内容的 sha256。"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def normalize_file_key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def make_segment_id(file_key: str, text: str, occurrence: int = 0) -> str:
+    """
+    由文件与分段内容生成确定性的分段 id，同一文件中重复出现的相同分段用 occurrence 区分。
+    文件修改后未变的分段 id 不变，可据此只写入差异部分。
+    """
+    raw = f"{file_key}\0{occurrence}\0{text}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+
+class ImportManifest:
+    """单个向量库目录下的导入清单，条目按 (集合, 文件) 区分。"""
+
+    def __init__(self, store_dir: str):
+        self.path = os.path.join(store_dir, MANIFEST_FILE_NAME)
+        self.entries: Dict[str, dict] = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f).get("files", {})
+            except Exception as e:
+                logging.warning(f"Failed to load import manifest, starting empty: {e}")
+                self.entries = {}
+
+    @staticmethod
+    def _key(collection_name: str, file_key: str) -> str:
+        return f"{collection_name}|{file_key}"
+
+    def get(self, collection_name: str, file_key: str) -> Optional[dict]:
+        return self.entries.get(self._key(collection_name, file_key))
+
+    def find_by_hash(self, collection_name: str, sha256: str, fingerprint: str) -> Optional[dict]:
+        """查找同一集合中内容相同、模型一致的已导入文件。"""
+        for entry in self.entries.values():
+            if (entry.get("collection") == collection_name and entry.get("sha256") == sha256
+                    and entry.get("fingerprint") == fingerprint):
+                return entry
+        return None
+
+    def plan(self, collection_name: str, path: str, fingerprint: str) -> Tuple[str, Optional[dict], str]:
+        """
+        决定文件的导入方式，返回 (计划, 旧条目, 内容哈希)。
+        大小与修改时间都未变时不计算哈希，直接跳过。
+        """
+        file_key = normalize_file_key(path)
+        entry = self.get(collection_name, file_key)
+        stat = os.stat(path)
+        if (entry and entry.get("fingerprint") == fingerprint and entry.get("size") == stat.st_size
+                and entry.get("mtime_ns") == stat.st_mtime_ns):
+            return PLAN_SKIP, entry, entry.get("sha256", "")
+
+        sha256 = file_sha256(path)
+        if entry and entry.get("sha256") == sha256 and entry.get("fingerprint") == fingerprint:
+            # 内容未变，仅修改时间变化
+            entry["mtime_ns"] = stat.st_mtime_ns
+            return PLAN_SKIP, entry, sha256
+        if not entry:
+            same = self.find_by_hash(collection_name, sha256, fingerprint)
+            if same:
+                logging.info(f"'{path}' has the same content as already imported '{same.get('file')}', skipped.")
+                return PLAN_SKIP, same, sha256
+            return PLAN_NEW, None, sha256
+        return PLAN_CHANGED, entry, sha256
+
+    def record(
+        self,
+        collection_name: str,
+        path: str,
+        sha256: str,
+        fingerprint: str,
+        segment_ids: List[str]
+    ):
+        stat = os.stat(path)
+        file_key = normalize_file_key(path)
+        self.entries[self._key(collection_name, file_key)] = {
+            "file": file_key,
+            "collection": collection_name,
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "fingerprint": fingerprint,
+            "segment_ids": segment_ids,
+            "imported_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def remove_collection(self, collection_name: str):
+        self.entries = {k: v for k, v in self.entries.items() if v.get("collection") != collection_name}
+
+    def collection_entries(self, collection_name: str) -> List[dict]:
+        return [v for v in self.entries.values() if v.get("collection") == collection_name]
+
+    def merge_entries(self, collection_name: str, entries: List[dict]) -> int:
+        """并入其他向量库导出的条目（本地已有的同一文件条目优先），返回并入的条数。"""
+        merged = 0
+        for entry in entries:
+            file_key = entry.get("file")
+            if not file_key or self.get(collection_name, file_key):
+                continue
+            self.entries[self._key(collection_name, file_key)] = {**entry, "collection": collection_name}
+            merged += 1
+        return merged
+
+    def prune_segment_ids(self, collection_name: str, existing_ids: Set[str]) -> int:
+        """
+        集合内容被导入/压缩等操作改变后，从该集合的条目中去掉已不在集合中的分段 id，返回去掉的条数。
+        """
+        pruned = 0
+        for entry in self.collection_entries(collection_name):
+            ids = entry.get("segment_ids", [])
+            kept = [i for i in ids if i in existing_ids]
+            if len(kept) != len(ids):
+                pruned += len(ids) - len(kept)
+                entry["segment_ids"] = kept
+        return pruned
+
+    def save(self):
+        """原子写入清单文件。"""
+        if not os.path.isdir(os.path.dirname(self.path)):
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "files": self.entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.warning(f"Failed to save import manifest: {e}")
+            traceback.print_exc()
+
+
+def remove_manifest_collection(store_dir: str, collection_name: str):
+    """集合被删除后，清除清单中该集合的条目，之后重新导入不会被误判为已导入。"""
+    if not os.path.isfile(os.path.join(store_dir, MANIFEST_FILE_NAME)):
+        return
+    manifest = ImportManifest(store_dir)
+    manifest.remove_collection(collection_name)
+    manifest.save()
@@ -0,0 +1,552 @@
+# job_queue.py
+# -*- coding: utf-8 -*-
+"""
+多项目共享的任务队列：多个小说项目把阶段任务（架构与目录、逐章 草稿/扩写/定稿）提交到同一个
+SQLite 队列（默认位于 ~/.ai_novel_generator/jobs.db，可用 --queue-dir 或环境变量 NOVEL_JOB_QUEUE_DIR 指定），
+由一个或多个 worker 进程中的线程池执行：
+- 同一项目的任务按提交顺序串行（后一章依赖前一章定稿），同一时间每个项目最多运行一个任务；
+- 不同项目的任务并行，先按优先级、同一优先级内按“最久未被调度的项目优先”轮转，避免单个项目占满 worker；
+- 模型调用经过跨进程共享的令牌桶（按服务商与模型区分的每分钟请求数），吞吐由服务商配额而不是打开的窗口数决定；
+- 任务执行沿用 batch_cli 的节点与 pipeline_journal.jsonl，worker 崩溃后租约过期的任务会被重新排队并从断点继续。
+
+用法：
+    python job_queue.py submit --config novelA.json --start 1 --end 50 --setup --priority 1
+    python job_queue.py worker --workers 6 --rpm 60 --provider-rpm deepseek=30
+    python job_queue.py status
+    python job_queue.py retry --project /path/to/novelA
+    python job_queue.py cancel --project /path/to/novelA
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import argparse
+import threading
+import traceback
+from contextlib import closing
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+QUEUE_DB_NAME = "jobs.db"
+# 租约时长（秒）：运行中的任务定期续约，worker 崩溃后超过该时间即重新排队
+LEASE_SECONDS = 120
+# 项目被其他进程（如 batch_cli）占用时，任务延后多久再尝试
+BUSY_RETRY_SECONDS = 60
+# 没有可执行任务时的轮询间隔
+POLL_SECONDS = 3
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+KIND_SETUP = "setup"
+KIND_CHAPTER = "chapter"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    chapter INTEGER,
+    config_path TEXT NOT NULL,
+    options TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    depends_on INTEGER,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    not_before REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE TABLE IF NOT EXISTS project_shares (
+    project TEXT PRIMARY KEY,
+    last_started REAL NOT NULL DEFAULT 0,
+    served INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+def default_queue_dir() -> str:
+    return os.environ.get("NOVEL_JOB_QUEUE_DIR") or os.path.join(os.path.expanduser("~"), ".ai_novel_generator")
+
+
+def normalize_project(filepath: str) -> str:
+    return os.path.normcase(os.path.abspath(filepath))
+
+
+class JobQueue:
+    """SQLite 任务队列。每次操作使用独立连接，可在多线程、多进程中同时使用。"""
+
+    def __init__(self, queue_dir: Optional[str] = None):
+        self.queue_dir = queue_dir or default_queue_dir()
+        os.makedirs(self.queue_dir, exist_ok=True)
+        self.path = os.path.join(self.queue_dir, QUEUE_DB_NAME)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # ---------- 提交 ----------
+
+    def submit_project(
+        self,
+        config_path: str,
+        project: str,
+        start: int,
+        end: int,
+        setup: bool = False,
+        priority: int = 0,
+        options: Optional[dict] = None
+    ) -> List[int]:
+        """
+        提交一个项目的任务链：（架构与目录 ->）第 start 章 -> ... -> 第 end 章。
+        链的第一个任务接在该项目尚未结束的最后一个任务之后，返回新任务 id。
+        """
+        options_json = json.dumps(options or {}, ensure_ascii=False)
+        config_path = os.path.abspath(config_path)
+        now = time.time()
+        ids = []
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE project=? AND status IN (?, ?) ORDER BY id DESC LIMIT 1",
+                (project, STATUS_QUEUED, STATUS_RUNNING)
+            ).fetchone()
+            prev = row["id"] if row else None
+            plan = ([(KIND_SETUP, None)] if setup else []) + [(KIND_CHAPTER, c) for c in range(start, end + 1)]
+            for kind, chapter in plan:
+                cur = conn.execute(
+                    "INSERT INTO jobs (project, kind, chapter, config_path, options, priority, depends_on, status, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (project, kind, chapter, config_path, options_json, priority, prev, STATUS_QUEUED, now)
+                )
+                prev = cur.lastrowid
+                ids.append(prev)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return ids
+
+    # ---------- 调度 ----------
+
+    def claim(self, worker_id: str) -> Optional[sqlite3.Row]:
+        """
+        领取一个可执行的任务：依赖已完成、项目当前没有运行中的任务、未到延后时间的任务中，
+        优先级最高者优先，同优先级内选择最久未被调度的项目。没有可执行任务时返回 None。
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = conn.execute(
+                "UPDATE jobs SET status=?, worker=NULL WHERE status=? AND lease_until < ?",
+                (STATUS_QUEUED, STATUS_RUNNING, now)
+            ).rowcount
+            if expired:
+                logging.warning(f"Requeued {expired} job(s) whose worker stopped renewing the lease.")
+            rows = conn.execute(
+                """
+                SELECT j.*, COALESCE(s.last_started, 0) AS last_started FROM jobs j
+                LEFT JOIN project_shares s ON s.project = j.project
+                WHERE j.status = ? AND j.not_before <= ?
+                  AND (j.depends_on IS NULL OR EXISTS (
+                        SELECT 1 FROM jobs d WHERE d.id = j.depends_on AND d.status = ?))
+                  AND j.project NOT IN (SELECT project FROM jobs WHERE status = ?)
+                ORDER BY j.priority DESC, last_started ASC, j.id ASC
+                LIMIT 1
+                """,
+                (STATUS_QUEUED, now, STATUS_DONE, STATUS_RUNNING)
+            ).fetchall()
+            if not rows:
+                conn.execute("COMMIT")
+                return None
+            job = rows[0]
+            conn.execute(
+                "UPDATE jobs SET status=?, worker=?, lease_until=?, started_at=?, attempts=attempts+1 WHERE id=?",
+                (STATUS_RUNNING, worker_id, now + LEASE_SECONDS, now, job["id"])
+            )
+            conn.execute(
+                "INSERT INTO project_shares (project, last_started, served) VALUES (?, ?, 1)"
+                " ON CONFLICT(project) DO UPDATE SET last_started=excluded.last_started, served=served+1",
+                (job["project"], now)
+            )
+            conn.execute("COMMIT")
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    # 以下三个操作只在任务仍由 worker_id 持有时生效：租约过期后任务可能已被重新领取，
+    # 旧的执行不能再覆盖新执行的状态。返回是否更新成功。
+
+    def renew(self, job_id: int, worker_id: str) -> bool:
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "UPDATE jobs SET lease_until=? WHERE id=? AND worker=? AND status=?",
+                (time.time() + LEASE_SECONDS, job_id, worker_id, STATUS_RUNNING)
+            ).rowcount > 0
+
+    def finish(self, job_id: int, worker_id: str, status: str, error: str = "") -> bool:
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "UPDATE jobs SET status=?, finished_at=?, error=?, worker=NULL, lease_until=NULL"
+                " WHERE id=? AND worker=? AND status=?",
+                (status, time.time(), error, job_id, worker_id, STATUS_RUNNING)
+            ).rowcount > 0
+
+    def postpone(self, job_id: int, worker_id: str, seconds: float, reason: str) -> bool:
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "UPDATE jobs SET status=?, not_before=?, error=?, worker=NULL, lease_until=NULL"
+                " WHERE id=? AND worker=? AND status=?",
+                (STATUS_QUEUED, time.time() + seconds, reason, job_id, worker_id, STATUS_RUNNING)
+            ).rowcount > 0
+
+    # ---------- 管理 ----------
+
+    def retry(self, project: Optional[str] = None) -> int:
+        """把失败的任务重新排队。"""
+        sql = "UPDATE jobs SET status=?, error=NULL, not_before=0 WHERE status=?"
+        params = [STATUS_QUEUED, STATUS_FAILED]
+        if project:
+            sql += " AND project=?"
+            params.append(project)
+        with closing(self._connect()) as conn:
+            return conn.execute(sql, params).rowcount
+
+    def cancel(self, project: Optional[str] = None) -> int:
+        """取消尚未开始的任务（运行中的任务会执行完当前阶段）。"""
+        sql = "UPDATE jobs SET status=?, finished_at=? WHERE status=?"
+        params = [STATUS_CANCELLED, time.time(), STATUS_QUEUED]
+        if project:
+            sql += " AND project=?"
+            params.append(project)
+        with closing(self._connect()) as conn:
+            return conn.execute(sql, params).rowcount
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """各项目按状态统计的任务数。"""
+        result: Dict[str, Dict[str, int]] = {}
+        with closing(self._connect()) as conn:
+            for row in conn.execute("SELECT project, status, COUNT(*) AS n FROM jobs GROUP BY project, status"):
+                result.setdefault(row["project"], {})[row["status"]] = row["n"]
+        return result
+
+    def failed_jobs(self) -> List[sqlite3.Row]:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT * FROM jobs WHERE status=? ORDER BY id", (STATUS_FAILED,)).fetchall()
+
+    # ---------- 速率限制 ----------
+
+    def acquire_rate(self, key: str, rpm: float):
+        """
+        跨进程共享的令牌桶：每分钟最多 rpm 次，允许约 10 秒的突发量。
+        令牌不足时在事务外等待，再重新尝试。
+        """
+        if rpm <= 0:
+            return
+        capacity = max(1.0, rpm / 6.0)
+        rate = rpm / 60.0
+        while True:
+            now = time.time()
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key=?", (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row["tokens"] + (now - row["updated"]) * rate)
+                if tokens >= 1.0:
+                    tokens -= 1.0
+                    wait = 0.0
+                else:
+                    wait = (1.0 - tokens) / rate
+                conn.execute(
+                    "INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET tokens=excluded.tokens, updated=excluded.updated",
+                    (key, tokens, now)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 5.0))
+
+
+# ============ 任务执行 ============
+
+def build_job_nodes(job) -> tuple:
+    """按任务内容构建 batch_cli 的流水线节点，返回 (项目路径, 节点列表, 节点并发数)。"""
+    import batch_cli
+    from config_manager import load_config
+
+    options = json.loads(job["options"])
+    args = SimpleNamespace(
+        filepath=options.get("filepath", ""),
+        word_number=options.get("word_number", 0),
+        blueprint_workers=options.get("blueprint_workers", 4)
+    )
+    rc = batch_cli.build_run_config(load_config(job["config_path"]), args)
+    os.makedirs(os.path.join(rc["filepath"], "chapters"), exist_ok=True)
+    if job["kind"] == KIND_SETUP:
+        nodes = batch_cli.build_setup_nodes(rc)
+    else:
+        nodes = batch_cli.build_chapter_nodes(
+            rc, job["chapter"], job["chapter"],
+            enrich=options.get("enrich", False),
+            enrich_ratio=options.get("enrich_ratio", 0.8),
+            atomic=options.get("atomic", False)
+        )
+    return rc["filepath"], nodes, options.get("node_workers", 2)
+
+
+def describe_job(job) -> str:
+    name = os.path.basename(job["project"].rstrip("\\/")) or job["project"]
+    stage = "setup" if job["kind"] == KIND_SETUP else f"chapter {job['chapter']}"
+    return f"job #{job['id']} [{name}] {stage}"
+
+
+def execute_job(queue: JobQueue, job, worker_id: str):
+    """执行一个任务并记录结果；执行期间定期续约。"""
+    from pipeline_scheduler import PipelineBusyError, run_pipeline
+
+    stop = threading.Event()
+
+    label = describe_job(job)
+
+    def heartbeat():
+        # 单次续约失败（如数据库暂时被锁）只记录日志，继续在下一个周期续约
+        while not stop.wait(LEASE_SECONDS / 3):
+            try:
+                if not queue.renew(job["id"], worker_id):
+                    logging.warning(f"{label}: lease is no longer held by this worker.")
+            except Exception as e:
+                logging.warning(f"{label}: failed to renew the lease: {e}")
+
+    def record(updated: bool):
+        if not updated:
+            logging.warning(f"{label}: lease was lost, the result of this run is not recorded.")
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    logging.info(f"{label}: started (attempt {job['attempts'] + 1}).")
+    try:
+        filepath, nodes, node_workers = build_job_nodes(job)
+        if run_pipeline(filepath, nodes, max_workers=node_workers):
+            record(queue.finish(job["id"], worker_id, STATUS_DONE))
+            logging.info(f"{label}: done.")
+        else:
+            record(queue.finish(job["id"], worker_id, STATUS_FAILED, "pipeline stopped on a failed node"))
+            logging.error(f"{label}: failed.")
+    except PipelineBusyError as e:
+        record(queue.postpone(job["id"], worker_id, BUSY_RETRY_SECONDS, str(e)))
+        logging.warning(f"{label}: project is busy in another process, postponed.")
+    except Exception as e:
+        traceback.print_exc()
+        record(queue.finish(job["id"], worker_id, STATUS_FAILED, str(e)))
+        logging.error(f"{label}: failed: {e}")
+    finally:
+        stop.set()
+
+
+def make_rate_gate(queue: JobQueue, default_rpm: float, provider_rpm: Dict[str, float]) -> Callable:
+    """返回 llm_adapters 的调用闸门：按服务商标识匹配 provider_rpm 中的子串，未匹配时使用 default_rpm。"""
+    from llm_adapters import llm_provider_key
+
+    def gate(adapter):
+        key = llm_provider_key(adapter)
+        rpm = default_rpm
+        for pattern, value in provider_rpm.items():
+            if pattern.lower() in key.lower():
+                rpm = value
+                break
+        queue.acquire_rate(key, rpm)
+
+    return gate
+
+
+def run_workers(
+    queue: JobQueue,
+    workers: int = 4,
+    default_rpm: float = 0,
+    provider_rpm: Optional[Dict[str, float]] = None,
+    exit_when_idle: bool = False
+):
+    """在当前进程中启动 workers 个工作线程，持续领取并执行任务。"""
+    from llm_adapters import set_llm_call_gate
+
+    set_llm_call_gate(make_rate_gate(queue, default_rpm, provider_rpm or {}))
+    stop = threading.Event()
+    busy = [0]
+    busy_lock = threading.Lock()
+
+    def loop(index: int):
+        worker_id = f"{os.getpid()}-{index}-{uuid.uuid4().hex[:6]}"
+        while not stop.is_set():
+            try:
+                job = queue.claim(worker_id)
+            except sqlite3.Error as e:
+                logging.warning(f"Failed to claim a job: {e}")
+                job = None
+            if job is None:
+                with busy_lock:
+                    if exit_when_idle and busy[0] == 0:
+                        stop.set()
+                        break
+                stop.wait(POLL_SECONDS)
+                continue
+            with busy_lock:
+                busy[0] += 1
+            try:
+                execute_job(queue, job, worker_id)
+            finally:
+                with busy_lock:
+                    busy[0] -= 1
+
+    threads = [threading.Thread(target=loop, args=(i,), name=f"job-{i}", daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        logging.warning("Stopping workers; running jobs will be requeued after their lease expires.")
+        stop.set()
+        raise
+    finally:
+        set_llm_call_gate(None)
+
+
+# ============ 命令行 ============
+
+def parse_provider_rpm(values: List[str]) -> Dict[str, float]:
+    result = {}
+    for item in values or []:
+        pattern, _, value = item.partition("=")
+        if not pattern or not value:
+            raise ValueError(f"Invalid --provider-rpm '{item}', expected PATTERN=RPM.")
+        result[pattern.strip()] = float(value)
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="AI_NovelGenerator 多项目任务队列")
+    parser.add_argument("--queue-dir", default="", help="队列数据库所在的共享目录")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_submit = sub.add_parser("submit", help="提交一个项目的章节任务")
+    p_submit.add_argument("--config", default="config.json", help="项目的配置文件（与界面保存的 config.json 相同）")
+    p_submit.add_argument("--start", type=int, required=True)
+    p_submit.add_argument("--end", type=int)
+    p_submit.add_argument("--filepath", default="", help="覆盖配置中的小说保存路径")
+    p_submit.add_argument("--word-number", type=int, default=0)
+    p_submit.add_argument("--setup", action="store_true", help="先补齐缺失的架构与章节目录")
+    p_submit.add_argument("--enrich", action="store_true")
+    p_submit.add_argument("--enrich-ratio", type=float, default=0.8)
+    p_submit.add_argument("--atomic-finalize", action="store_true")
+    p_submit.add_argument("--priority", type=int, default=0, help="数值越大越优先")
+
+    p_worker = sub.add_parser("worker", help="启动 worker 执行队列中的任务")
+    p_worker.add_argument("--workers", type=int, default=4, help="工作线程数（同时处理的项目数上限）")
+    p_worker.add_argument("--rpm", type=float, default=0, help="每个服务商/模型的默认每分钟请求数上限（0 为不限）")
+    p_worker.add_argument("--provider-rpm", action="append", default=[],
+                          help="按服务商单独限速，如 deepseek=30（匹配接口类型、base_url 或模型名的子串），可重复")
+    p_worker.add_argument("--exit-when-idle", action="store_true", help="队列中没有可执行任务时退出")
+
+    sub.add_parser("status", help="查看各项目的任务状态")
+    for name, help_text in (("retry", "重新排队失败的任务"), ("cancel", "取消尚未开始的任务")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--project", default="", help="只处理该项目（小说保存路径），默认全部")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(threadName)s %(message)s",
+                        force=True)
+    queue = JobQueue(args.queue_dir or None)
+
+    if args.command == "submit":
+        import batch_cli
+        from config_manager import load_config
+
+        end = args.end if args.end is not None else args.start
+        if args.start < 1 or end < args.start or not os.path.exists(args.config):
+            logging.error("Invalid chapter range or config file not found.")
+            return batch_cli.EXIT_USAGE
+        try:
+            rc = batch_cli.build_run_config(load_config(args.config), args)
+        except (ValueError, TypeError) as e:
+            logging.error(f"Invalid config: {e}")
+            return batch_cli.EXIT_USAGE
+        options = {
+            "filepath": args.filepath,
+            "word_number": args.word_number,
+            "enrich": args.enrich,
+            "enrich_ratio": args.enrich_ratio,
+            "atomic": args.atomic_finalize
+        }
+        ids = queue.submit_project(
+            args.config, normalize_project(rc["filepath"]), args.start, end,
+            setup=args.setup, priority=args.priority, options=options
+        )
+        logging.info(f"Submitted {len(ids)} job(s) for {rc['filepath']} (#{ids[0]}..#{ids[-1]}).")
+        return 0
+
+    if args.command == "worker":
+        try:
+            provider_rpm = parse_provider_rpm(args.provider_rpm)
+        except ValueError as e:
+            logging.error(str(e))
+            return 2
+        try:
+            run_workers(queue, max(1, args.workers), args.rpm, provider_rpm, args.exit_when_idle)
+        except KeyboardInterrupt:
+            return 130
+        failed = queue.failed_jobs()
+        return 1 if args.exit_when_idle and failed else 0
+
+    if args.command == "status":
+        summary = queue.summary()
+        if not summary:
+            print("Queue is empty.")
+        for project, counts in sorted(summary.items()):
+            detail = ", ".join(f"{k}={v}" for k, v in sorted(counts.items()))
+            print(f"{project}: {detail}")
+        for job in queue.failed_jobs():
+            print(f"  failed {describe_job(job)}: {job['error']}")
+        return 0
+
+    project = normalize_project(args.project) if args.project else None
+    if args.command == "retry":
+        logging.info(f"Requeued {queue.retry(project)} failed job(s).")
+    else:
+        logging.info(f"Cancelled {queue.cancel(project)} queued job(s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,616 @@
+# knowledge_importer.py
+# -*- coding: utf-8 -*-
+"""
+知识库批量导入：流式读取 -> 分块切分 -> 限定批大小写入向量库。
+支持单个文件或整个目录（多文件并行读取，切分与句向量编码在独立进程池中执行，
+写入由单线程串行完成）。导入清单记录已导入文件，重复导入时跳过未变化的文件、只写入变化部分。
+"""
+import os
+import sys
+import argparse
+import logging
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional
+
+from novel_generator import (
+    advanced_split_content,
+    resolve_write_store,
+    call_with_retry,
+    get_vectorstore_dir,
+    can_reuse_splitter_embeddings,
+    add_segments_to_store,
+    open_or_create_store,
+    KNOWLEDGE_COLLECTION
+)
+from segment_dedup import get_signature_index, simhash
+from import_manifest import (
+    ImportManifest,
+    file_sha256,
+    make_segment_id,
+    normalize_file_key,
+    PLAN_NEW,
+    PLAN_CHANGED,
+    PLAN_SKIP
+)
+from embedding_adapters import create_embedding_adapter
+from text_splitter import (
+    get_split_worker_pool,
+    shutdown_split_worker_pool,
+    should_use_split_pool,
+    iter_split_parallel,
+    default_split_workers,
+    split_text_semantic_with_embeddings
+)
+
+# 每次从文件读取的字符数，块尾会回退到最近的换行处，避免把句子切断
+DEFAULT_BLOCK_CHARS = 256 * 1024
+# 单批写入向量库的最大条数，实际取值还会受 Chroma 客户端上限约束
+DEFAULT_BATCH_SIZE = 256
+# 目录导入时允许的文件后缀
+KNOWLEDGE_FILE_EXTENSIONS = (".txt", ".md")
+
+def iter_text_blocks(file_path: str, block_chars: int = DEFAULT_BLOCK_CHARS) -> Iterator[str]:
+    """
+    按块流式读取文本文件，每块在最后一个换行处截断，剩余部分并入下一块。
+    整个文件不会一次性读入内存。
+    """
+    carry = ""
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            chunk = f.read(block_chars)
+            if not chunk:
+                break
+            text = carry + chunk
+            cut = text.rfind("\n")
+            if cut > len(text) // 2:
+                carry = text[cut + 1:]
+                text = text[:cut + 1]
+            else:
+                carry = ""
+            if text.strip():
+                yield text
+    if carry.strip():
+        yield carry
+
+
+def iter_file_segments(
+    file_path: str,
+    block_chars: int = DEFAULT_BLOCK_CHARS,
+    split_func: Callable[[str], List[str]] = advanced_split_content
+) -> Iterator[List[str]]:
+    """逐块切分文件，每次产出一个块对应的分段列表。"""
+    for block in iter_text_blocks(file_path, block_chars):
+        segments = [s for s in split_func(block) if s.strip()]
+        if segments:
+            yield segments
+
+
+def list_knowledge_files(dir_path: str) -> List[str]:
+    """递归列出目录下所有可导入的知识库文件（按路径排序，保证导入顺序稳定）。"""
+    files = []
+    for root, _, names in os.walk(dir_path):
+        for name in names:
+            if name.lower().endswith(KNOWLEDGE_FILE_EXTENSIONS):
+                files.append(os.path.join(root, name))
+    files.sort()
+    return files
+
+
+def _resolve_batch_size(store, batch_size: int) -> int:
+    """批大小不超过 Chroma 客户端允许的上限（不同版本的 chromadb 接口不同）。"""
+    client = getattr(store, "_client", None)
+    limit = None
+    if client is not None:
+        try:
+            if hasattr(client, "get_max_batch_size"):
+                limit = client.get_max_batch_size()
+            elif hasattr(client, "max_batch_size"):
+                limit = client.max_batch_size
+        except Exception:
+            limit = None
+    if limit and limit > 0:
+        return max(1, min(batch_size, int(limit)))
+    return max(1, batch_size)
+
+
+def _existing_ids(store, ids: List[str]) -> set:
+    """ids 中已在集合里的部分（变化的文件在模型变化后重新导入时，会以相同 id 覆盖旧分段）。"""
+    existing = set()
+    for i in range(0, len(ids), 500):
+        existing.update(store._collection.get(ids=ids[i:i + 500], include=[]).get("ids") or [])
+    return existing
+
+
+def _write_batch(store, texts: List[str], ids: List[str], embedding_adapter=None, embeddings=None) -> bool:
+    """
+    以“事务”方式写入一批分段：写入失败时删除本批新建的 id 再抛出，保证重试后不会留下半批数据；
+    写入前已存在的 id 不删除（覆盖失败时旧分段仍然有效）。给出 embeddings 时直接写入切分阶段合成的向量。
+    """
+    existing = _existing_ids(store, ids)
+    try:
+        add_segments_to_store(embedding_adapter, store, texts, ids=ids, embeddings=embeddings)
+        return True
+    except Exception:
+        created = [i for i in ids if i not in existing]
+        try:
+            if created:
+                store.delete(ids=created)
+        except Exception:
+            pass
+        raise
+
+
+class _FileState:
+    """单个文件在本次导入中的状态。"""
+
+    def __init__(self, path: str, plan: str, old_entry: Optional[dict], sha256: str, fingerprint: str):
+        self.path = path
+        self.file_key = normalize_file_key(path)
+        self.sha256 = sha256
+        self.old_ids = set(old_entry.get("segment_ids", [])) if old_entry and plan == PLAN_CHANGED else set()
+        # 模型未变时，旧分段可原样保留；模型变化时全部重写（id 相同，覆盖写入）
+        self.reusable = self.old_ids if old_entry and old_entry.get("fingerprint") == fingerprint else set()
+        self.occurrences: dict = {}
+        self.stored_ids: List[str] = []
+        self.failed = False
+        # 本次为该文件登记到签名索引中的签名，以及开始时撤销的旧分段签名；
+        # 文件未能完整导入时据此恢复签名索引，重试时本文件已写入的分段不会被判为与自身重复
+        self.signatures: List[int] = []
+        self.old_signatures: List[int] = []
+
+    def next_id(self, text: str) -> str:
+        n = self.occurrences.get(text, 0)
+        self.occurrences[text] = n + 1
+        return make_segment_id(self.file_key, text, n)
+
+
+class _BatchWriter:
+    """
+    把上游产出的分段累积成固定大小的批次写入向量库，并统计吞吐。
+    dedup=True 时先过滤与已有分段（含本次导入中更早的分段）近重复的分段；
+    Embedding 与切分共用本地模型时，直接写入上游传来的分段向量。
+    给出 manifest 时，文件导入成功后删除其已不存在的旧分段并更新清单。
+    """
+
+    def __init__(self, embedding_adapter, filepath: str, collection_name: str, batch_size: int,
+                 dedup: bool = True, manifest: Optional[ImportManifest] = None):
+        self.embedding_adapter = embedding_adapter
+        self.fingerprint = getattr(embedding_adapter, "fingerprint", "")
+        self.filepath = filepath
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.manifest = manifest
+        self.reuse_embeddings = can_reuse_splitter_embeddings(embedding_adapter)
+        self.store, self.skip = resolve_write_store(embedding_adapter, filepath, collection_name)
+        if not self.store and not self.skip:
+            # 向量库尚不存在时先建空集合，分段 id 由本模块决定
+            self.store = open_or_create_store(embedding_adapter, filepath, collection_name)
+            self.skip = self.store is None
+        if self.store:
+            self.batch_size = _resolve_batch_size(self.store, batch_size)
+        self.signature_index = get_signature_index(get_vectorstore_dir(filepath)) if dedup else None
+        self.files: dict = {}
+        # 待写入项：(文本, 向量, id, 签名, 文件路径)
+        self.pending: list = []
+        self.written = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.reused = 0
+        self.removed = 0
+        self.skipped_files = 0
+        self.start_time = time.time()
+
+    def begin_file(self, path: str, plan: str = PLAN_NEW, old_entry: Optional[dict] = None, sha256: str = ""):
+        state = _FileState(path, plan, old_entry, sha256, self.fingerprint)
+        self.files[path] = state
+        if state.old_ids and self.signature_index is not None and self.store:
+            # 文件修改后，旧分段的签名先撤销，避免新版本被判为与旧版本重复
+            state.old_signatures = [simhash(doc) for doc in self._get_documents(list(state.old_ids)) if doc]
+            self.signature_index.discard(self.collection_name, state.old_signatures)
+
+    def _get_documents(self, ids: List[str]) -> List[str]:
+        docs = []
+        for i in range(0, len(ids), 500):
+            result = self.store._collection.get(ids=ids[i:i + 500], include=["documents"])
+            docs.extend(result.get("documents") or [])
+        return docs
+
+    def add(self, path: str, segments: List[str], vectors: Optional[list] = None):
+        state = self.files[path]
+        if vectors is None:
+            vectors = [None] * len(segments)
+        ids = [state.next_id(seg) for seg in segments]
+
+        fresh = []
+        reused_sigs = []
+        for i, seg_id in enumerate(ids):
+            if seg_id in state.reusable:
+                # 未变化的分段已在库中，不再写入
+                state.stored_ids.append(seg_id)
+                self.reused += 1
+                if self.signature_index is not None:
+                    reused_sigs.append(simhash(segments[i]))
+            else:
+                fresh.append(i)
+        if self.signature_index is not None:
+            self.signature_index.add_signatures(self.collection_name, reused_sigs)
+            kept, sigs = self.signature_index.filter_indices(self.collection_name, [segments[i] for i in fresh])
+            state.signatures.extend(reused_sigs)
+            state.signatures.extend(sigs)
+            self.duplicates += len(fresh) - len(kept)
+            fresh = [fresh[k] for k in kept]
+        else:
+            sigs = [None] * len(fresh)
+
+        self.pending.extend((segments[i], vectors[i], ids[i], sig, path) for i, sig in zip(fresh, sigs))
+        while len(self.pending) >= self.batch_size:
+            batch = self.pending[:self.batch_size]
+            self.pending = self.pending[self.batch_size:]
+            self._flush(batch)
+
+    def finish_file(self, path: str, ok: bool):
+        """文件读取完毕：写出其剩余分段，成功时删除已不存在的旧分段并记入清单。"""
+        if any(item[4] == path for item in self.pending):
+            batch = self.pending
+            self.pending = []
+            self._flush(batch)
+        state = self.files.pop(path)
+        if not ok or state.failed:
+            logging.warning(f"[Import] '{path}' was not fully imported, it will be retried next time.")
+            self._rollback_signatures(state)
+            return
+        stale = list(state.old_ids - set(state.stored_ids))
+        if stale and self.store:
+            try:
+                for i in range(0, len(stale), 500):
+                    self.store._collection.delete(ids=stale[i:i + 500])
+                self.removed += len(stale)
+            except Exception as e:
+                logging.warning(f"Failed to remove outdated segments of '{path}': {e}")
+                traceback.print_exc()
+                self._rollback_signatures(state)
+                return
+        if self.manifest is not None:
+            self.manifest.record(self.collection_name, path, state.sha256 or file_sha256(path),
+                                 self.fingerprint, state.stored_ids)
+            self.manifest.save()
+
+    def _rollback_signatures(self, state: _FileState):
+        """文件未提交：撤销本次为其登记的签名，恢复开始时撤销的旧分段签名（旧分段仍在库中）。"""
+        if self.signature_index is None:
+            return
+        self.signature_index.discard(self.collection_name, state.signatures)
+        self.signature_index.add_signatures(self.collection_name, state.old_signatures)
+        state.signatures = []
+
+    def abort(self):
+        """导入中断：丢弃尚未写出的分段，进行中的文件按未完成处理（撤销签名、不记入清单），再保存签名索引。"""
+        self.pending = []
+        for path in list(self.files):
+            state = self.files.pop(path)
+            logging.warning(f"[Import] '{path}' was interrupted, it will be retried next time.")
+            self._rollback_signatures(state)
+        self.close()
+
+    def close(self):
+        if self.pending:
+            batch = self.pending
+            self.pending = []
+            self._flush(batch)
+        if self.signature_index is not None:
+            self.signature_index.save()
+
+    def _flush(self, batch: list):
+        texts = [item[0] for item in batch]
+        vectors = [item[1] for item in batch]
+        embeddings = vectors if self.reuse_embeddings and any(v is not None for v in vectors) else None
+        ok = self._write(texts, [item[2] for item in batch], embeddings)
+        for text, _, seg_id, sig, path in batch:
+            state = self.files.get(path)
+            if ok:
+                if state:
+                    state.stored_ids.append(seg_id)
+            elif state:
+                state.failed = True
+        if not ok and self.signature_index is not None:
+            # 未写入的分段撤销签名，以后再次导入时不会被误判为重复
+            self.signature_index.discard(self.collection_name, [item[3] for item in batch if item[3] is not None])
+            for _, _, _, sig, path in batch:
+                state = self.files.get(path)
+                if state and sig is not None and sig in state.signatures:
+                    state.signatures.remove(sig)
+
+    def _write(self, texts: List[str], ids: List[str], embeddings: Optional[list] = None) -> bool:
+        if self.skip or not self.store:
+            # 模型与已有集合不一致，整个导入跳过写入（resolve_write_store 已输出提示）
+            self.failed += len(texts)
+            return False
+        ok = call_with_retry(
+            func=_write_batch,
+            max_retries=3,
+            fallback_return=False,
+            store=self.store,
+            texts=texts,
+            ids=ids,
+            embedding_adapter=self.embedding_adapter,
+            embeddings=embeddings
+        )
+        if not ok:
+            logging.warning(f"Failed to write a batch of {len(texts)} segments, skipped.")
+            self.failed += len(texts)
+            return False
+        self.written += len(texts)
+
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        logging.info(
+            f"[Import] {self.written} segments written "
+            f"({self.written / elapsed:.1f} segments/s)."
+        )
+        return True
+
+    def stats(self, files: int) -> dict:
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        return {
+            "files": files,
+            "skipped_files": self.skipped_files,
+            "segments": self.written,
+            "reused_segments": self.reused,
+            "removed_segments": self.removed,
+            "failed_segments": self.failed,
+            "duplicate_segments": self.duplicates,
+            "seconds": round(elapsed, 2),
+            "segments_per_sec": round(self.written / elapsed, 2)
+        }
+
+
+class _FileDone:
+    """队列中的文件结束标记。"""
+
+    def __init__(self, path: str, ok: bool):
+        self.path = path
+        self.ok = ok
+
+
+def _produce_file_segments(file_path: str, out_queue: "queue.Queue", block_chars: int,
+                           pool=None, max_in_flight: int = 8, with_embeddings: bool = False,
+                           stop_event: Optional[threading.Event] = None):
+    """
+    工作线程：流式切分单个文件，把每块的 (文件, 分段, 分段向量) 放入有界队列，最后放入结束标记。
+    给定 pool 时切分在子进程中完成，本线程只负责读取、提交和转发结果；
+    with_embeddings=False 时分段向量为 None；stop_event 被设置后不再继续读取（文件记为未完成）。
+    """
+    ok = False
+    try:
+        if pool is not None:
+            items = iter_split_parallel(iter_text_blocks(file_path, block_chars), pool,
+                                        max_in_flight=max_in_flight, with_embeddings=with_embeddings)
+        elif with_embeddings:
+            items = (split_text_semantic_with_embeddings(b) for b in iter_text_blocks(file_path, block_chars))
+        else:
+            items = ((segments, None) for segments in iter_file_segments(file_path, block_chars))
+        for segments, vectors in items:
+            if stop_event is not None and stop_event.is_set():
+                return
+            if segments:
+                out_queue.put((file_path, segments, vectors))
+        ok = True
+    except Exception as e:
+        logging.warning(f"知识库文件读取/切分失败: {file_path}: {e}")
+        traceback.print_exc()
+    finally:
+        out_queue.put(_FileDone(file_path, ok))
+
+
+def _total_bytes(paths: List[str]) -> int:
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def _drain_queue(out_queue: "queue.Queue", producers: list):
+    """丢弃队列中的内容，直到所有读取线程结束。"""
+    while not all(f.done() for f in producers):
+        try:
+            out_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+
+
+def import_knowledge_paths(
+    embedding_adapter,
+    file_paths: List[str],
+    filepath: str,
+    collection_name: str = KNOWLEDGE_COLLECTION,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    block_chars: int = DEFAULT_BLOCK_CHARS,
+    max_workers: Optional[int] = None,
+    split_workers: Optional[int] = None,
+    dedup: bool = True,
+    use_manifest: bool = True
+) -> dict:
+    """
+    导入引擎：多个文件由线程池并行读取，文本块交给切分进程池并行切分与编码，
+    分段经有界队列流入写入端，写入端按 batch_size 分批写入向量库。返回导入统计信息。
+    split_workers 为切分进程数（None 取默认值，<=1 或待切分内容不多时在读取线程内切分）；
+    dedup=True 时跳过与知识库已有内容近重复的分段；
+    use_manifest=True 时按导入清单跳过未变化的文件，变化的文件只写入差异分段。
+    """
+    if not file_paths:
+        return {"files": 0, "skipped_files": 0, "segments": 0, "reused_segments": 0, "removed_segments": 0,
+                "failed_segments": 0, "duplicate_segments": 0, "seconds": 0.0, "segments_per_sec": 0.0}
+
+    manifest = ImportManifest(get_vectorstore_dir(filepath)) if use_manifest else None
+    writer = _BatchWriter(embedding_adapter, filepath, collection_name, batch_size, dedup, manifest)
+    if writer.skip:
+        return writer.stats(0)
+
+    plans = {}
+    for path in file_paths:
+        if manifest is None:
+            plans[path] = (PLAN_NEW, None, "")
+            continue
+        plan, entry, sha256 = manifest.plan(collection_name, path, writer.fingerprint)
+        if plan == PLAN_SKIP:
+            writer.skipped_files += 1
+            logging.info(f"[Import] '{path}' unchanged since last import, skipped.")
+        else:
+            plans[path] = (plan, entry, sha256)
+    if manifest is not None:
+        # 仅修改时间变化的文件也记下新的修改时间，下次可直接跳过
+        manifest.save()
+    todo = [p for p in file_paths if p in plans]
+
+    pool = None
+    split_workers = default_split_workers() if split_workers is None else split_workers
+    if todo and should_use_split_pool(_total_bytes(todo), block_chars, split_workers):
+        try:
+            pool = get_split_worker_pool(split_workers)
+        except Exception as e:
+            logging.warning(f"Split worker pool unavailable, splitting in-process: {e}")
+            pool = None
+
+    workers = max_workers or max(1, min(4, len(todo)))
+    # 队列有界：写入端跟不上时，读取端会阻塞，内存占用不会随文件大小增长
+    seg_queue: "queue.Queue" = queue.Queue(maxsize=workers * 4)
+    stop_event = threading.Event()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        producers = []
+        completed = False
+        try:
+            for path in todo:
+                writer.begin_file(path, *plans[path])
+                producers.append(executor.submit(_produce_file_segments, path, seg_queue, block_chars, pool,
+                                                 split_workers * 2, writer.reuse_embeddings, stop_event))
+
+            finished = 0
+            while finished < len(todo):
+                item = seg_queue.get()
+                if isinstance(item, _FileDone):
+                    writer.finish_file(item.path, item.ok)
+                    finished += 1
+                    continue
+                writer.add(*item)
+            writer.close()
+            completed = True
+        finally:
+            if not completed:
+                # 写入端出错或被中断：通知读取线程停止，并清空队列让阻塞在 put 上的线程退出，
+                # 否则线程池退出时会一直等待；进行中的文件撤销签名、不记入清单
+                stop_event.set()
+                _drain_queue(seg_queue, producers)
+                writer.abort()
+
+    stats = writer.stats(len(file_paths))
+    logging.info(
+        f"[Import] Done: {stats['files']} files ({stats['skipped_files']} unchanged), "
+        f"{stats['segments']} segments written in {stats['seconds']}s "
+        f"({stats['segments_per_sec']} segments/s), {stats['reused_segments']} kept, "
+        f"{stats['removed_segments']} outdated removed, {stats['failed_segments']} failed, "
+        f"{stats['duplicate_segments']} near-duplicates skipped."
+    )
+    return stats
+
+
+def import_knowledge_file(
+    embedding_api_key: str,
+    embedding_url: str,
+    embedding_interface_format: str,
+    embedding_model_name: str,
+    file_path: str,
+    filepath: str
+) -> dict:
+    """
+    导入单个知识库文件，或一个目录下的全部 .txt/.md 文件，写入知识库集合。
+    """
+    logging.info(f"开始导入知识库文件: {file_path}, 接口格式: {embedding_interface_format}, 模型: {embedding_model_name}")
+    if not os.path.exists(file_path):
+        logging.warning(f"知识库文件不存在: {file_path}")
+        return {}
+
+    if os.path.isdir(file_path):
+        file_paths = list_knowledge_files(file_path)
+        if not file_paths:
+            logging.warning(f"目录中没有可导入的知识库文件: {file_path}")
+            return {}
+    else:
+        if os.path.getsize(file_path) == 0:
+            logging.warning("知识库文件内容为空。")
+            return {}
+        file_paths = [file_path]
+
+    embedding_adapter = create_embedding_adapter(
+        interface_format=embedding_interface_format,
+        api_key=embedding_api_key,
+        base_url=embedding_url if embedding_url else "http://localhost:11434/api",
+        model_name=embedding_model_name
+    )
+
+    stats = import_knowledge_paths(embedding_adapter, file_paths, filepath)
+    if stats.get("segments"):
+        logging.info("知识库文件已成功导入至向量库。")
+    else:
+        logging.warning("知识库导入失败或无有效内容，跳过。")
+    return stats
+
+
+# ============ 切分吞吐基准 ============
+
+def benchmark_split_workers(
+    file_path: str,
+    worker_counts: List[int],
+    block_chars: int = 64 * 1024
+) -> List[dict]:
+    """
+    用同一文件测量不同切分进程数下的吞吐（只切分，不写入向量库）。
+    每个进程数先用一个块预热（进程启动与模型加载不计入耗时）。
+    """
+    blocks = list(iter_text_blocks(file_path, block_chars))
+    results = []
+    for workers in worker_counts:
+        if workers <= 1:
+            advanced_split_content(blocks[0])
+            start = time.time()
+            segments = sum(len(advanced_split_content(b)) for b in blocks)
+        else:
+            pool = get_split_worker_pool(workers)
+            list(iter_split_parallel(blocks[:workers], pool, max_in_flight=workers))
+            start = time.time()
+            segments = sum(len(s[0]) for s in iter_split_parallel(blocks, pool, max_in_flight=workers * 2))
+        elapsed = max(time.time() - start, 1e-6)
+        result = {
+            "workers": workers,
+            "blocks": len(blocks),
+            "segments": segments,
+            "seconds": round(elapsed, 2),
+            "blocks_per_sec": round(len(blocks) / elapsed, 2)
+        }
+        results.append(result)
+        print(f"workers={workers:<3} blocks={len(blocks):<6} segments={segments:<8} "
+              f"{result['seconds']:>8.2f}s  {result['blocks_per_sec']:>8.2f} blocks/s")
+    if results and results[0]["workers"] <= 1:
+        base = results[0]["seconds"]
+        for r in results[1:]:
+            print(f"speedup x{base / r['seconds']:.2f} with {r['workers']} workers")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="知识库切分进程池吞吐基准")
+    parser.add_argument("file", help="用于测试的文本文件")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="要测试的进程数")
+    parser.add_argument("--block-chars", type=int, default=64 * 1024, help="每个文本块的字符数")
+    args = parser.parse_args()
+    try:
+        benchmark_split_workers(args.file, args.workers, args.block_chars)
+    finally:
+        shutdown_split_worker_pool()
+    sys.exit(0)
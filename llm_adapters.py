@@ -6,6 +6,8 @@ from langchain_openai import ChatOpenAI, AzureChatOpenAI
 from google import genai
 from google.genai import types
 
+from cancellation import CancelToken, OperationCancelled
+
 def ensure_openai_base_url_has_v1(url: str) -> str:
     import re
     url = url.strip()
@@ -16,13 +18,49 @@ def ensure_openai_base_url_has_v1(url: str) -> str:
             url = url.rstrip('/') + '/v1'
     return url
 
+# 每次调用模型前执行的闸门函数 gate(adapter)，用于多个项目共享服务商的速率限制
+_call_gate = None
+
+def set_llm_call_gate(gate):
+    """设置调用闸门（如 job_queue 中跨进程共享的令牌桶），传入 None 取消。"""
+    global _call_gate
+    _call_gate = gate
+
+def llm_provider_key(adapter) -> str:
+    """用于速率限制的服务商标识：接口类型 | base_url | 模型名。"""
+    return f"{type(adapter).__name__}|{getattr(adapter, 'base_url', '')}|{getattr(adapter, 'model_name', '')}"
+
+def wait_llm_call_gate(adapter):
+    gate = _call_gate
+    if gate is not None:
+        gate(adapter)
+
 class BaseLLMAdapter:
     """
     统一的 LLM 接口基类，为不同后端（OpenAI、Ollama、ML Studio、Gemini等）提供一致的方法签名。
+    cancel_token 不为空时改用流式输出，每收到一段检查一次令牌，取消后关闭连接并抛出 OperationCancelled。
     """
+    cancel_token: Optional[CancelToken] = None
+
     def invoke(self, prompt: str) -> str:
         raise NotImplementedError("Subclasses must implement .invoke(prompt) method.")
 
+    def _invoke_client(self, prompt: str):
+        """调用 langchain 聊天模型，返回消息对象（流式时为各段合并后的消息）。"""
+        token = self.cancel_token
+        if token is None:
+            return self._client.invoke(prompt)
+        token.raise_if_cancelled()
+        response = None
+        stream = self._client.stream(prompt)
+        try:
+            for chunk in stream:
+                token.raise_if_cancelled()
+                response = chunk if response is None else response + chunk
+        finally:
+            stream.close()
+        return response
+
 class DeepSeekAdapter(BaseLLMAdapter):
     """
     适配官方/OpenAI兼容接口（使用 langchain.ChatOpenAI）
@@ -45,7 +83,7 @@ class DeepSeekAdapter(BaseLLMAdapter):
         )
 
     def invoke(self, prompt: str) -> str:
-        response = self._client.invoke(prompt)
+        response = self._invoke_client(prompt)
         if not response:
             logging.warning("No response from DeepSeekAdapter.")
             return ""
@@ -73,7 +111,7 @@ class OpenAIAdapter(BaseLLMAdapter):
         )
 
     def invoke(self, prompt: str) -> str:
-        response = self._client.invoke(prompt)
+        response = self._invoke_client(prompt)
         if not response:
             logging.warning("No response from OpenAIAdapter.")
             return ""
@@ -93,20 +131,37 @@ class GeminiAdapter(BaseLLMAdapter):
         self._client = genai.Client(api_key=self.api_key)
 
     def invoke(self, prompt: str) -> str:
+        config = types.GenerateContentConfig(
+            max_output_tokens=self.max_tokens,
+            temperature=self.temperature,
+        )
         try:
+            token = self.cancel_token
+            if token is not None:
+                token.raise_if_cancelled()
+                parts = []
+                for chunk in self._client.models.generate_content_stream(
+                    model=self.model_name, contents=prompt, config=config
+                ):
+                    token.raise_if_cancelled()
+                    if chunk and chunk.text:
+                        parts.append(chunk.text)
+                if parts:
+                    return "".join(parts)
+                logging.warning("No text response from Gemini API.")
+                return ""
             response = self._client.models.generate_content(
                 model = self.model_name,
                 contents = prompt,
-                config = types.GenerateContentConfig(
-                    max_output_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                )
+                config = config
             )
             if response and response.text:
                 return response.text
             else:
                 logging.warning("No text response from Gemini API.")
                 return ""
+        except OperationCancelled:
+            raise
         except Exception as e:
             logging.error(f"Gemini API 调用失败: {e}")
             return ""
@@ -142,7 +197,7 @@ class AzureOpenAIAdapter(BaseLLMAdapter):
         )
 
     def invoke(self, prompt: str) -> str:
-        response = self._client.invoke(prompt)
+        response = self._invoke_client(prompt)
         if not response:
             logging.warning("No response from AzureOpenAIAdapter.")
             return ""
@@ -170,7 +225,7 @@ class OllamaAdapter(BaseLLMAdapter):
         )
 
     def invoke(self, prompt: str) -> str:
-        response = self._client.invoke(prompt)
+        response = self._invoke_client(prompt)
         if not response:
             logging.warning("No response from OllamaAdapter.")
             return ""
@@ -195,7 +250,7 @@ class MLStudioAdapter(BaseLLMAdapter):
         )
 
     def invoke(self, prompt: str) -> str:
-        response = self._client.invoke(prompt)
+        response = self._invoke_client(prompt)
         if not response:
             logging.warning("No response from MLStudioAdapter.")
             return ""
@@ -208,11 +263,26 @@ def create_llm_adapter(
     api_key: str,
     temperature: float,
     max_tokens: int,
-    timeout: int
+    timeout: int,
+    cancel_token: Optional[CancelToken] = None
 ) -> BaseLLMAdapter:
     """
     工厂函数：根据 interface_format 返回不同的适配器实例。
+    cancel_token 会挂在适配器上，用于中途取消（见 cancellation）。
     """
+    adapter = _create_llm_adapter(interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
+    adapter.cancel_token = cancel_token
+    return adapter
+
+def _create_llm_adapter(
+    interface_format: str,
+    base_url: str,
+    model_name: str,
+    api_key: str,
+    temperature: float,
+    max_tokens: int,
+    timeout: int
+) -> BaseLLMAdapter:
     fmt = interface_format.strip().lower()
     if fmt == "deepseek":
         return DeepSeekAdapter(api_key, base_url, model_name, max_tokens, temperature, timeout)
@@ -1,12 +1,22 @@
 # main.py
 # -*- coding: utf-8 -*-
+import multiprocessing
 import customtkinter as ctk
 from ui import NovelGeneratorGUI
+from text_splitter import warm_up_splitter_model, shutdown_split_worker_pool
 
 def main():
+    # 后台预加载切分模型，首次定稿/导入时无需再等待
+    warm_up_splitter_model()
     app = ctk.CTk()
     gui = NovelGeneratorGUI(app)
-    app.mainloop()
+    try:
+        app.mainloop()
+    finally:
+        # 关闭知识库导入时启动的切分子进程
+        shutdown_split_worker_pool()
 
 if __name__ == "__main__":
+    # 打包后的程序以 spawn 方式启动切分子进程时需要
+    multiprocessing.freeze_support()
     main()
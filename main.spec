@@ -26,6 +26,15 @@ datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
 customtkinter_dir = r'c:/Users/xieli/Desktop/AI_NovelGenerator/.venv/Lib/site-packages/customtkinter'
 datas.append((customtkinter_dir, 'customtkinter'))
 
+# 若项目根目录下已准备好 nltk_data（python -c "import text_splitter; text_splitter.provision_nltk_resources()"），
+# 一并打包，离线环境下无需再下载分句数据
+import os
+if os.path.isdir('nltk_data'):
+    datas.append(('nltk_data', 'nltk_data'))
+# 已导出的 ONNX 切分模型（python splitter_onnx.py export）
+if os.path.isdir('onnx_models'):
+    datas.append(('onnx_models', 'onnx_models'))
+
 a = Analysis(
     ['main.py'],
     pathex=[],
@@ -6,20 +6,38 @@ import re
 import time
 import traceback
 import json
+import uuid
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import List, Optional, Tuple
 
 from langchain_chroma import Chroma
 from chromadb.config import Settings
-from langchain.docstore.document import Document
 
-# nltk、sentence_transformers 及文本处理相关
-import nltk
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+# 文本分段
+from text_splitter import split_text_semantic, split_text_semantic_with_embeddings, DEFAULT_SEGMENT_OVERLAP
+from segment_dedup import get_signature_index, invalidate_signature_index
+from import_manifest import remove_manifest_collection
+from step_graph import Step, run_step_graph
+from arc_blueprint import Arc_blueprint_generate, should_use_arc_mode
+from context_prefetch import get_prefetch_cache, hash_inputs, submit_prefetch, vector_store_stamp
+from cancellation import CancelToken, OperationCancelled, check_cancelled, run_cancellable
+from draft_candidates import score_draft_candidates, save_draft_candidates
+from scene_chapter import Scene_chapter_generate, should_use_scene_mode
+from finalize_parts import (
+    FINALIZE_PARTS,
+    FINALIZE_ERROR_FAILED,
+    FINALIZE_ERROR_ABORTED,
+    FINALIZE_ERROR_EMPTY_CHAPTER,
+    run_parts_until_deadline,
+    collect_part_results,
+    load_committed_parts,
+    mark_part_committed
+)
 
 # 工具函数
 from utils import (
-    read_file, append_text_to_file, clear_file_content,
+    read_file, clear_file_content,
     save_string_to_txt
 )
 
@@ -42,31 +60,38 @@ from prompt_definitions import (
 # 章节目录解析
 from chapter_directory_parser import get_chapter_info_from_blueprint
 
-from llm_adapters import create_llm_adapter
-from embedding_adapters import create_embedding_adapter
+from llm_adapters import create_llm_adapter, wait_llm_call_gate
+from embedding_adapters import create_embedding_adapter, get_adapter_for_fingerprint
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
 # ============ 通用的重试封装 ============
 
-def call_with_retry(func, max_retries=3, sleep_time=2, fallback_return=None, **kwargs):
+def call_with_retry(func, max_retries=3, sleep_time=2, fallback_return=None, cancel_token=None, **kwargs):
     """
     通用的重试机制封装。
     :param func: 要执行的函数
     :param max_retries: 最大重试次数
     :param sleep_time: 重试前的等待秒数
     :param fallback_return: 如果多次重试仍失败时的返回值
+    :param cancel_token: 取消令牌，取消后不再重试（重试前的等待也会被提前唤醒）
     :param kwargs: 传给func的命名参数
-    :return: func的结果，若失败则返回 fallback_return
+    :return: func的结果，若失败则返回 fallback_return；被取消时抛出 OperationCancelled
     """
     for attempt in range(1, max_retries + 1):
         try:
             return func(**kwargs)
+        except OperationCancelled:
+            raise
         except Exception as e:
             logging.warning(f"[call_with_retry] Attempt {attempt} failed with error: {e}")
             traceback.print_exc()
             if attempt < max_retries:
-                time.sleep(sleep_time)
+                if cancel_token is not None:
+                    if cancel_token.wait(sleep_time):
+                        cancel_token.raise_if_cancelled()
+                else:
+                    time.sleep(sleep_time)
             else:
                 logging.error("Max retries reached, returning fallback_return.")
                 return fallback_return
@@ -90,11 +115,17 @@ def invoke_with_cleaning(llm_adapter, prompt: str) -> str:
     """
     对 LLM 的调用增加了重试封装，
     如果多次失败，则返回空字符串以继续流程，而不是中断。
+    适配器带有取消令牌时，调用在后台线程中进行，取消后立即抛出 OperationCancelled。
     """
+    token = getattr(llm_adapter, "cancel_token", None)
+
     def _invoke(prompt):
-        return llm_adapter.invoke(prompt)
+        def call():
+            wait_llm_call_gate(llm_adapter)
+            return llm_adapter.invoke(prompt)
+        return run_cancellable(call, token)
 
-    response = call_with_retry(func=_invoke, max_retries=3, fallback_return="", prompt=prompt)
+    response = call_with_retry(func=_invoke, max_retries=3, fallback_return="", cancel_token=token, prompt=prompt)
     if not response:
         logging.warning("No response from model after retry. Return empty.")
         return ""
@@ -109,79 +140,161 @@ def get_vectorstore_dir(filepath: str) -> str:
     return os.path.join(filepath, "vectorstore")
 
 
+# 每个向量库一把进程内的锁：打开集合（不存在时会自动创建）与重建索引时的集合改名互斥，
+# 避免改名间隙中打开集合而新建出同名的空集合
+_store_locks = {}
+_store_locks_guard = threading.Lock()
+
+def get_store_lock(filepath: str) -> threading.RLock:
+    key = os.path.normcase(os.path.abspath(get_vectorstore_dir(filepath)))
+    with _store_locks_guard:
+        lock = _store_locks.get(key)
+        if lock is None:
+            lock = _store_locks[key] = threading.RLock()
+        return lock
+
+
+# ============ 向量库集合划分 ============
+# 章节正文沿用历史集合名 novel_collection，旧项目无需迁移即可继续检索；
+# 导入的知识库文件单独存放。
+
+CHAPTER_COLLECTION = "novel_collection"
+KNOWLEDGE_COLLECTION = "knowledge_collection"
+
+# 更换 Embedding 模型后在后台重建的影子集合后缀，重建完成后替换原集合
+REINDEX_SUFFIX = "__reindex"
+
+def get_shadow_collection_name(collection_name: str) -> str:
+    """返回 collection_name 在重建索引期间使用的影子集合名。"""
+    return collection_name + REINDEX_SUFFIX
+
+# 联合检索的默认权重：知识库略低，避免大段设定资料挤占最近章节的召回
+DEFAULT_CHAPTER_RETRIEVAL_WEIGHT = 1.0
+DEFAULT_KNOWLEDGE_RETRIEVAL_WEIGHT = 0.8
+
+def build_default_retrieval_collections(
+    k: int = 2,
+    knowledge_k: Optional[int] = None,
+    chapter_weight: float = DEFAULT_CHAPTER_RETRIEVAL_WEIGHT,
+    knowledge_weight: float = DEFAULT_KNOWLEDGE_RETRIEVAL_WEIGHT
+) -> List[dict]:
+    """联合检索配置：章节取 k 条，知识库取 knowledge_k 条（默认同 k），按各自权重合并。"""
+    return [
+        {"name": CHAPTER_COLLECTION, "k": k, "weight": chapter_weight},
+        {"name": KNOWLEDGE_COLLECTION, "k": k if knowledge_k is None else knowledge_k, "weight": knowledge_weight},
+    ]
+
+def retrieval_collections_from_config(cfg: dict, k: Optional[int] = None) -> List[dict]:
+    """
+    按配置生成联合检索配置：embedding_retrieval_k 为章节条数（k 不为空时以 k 为准），
+    knowledge_retrieval_k、chapter_retrieval_weight、knowledge_retrieval_weight 未填写（或为空）时使用默认值。
+    """
+    def value(key: str, default):
+        v = cfg.get(key)
+        return default if v is None or v == "" else v
+
+    k = int(value("embedding_retrieval_k", 4)) if k is None else k
+    knowledge_k = value("knowledge_retrieval_k", None)
+    return build_default_retrieval_collections(
+        k,
+        None if knowledge_k is None else int(knowledge_k),
+        float(value("chapter_retrieval_weight", DEFAULT_CHAPTER_RETRIEVAL_WEIGHT)),
+        float(value("knowledge_retrieval_weight", DEFAULT_KNOWLEDGE_RETRIEVAL_WEIGHT))
+    )
+
+
 # ============ 清空向量库 ============
 
-def clear_vector_store(filepath: str) -> bool:
+def clear_vector_store(filepath: str, collection_name: Optional[str] = None) -> bool:
+    """
+    collection_name 为空时删除整个向量库文件夹；
+    否则只删除指定集合，其他集合（如章节/知识库）不受影响。
+    """
     import shutil
     store_dir = get_vectorstore_dir(filepath)
     if not os.path.exists(store_dir):
         logging.info("No vector store found to clear.")
         return False
+
+    if collection_name:
+        try:
+            import chromadb
+            client = chromadb.PersistentClient(
+                path=store_dir,
+                settings=Settings(anonymized_telemetry=False)
+            )
+            client.delete_collection(collection_name)
+            invalidate_signature_index(store_dir, collection_name)
+            remove_manifest_collection(store_dir, collection_name)
+            logging.info(f"Vector store collection '{collection_name}' removed.")
+            return True
+        except Exception as e:
+            logging.warning(f"Failed to remove collection '{collection_name}': {e}")
+            traceback.print_exc()
+            return False
+
+    # 先通过客户端删除全部集合（数据库内的记录与索引文件由 chromadb 自行清理），再删除目录；
+    # 直接删除目录时，仍持有该库的客户端会继续读写已删除的文件
     try:
-        shutil.rmtree(store_dir)
-        logging.info(f"Vector store directory '{store_dir}' removed.")
-        return True
+        import chromadb
+        client = chromadb.PersistentClient(
+            path=store_dir,
+            settings=Settings(anonymized_telemetry=False)
+        )
+        for c in client.list_collections():
+            name = c if isinstance(c, str) else c.name
+            client.delete_collection(name)
+            invalidate_signature_index(store_dir, name)
+            remove_manifest_collection(store_dir, name)
+        logging.info(f"All collections in '{store_dir}' deleted.")
     except Exception as e:
-        logging.error(f"无法删除向量库文件夹，请关闭程序后手动删除 {store_dir}。\n {str(e)}")
+        logging.error(f"无法删除向量库中的集合，请关闭程序后手动删除 {store_dir}。\n {str(e)}")
         traceback.print_exc()
         return False
 
+    try:
+        shutil.rmtree(store_dir)
+        invalidate_signature_index(store_dir)
+        logging.info(f"Vector store directory '{store_dir}' removed.")
+    except Exception as e:
+        # Windows 下文件被占用时无法删除目录；集合已全部删除，残留的文件不影响使用
+        logging.warning(f"Collections are cleared but '{store_dir}' could not be removed: {e}")
+    return True
+
 
 # ============ 根据 embedding 接口创建/加载 Chroma ============
 
-def init_vector_store(
-    embedding_adapter,
-    texts: List[str],
-    filepath: str
-) -> Optional[Chroma]:
+def build_lc_embedding(embedding_adapter):
     """
-    在 filepath 下创建/加载一个 Chroma 向量库并插入 texts。
-    如果Embedding失败，则返回 None，不中断任务。
+    将项目内的 embedding 适配器包装为 langchain 的 Embeddings 接口，
+    调用时带重试，失败返回空向量。
     """
     from langchain.embeddings.base import Embeddings as LCEmbeddings
 
-    store_dir = get_vectorstore_dir(filepath)
-    os.makedirs(store_dir, exist_ok=True)
+    class LCEmbeddingWrapper(LCEmbeddings):
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            return call_with_retry(
+                func=embedding_adapter.embed_documents,
+                max_retries=3,
+                fallback_return=[],
+                texts=texts
+            )
 
-    documents = [Document(page_content=str(t)) for t in texts]
+        def embed_query(self, query: str) -> List[float]:
+            res = call_with_retry(
+                func=embedding_adapter.embed_query,
+                max_retries=3,
+                fallback_return=[],
+                query=query
+            )
+            return res
 
-    try:
-        class LCEmbeddingWrapper(LCEmbeddings):
-            def embed_documents(self, texts: List[str]) -> List[List[float]]:
-                return call_with_retry(
-                    func=embedding_adapter.embed_documents,
-                    max_retries=3,
-                    fallback_return=[],
-                    texts=texts
-                )
-
-            def embed_query(self, query: str) -> List[float]:
-                res = call_with_retry(
-                    func=embedding_adapter.embed_query,
-                    max_retries=3,
-                    fallback_return=[],
-                    query=query
-                )
-                return res
-
-        chroma_embedding = LCEmbeddingWrapper()
-
-        vectorstore = Chroma.from_documents(
-            documents,
-            embedding=chroma_embedding,
-            persist_directory=store_dir,
-            client_settings=Settings(anonymized_telemetry=False),
-            collection_name="novel_collection"
-        )
-        return vectorstore
-    except Exception as e:
-        logging.warning(f"Init vector store failed: {e}")
-        traceback.print_exc()
-        return None
+    return LCEmbeddingWrapper()
 
 def load_vector_store(
     embedding_adapter,
-    filepath: str
+    filepath: str,
+    collection_name: str = CHAPTER_COLLECTION
 ) -> Optional[Chroma]:
     """
     读取已存在的 Chroma 向量库。若不存在则返回 None。
@@ -192,169 +305,355 @@ def load_vector_store(
         logging.info("Vector store not found. Will return None.")
         return None
 
-    from langchain.embeddings.base import Embeddings as LCEmbeddings
-
     try:
-        class LCEmbeddingWrapper(LCEmbeddings):
-            def embed_documents(self, texts: List[str]) -> List[List[float]]:
-                return call_with_retry(
-                    func=embedding_adapter.embed_documents,
-                    max_retries=3,
-                    fallback_return=[],
-                    texts=texts
-                )
-
-            def embed_query(self, query: str) -> List[float]:
-                res = call_with_retry(
-                    func=embedding_adapter.embed_query,
-                    max_retries=3,
-                    fallback_return=[],
-                    query=query
-                )
-                return res
-
-        chroma_embedding = LCEmbeddingWrapper()
-
-        return Chroma(
-            persist_directory=store_dir,
-            embedding_function=chroma_embedding,
-            client_settings=Settings(anonymized_telemetry=False),
-            collection_name="novel_collection"
-        )
+        with get_store_lock(filepath):
+            store = Chroma(
+                persist_directory=store_dir,
+                embedding_function=build_lc_embedding(embedding_adapter),
+                client_settings=Settings(anonymized_telemetry=False),
+                collection_name=collection_name
+            )
+        stamp_embedding_fingerprint(store, embedding_adapter)
+        return store
     except Exception as e:
         logging.warning(f"Failed to load vector store: {e}")
         traceback.print_exc()
         return None
 
 
-# ============ 文本分段工具 ============
+def can_reuse_splitter_embeddings(embedding_adapter) -> bool:
+    """Embedding 适配器与切分使用同一个本地模型时，切分阶段合成的分段向量可直接写入向量库。"""
+    return bool(getattr(embedding_adapter, "shares_splitter_model", False))
+
+def add_segments_to_store(
+    embedding_adapter,
+    store,
+    texts: List[str],
+    ids: Optional[List[str]] = None,
+    embeddings: Optional[list] = None
+) -> List[str]:
+    """
+    写入一批分段并返回其 id（id 已存在时覆盖）。给出 embeddings 时直接写入预先算好的向量，
+    其中为 None 的项再由 embedding_adapter 补算；否则由向量库按 embedding 函数编码。
+    """
+    ids = ids or [str(uuid.uuid4()) for _ in texts]
+    if embeddings is None:
+        store.add_texts(texts=texts, ids=ids)
+        return ids
+
+    vectors = list(embeddings)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        filled = embedding_adapter.embed_documents([texts[i] for i in missing])
+        if len(filled) != len(missing) or any(not v for v in filled):
+            raise ValueError(f"Embedding failed for {len(missing)} segments.")
+        for i, v in zip(missing, filled):
+            vectors[i] = v
+    store._collection.upsert(
+        ids=ids,
+        documents=list(texts),
+        embeddings=[[float(x) for x in v] for v in vectors]
+    )
+    return ids
 
-def split_by_length(text: str, max_length: int = 500) -> List[str]:
-    segments = []
-    start_idx = 0
-    while start_idx < len(text):
-        end_idx = min(start_idx + max_length, len(text))
-        segment = text[start_idx:end_idx]
-        segments.append(segment.strip())
-        start_idx = end_idx
-    return segments
+def open_or_create_store(embedding_adapter, filepath: str, collection_name: str) -> Optional[Chroma]:
+    """打开集合，向量库目录不存在时先创建（不写入任何分段）。"""
+    os.makedirs(get_vectorstore_dir(filepath), exist_ok=True)
+    return load_vector_store(embedding_adapter, filepath, collection_name)
 
-def split_text_for_vectorstore(chapter_text: str,
-                               max_length: int = 500,
-                               similarity_threshold: float = 0.7) -> List[str]:
+
+# ============ Embedding 模型指纹 ============
+
+def get_store_fingerprint(store) -> str:
+    """读取集合元数据中记录的 Embedding 模型指纹，旧版本创建的集合返回空字符串。"""
+    metadata = store._collection.metadata or {}
+    return metadata.get("embedding_fingerprint", "")
+
+def stamp_embedding_fingerprint(store, embedding_adapter):
     """
-    对新的章节文本进行分段后，再用于存入向量库。
-    先句子切分 -> 语义相似度合并 -> 再按 max_length 切分。
+    集合尚未记录模型指纹时写入当前模型的指纹；已有指纹则保持不变，
+    以便之后切换模型时能够识别出不一致。
     """
-    if not chapter_text.strip():
-        return []
-    
-    nltk.download('punkt', quiet=True)
-    nltk.download('punkt_tab', quiet=True)
-    sentences = nltk.sent_tokenize(chapter_text)
-    if not sentences:
-        return []
+    fingerprint = getattr(embedding_adapter, "fingerprint", "")
+    if not fingerprint or get_store_fingerprint(store):
+        return
+    try:
+        # hnsw:* 参数在创建后不允许修改，更新元数据时需排除
+        metadata = {k: v for k, v in (store._collection.metadata or {}).items() if not k.startswith("hnsw:")}
+        metadata["embedding_fingerprint"] = fingerprint
+        store._collection.modify(metadata=metadata)
+    except Exception as e:
+        logging.warning(f"Failed to record embedding fingerprint: {e}")
+
+def is_store_compatible(store, embedding_adapter) -> bool:
+    """集合记录的模型指纹与当前 Embedding 配置一致（或任一方未知）时返回 True。"""
+    stored = get_store_fingerprint(store)
+    current = getattr(embedding_adapter, "fingerprint", "")
+    return not stored or not current or stored == current
+
+def resolve_write_store(embedding_adapter, filepath: str, collection_name: str) -> Tuple[Optional[Chroma], bool]:
+    """
+    确定写入目标：返回 (store, skip)。
+    - 模型一致：返回原集合；
+    - 模型不一致但正在后台重建：写入影子集合，重建完成替换后不会丢失；
+    - 模型不一致且未重建：skip=True，跳过写入，避免把不同维度的向量混入同一集合。
+    store 为 None 且 skip=False 表示向量库尚未创建。
+    """
+    store = load_vector_store(embedding_adapter, filepath, collection_name)
+    if not store or is_store_compatible(store, embedding_adapter):
+        return store, False
 
-    model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
-    embeddings = model.encode(sentences)
+    shadow_name = get_shadow_collection_name(collection_name)
+    try:
+        import chromadb
+        client = chromadb.PersistentClient(
+            path=get_vectorstore_dir(filepath),
+            settings=Settings(anonymized_telemetry=False)
+        )
+        existing = [c if isinstance(c, str) else c.name for c in client.list_collections()]
+    except Exception:
+        existing = []
+    if shadow_name in existing:
+        shadow = load_vector_store(embedding_adapter, filepath, shadow_name)
+        if shadow and is_store_compatible(shadow, embedding_adapter):
+            logging.info(f"Collection '{collection_name}' is being re-indexed, writing into '{shadow_name}'.")
+            return shadow, False
+
+    logging.warning(
+        f"Collection '{collection_name}' was built with embedding model '{get_store_fingerprint(store)}', "
+        f"current model is '{embedding_adapter.fingerprint}'. Skipped writing; please re-index the vector store."
+    )
+    return None, True
 
-    merged_paragraphs = []
-    current_sentences = [sentences[0]]
-    current_embedding = embeddings[0]
 
-    for i in range(1, len(sentences)):
-        sim = cosine_similarity([current_embedding], [embeddings[i]])[0][0]
-        if sim >= similarity_threshold:
-            current_sentences.append(sentences[i])
-            current_embedding = (current_embedding + embeddings[i]) / 2.0
-        else:
-            merged_paragraphs.append(" ".join(current_sentences))
-            current_sentences = [sentences[i]]
-            current_embedding = embeddings[i]
-
-    if current_sentences:
-        merged_paragraphs.append(" ".join(current_sentences))
-
-    final_segments = []
-    for para in merged_paragraphs:
-        if len(para) > max_length:
-            sub_segments = split_by_length(para, max_length=max_length)
-            final_segments.extend(sub_segments)
-        else:
-            final_segments.append(para)
+# ============ 文本分段工具 ============
 
-    return final_segments
+def split_text_for_vectorstore(chapter_text: str,
+                               max_length: int = 500,
+                               similarity_threshold: float = 0.7,
+                               overlap: int = DEFAULT_SEGMENT_OVERLAP) -> List[str]:
+    """
+    对新的章节文本进行分段后，再用于存入向量库。
+    先句子切分 -> 语义相似度合并 -> 再按 max_length 在句子边界处切分，相邻分段重叠 overlap。
+    """
+    return split_text_semantic(chapter_text, similarity_threshold=similarity_threshold,
+                               max_length=max_length, overlap=overlap)
 
 
 # ============ 更新向量库 ============
 
-def update_vector_store(
+def prepare_chapter_segments(
     embedding_adapter,
-    new_chapter: str,
-    filepath: str
-):
+    chapter_text: str,
+    filepath: str,
+    collection_name: str = CHAPTER_COLLECTION,
+    dedup: bool = True,
+    embed: bool = False
+) -> Optional[dict]:
     """
-    将最新章节文本插入到向量库中。
-    若库不存在则初始化；若初始化/更新失败，则跳过。
+    写入向量库的准备阶段：切分、近重复过滤，embed=True 时同时算好全部分段向量。
+    不写入向量库；返回 {"texts", "vectors", "signatures"}，没有需要写入的分段时返回 None。
+    Embedding 使用与切分相同的本地模型时，直接使用切分阶段合成的分段向量，不再重复编码。
     """
-    splitted_texts = split_text_for_vectorstore(new_chapter)
-    if not splitted_texts:
+    if can_reuse_splitter_embeddings(embedding_adapter):
+        texts, vectors = split_text_semantic_with_embeddings(chapter_text)
+    else:
+        texts, vectors = split_text_for_vectorstore(chapter_text), None
+    if not texts:
         logging.warning("No valid text to insert into vector store. Skipping.")
-        return
+        return None
 
-    store = load_vector_store(embedding_adapter, filepath)
+    signatures = []
+    if dedup:
+        index = get_signature_index(get_vectorstore_dir(filepath))
+        kept, signatures = index.filter_indices(collection_name, texts)
+        if len(kept) < len(texts):
+            logging.info(f"Skipped {len(texts) - len(kept)} near-duplicate segments for '{collection_name}'.")
+        texts = [texts[i] for i in kept]
+        if vectors is not None:
+            vectors = [vectors[i] for i in kept]
+        if not texts:
+            logging.info("All segments of the new chapter are near-duplicates, nothing to insert.")
+            return None
+
+    if embed:
+        missing = list(range(len(texts))) if vectors is None else [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            filled = call_with_retry(
+                func=embedding_adapter.embed_documents,
+                max_retries=3,
+                fallback_return=[],
+                texts=[texts[i] for i in missing]
+            )
+            if len(filled) != len(missing) or any(not v for v in filled):
+                discard_chapter_segments(filepath, {"signatures": signatures}, collection_name)
+                raise ValueError(f"Embedding failed for {len(missing)} segments.")
+            vectors = list(vectors) if vectors is not None else [None] * len(texts)
+            for i, v in zip(missing, filled):
+                vectors[i] = v
+    return {"texts": [str(t) for t in texts], "vectors": vectors, "signatures": signatures}
+
+
+def discard_chapter_segments(filepath: str, prepared: Optional[dict], collection_name: str = CHAPTER_COLLECTION):
+    """放弃已准备但未写入的分段：撤销其近重复签名。"""
+    if prepared and prepared.get("signatures"):
+        get_signature_index(get_vectorstore_dir(filepath)).discard(collection_name, prepared["signatures"])
+
+
+def commit_chapter_segments(
+    embedding_adapter,
+    filepath: str,
+    prepared: dict,
+    collection_name: str = CHAPTER_COLLECTION
+) -> bool:
+    """把 prepare_chapter_segments 的结果写入向量库，失败时撤销签名并返回 False。"""
+    store, skip = resolve_write_store(embedding_adapter, filepath, collection_name)
+    if skip:
+        discard_chapter_segments(filepath, prepared, collection_name)
+        return False
     if not store:
         logging.info("Vector store does not exist or failed to load. Initializing a new one for new chapter...")
-        store = init_vector_store(embedding_adapter, splitted_texts, filepath)
+        store = open_or_create_store(embedding_adapter, filepath, collection_name)
         if not store:
             logging.warning("Init vector store failed, skip embedding.")
-        else:
-            logging.info("New vector store created successfully.")
-        return
+            discard_chapter_segments(filepath, prepared, collection_name)
+            return False
 
-    # 如果已有store，则直接往里插入
     try:
-        docs = [Document(page_content=str(t)) for t in splitted_texts]
-        store.add_documents(docs)
-        logging.info("Vector store updated with the new chapter splitted segments.")
+        add_segments_to_store(embedding_adapter, store, prepared["texts"], embeddings=prepared["vectors"])
+        get_signature_index(get_vectorstore_dir(filepath)).save()
+        logging.info(f"Vector store collection '{collection_name}' updated with the new chapter splitted segments.")
+        return True
     except Exception as e:
         logging.warning(f"Failed to update vector store: {e}")
         traceback.print_exc()
+        discard_chapter_segments(filepath, prepared, collection_name)
+        return False
+
+
+def update_vector_store(
+    embedding_adapter,
+    new_chapter: str,
+    filepath: str,
+    collection_name: str = CHAPTER_COLLECTION,
+    dedup: bool = True
+):
+    """
+    将最新章节文本插入到向量库中（默认写入章节集合）。
+    若库不存在则初始化；若初始化/更新失败，则跳过。
+    dedup=True 时与该集合已有分段近重复的分段不再写入。
+    """
+    prepared = prepare_chapter_segments(embedding_adapter, new_chapter, filepath, collection_name, dedup)
+    if prepared:
+        commit_chapter_segments(embedding_adapter, filepath, prepared, collection_name)
 
 
 # ============ 向量检索上下文 ============
 
+def _search_collection(embedding_adapter, query: str, filepath: str, spec: dict) -> List[Tuple[str, float]]:
+    """
+    在单个集合中检索，返回 [(文本, 加权得分)]。
+    Chroma 返回的是距离（越小越相近），这里换算为 1/(1+d) 后乘以集合权重。
+    """
+    name = spec["name"]
+    k = int(spec.get("k", 2))
+    weight = float(spec.get("weight", 1.0))
+    if k <= 0:
+        return []
+
+    store = load_vector_store(embedding_adapter, filepath, name)
+    if not store:
+        return []
+    if not is_store_compatible(store, embedding_adapter):
+        # 集合仍是旧模型的向量（重建索引完成替换之前）：用旧模型生成查询向量；
+        # 无法得到旧模型的适配器时跳过，当前模型的查询向量与库内向量不可比
+        stored = get_store_fingerprint(store)
+        query_adapter = get_adapter_for_fingerprint(stored)
+        if query_adapter is None:
+            logging.warning(
+                f"Skip collection '{name}': built with embedding model '{stored}', "
+                f"current model is '{embedding_adapter.fingerprint}'."
+            )
+            return []
+        store = load_vector_store(query_adapter, filepath, name)
+        if not store:
+            return []
+
+    try:
+        # 空集合直接跳过，避免 Chroma 对 n_results > 元素数 的告警
+        if store._collection.count() == 0:
+            return []
+        results = store.similarity_search_with_score(query, k=k)
+    except Exception as e:
+        logging.warning(f"Similarity search in collection '{name}' failed: {e}")
+        traceback.print_exc()
+        return []
+
+    return [(doc.page_content, weight / (1.0 + float(distance))) for doc, distance in results]
+
 def get_relevant_context_from_vector_store(
     embedding_adapter,
     query: str,
     filepath: str,
-    k: int = 2
+    k: int = 2,
+    collections: Optional[List[dict]] = None,
+    enable_rerank: bool = False,
+    rerank_candidates: int = 30,
+    rerank_timeout: float = 2.0
 ) -> str:
     """
-    从向量库中检索与 query 最相关的 k 条文本，拼接后返回。
+    从向量库中检索与 query 最相关的文本，拼接后返回。
+    collections 为 [{"name": 集合名, "k": 条数, "weight": 权重}, ...]，
+    各集合并发检索后按加权得分合并去重；为空时使用章节+知识库的默认配置（各取 k 条）。
+    enable_rerank 为 True 时，每个集合多取候选（共 rerank_candidates 条），
+    再用本地 cross-encoder 重排序后保留各集合 k 之和条；重排序超过 rerank_timeout 秒则沿用向量顺序。
     如果向量库加载/检索失败，则返回空字符串。
     最终只返回最多2000字符的检索片段。
     """
-    store = load_vector_store(embedding_adapter, filepath)
-    if not store:
+    if not os.path.exists(get_vectorstore_dir(filepath)):
         logging.info("No vector store found or load failed. Returning empty context.")
         return ""
 
-    try:
-        docs = store.similarity_search(query, k=k)
-        if not docs:
-            logging.info(f"No relevant documents found for query '{query}'. Returning empty context.")
-            return ""
-        combined = "\n".join([d.page_content for d in docs])
-        # 限制长度最多2000字符
-        if len(combined) > 2000:
-            combined = combined[:2000]
-        return combined
-    except Exception as e:
-        logging.warning(f"Similarity search failed: {e}")
-        traceback.print_exc()
+    if not collections:
+        collections = build_default_retrieval_collections(k)
+
+    search_specs = collections
+    if enable_rerank:
+        search_specs = [dict(spec, k=max(int(spec.get("k", 2)), rerank_candidates)) for spec in collections]
+
+    with ThreadPoolExecutor(max_workers=len(search_specs)) as executor:
+        futures = [
+            executor.submit(_search_collection, embedding_adapter, query, filepath, spec)
+            for spec in search_specs
+        ]
+        scored = []
+        for fut in futures:
+            scored.extend(fut.result())
+
+    if not scored:
+        logging.info(f"No relevant documents found for query '{query}'. Returning empty context.")
         return ""
 
+    scored.sort(key=lambda x: x[1], reverse=True)
+    seen = set()
+    contents = []
+    for content, _ in scored:
+        if content in seen:
+            continue
+        seen.add(content)
+        contents.append(content)
+
+    if enable_rerank:
+        from reranker import rerank
+        top_n = sum(int(spec.get("k", 2)) for spec in collections)
+        contents = rerank(query, contents[:rerank_candidates], top_n=top_n, timeout=rerank_timeout)
+
+    combined = "\n".join(contents)
+    # 限制长度最多2000字符
+    if len(combined) > 2000:
+        combined = combined[:2000]
+    return combined
+
 
 # ============ 从目录中获取最近 n 章文本 ============
 
@@ -381,7 +680,8 @@ def summarize_recent_chapters(
     temperature: float,
     max_tokens: int,
     chapters_text_list: List[str],
-    timeout: int = 600
+    timeout: int = 600,
+    cancel_token: Optional[CancelToken] = None
 ) -> Tuple[str, str]:
     """
     生成 (short_summary, next_chapter_keywords)
@@ -398,7 +698,8 @@ def summarize_recent_chapters(
         api_key=api_key,
         temperature=temperature,
         max_tokens=max_tokens,
-        timeout=timeout
+        timeout=timeout,
+        cancel_token=cancel_token
     )
 
     prompt = summarize_recent_chapters_prompt.format(combined_text=combined_text)
@@ -420,6 +721,110 @@ def summarize_recent_chapters(
     return (short_summary, next_chapter_keywords)
 
 
+# ============ 下一章上下文（预取缓存） ============
+
+def build_next_chapter_context(
+    filepath: str,
+    novel_number: int,
+    interface_format: str,
+    api_key: str,
+    base_url: str,
+    model_name: str,
+    temperature: float,
+    max_tokens: int,
+    timeout: int,
+    embedding_api_key: str,
+    embedding_url: str,
+    embedding_interface_format: str,
+    embedding_model_name: str,
+    embedding_retrieval_k: int = 2,
+    retrieval_collections: Optional[List[dict]] = None,
+    enable_rerank: bool = False,
+    cancel_token: Optional[CancelToken] = None
+) -> dict:
+    """
+    计算第 novel_number 章草稿所需的近期摘要与向量检索上下文，返回
+    {"recent_texts", "short_summary", "next_chapter_keywords", "relevant_context"}。
+    两项结果分别按输入哈希缓存：近期章节正文与模型参数未变时复用摘要，
+    检索语句、检索参数与向量库文件均未变时复用检索结果（见 prefetch_next_chapter_context）。
+    """
+    cache = get_prefetch_cache()
+    project = os.path.abspath(filepath)
+    recent_texts = get_last_n_chapters_text(os.path.join(filepath, "chapters"), novel_number, n=3)
+
+    summary_key = hash_inputs(recent_texts, interface_format, base_url, model_name, temperature, max_tokens)
+    short_summary, next_chapter_keywords = cache.get_or_compute(
+        (project, novel_number, "summary"),
+        summary_key,
+        lambda: summarize_recent_chapters(
+            interface_format=interface_format,
+            api_key=api_key,
+            base_url=base_url,
+            model_name=model_name,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            chapters_text_list=recent_texts,
+            timeout=timeout,
+            cancel_token=cancel_token
+        ),
+        is_valid=lambda r: bool(r[0] or r[1])
+    )
+    check_cancelled(cancel_token)
+
+    retrieval_query = short_summary + " " + next_chapter_keywords
+    store_dir = get_vectorstore_dir(filepath)
+    store_stamp = vector_store_stamp(store_dir)
+    retrieval_key = hash_inputs(
+        retrieval_query, embedding_interface_format, embedding_url, embedding_model_name,
+        embedding_retrieval_k, retrieval_collections, enable_rerank, store_stamp
+    )
+    store_changed = []
+
+    def retrieve() -> str:
+        embedding_adapter = create_embedding_adapter(
+            embedding_interface_format,
+            embedding_api_key,
+            embedding_url,
+            embedding_model_name
+        )
+        result = get_relevant_context_from_vector_store(
+            embedding_adapter=embedding_adapter,
+            query=retrieval_query,
+            filepath=filepath,
+            k=embedding_retrieval_k,
+            collections=retrieval_collections,
+            enable_rerank=enable_rerank
+        )
+        # 检索期间向量库有写入（如同时在导入知识库）时，结果不对应任何一个状态戳，不予缓存
+        if vector_store_stamp(store_dir) != store_stamp:
+            store_changed.append(True)
+        return result
+
+    relevant_context = cache.get_or_compute(
+        (project, novel_number, "retrieval"),
+        retrieval_key,
+        retrieve,
+        is_valid=lambda r: bool(r and r.strip()) and not store_changed
+    )
+    return {
+        "recent_texts": recent_texts,
+        "short_summary": short_summary,
+        "next_chapter_keywords": next_chapter_keywords,
+        "relevant_context": relevant_context
+    }
+
+
+def prefetch_next_chapter_context(filepath: str, novel_number: int, **kwargs) -> Optional[Future]:
+    """
+    在后台预先计算第 novel_number 章的上下文（参数同 build_next_chapter_context），
+    通常在上一章定稿后调用。第一章不需要摘要与检索，返回 None。
+    """
+    if novel_number <= 1:
+        return None
+    logging.info(f"Prefetching context for chapter {novel_number} in background ...")
+    return submit_prefetch(build_next_chapter_context, filepath, novel_number, **kwargs)
+
+
 # ============ 持久化：情节架构（partial_architecture.json） ============
 
 def load_partial_architecture_data(filepath: str) -> dict:
@@ -439,20 +844,110 @@ def load_partial_architecture_data(filepath: str) -> dict:
         logging.warning(f"Failed to load partial_architecture.json: {e}")
         return {}
 
+_partial_arch_lock = threading.Lock()
+
 def save_partial_architecture_data(filepath: str, data: dict):
     """
     将阶段性数据写入 partial_architecture.json。
+    先写临时文件再整体替换，并发的步骤同时完成时也不会写出损坏的文件。
     """
     partial_file = os.path.join(filepath, "partial_architecture.json")
+    tmp_file = partial_file + ".tmp"
     try:
-        with open(partial_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with _partial_arch_lock:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, partial_file)
     except Exception as e:
         logging.warning(f"Failed to save partial_architecture.json: {e}")
 
 
 # ============ 1) 生成总体架构 ============
 
+def build_architecture_steps(llm_adapter, topic: str, genre: str, number_of_chapters: int, word_number: int) -> List[Step]:
+    """
+    架构生成的步骤依赖图：
+      core_seed_result -> character_dynamics_result -> character_state_result
+                       -> world_building_result
+      (core_seed, character_dynamics, world_building) -> plot_arch_result
+    角色动力学与世界观只依赖核心种子，可与之后的初始角色状态并发生成。
+    """
+    def core_seed(r):
+        return invoke_with_cleaning(llm_adapter, core_seed_prompt.format(
+            topic=topic,
+            genre=genre,
+            number_of_chapters=number_of_chapters,
+            word_number=word_number
+        ))
+
+    def character_dynamics(r):
+        return invoke_with_cleaning(llm_adapter, character_dynamics_prompt.format(
+            core_seed=r["core_seed_result"].strip()
+        ))
+
+    def character_state(r):
+        return invoke_with_cleaning(llm_adapter, create_character_state_prompt.format(
+            character_dynamics=r["character_dynamics_result"].strip()
+        ))
+
+    def world_building(r):
+        return invoke_with_cleaning(llm_adapter, world_building_prompt.format(
+            core_seed=r["core_seed_result"].strip()
+        ))
+
+    def plot_arch(r):
+        return invoke_with_cleaning(llm_adapter, plot_architecture_prompt.format(
+            core_seed=r["core_seed_result"].strip(),
+            character_dynamics=r["character_dynamics_result"].strip(),
+            world_building=r["world_building_result"].strip()
+        ))
+
+    return [
+        Step("core_seed_result", [], core_seed, "Step1: core_seed_prompt (核心种子)"),
+        Step("character_dynamics_result", ["core_seed_result"], character_dynamics,
+             "Step2: character_dynamics_prompt"),
+        Step("character_state_result", ["character_dynamics_result"], character_state,
+             "Initial character state (create_character_state_prompt)"),
+        Step("world_building_result", ["core_seed_result"], world_building, "Step3: world_building_prompt"),
+        Step("plot_arch_result", ["core_seed_result", "character_dynamics_result", "world_building_result"],
+             plot_arch, "Step4: plot_architecture_prompt"),
+    ]
+
+def save_initial_character_state(filepath: str, character_state: str):
+    character_state_file = os.path.join(filepath, "character_state.txt")
+    clear_file_content(character_state_file)
+    save_string_to_txt(character_state, character_state_file)
+    logging.info("Initial character state created and saved.")
+
+
+def write_architecture_file(
+    filepath: str,
+    topic: str,
+    genre: str,
+    number_of_chapters: int,
+    word_number: int,
+    data: dict
+):
+    """把架构各步骤的结果组合为 Novel_architecture.txt。"""
+    final_content = (
+        "#=== 0) 小说设定 ===\n"
+        f"主题：{topic},类型：{genre},篇幅：约{number_of_chapters}章（每章{word_number}字）\n\n"
+        "#=== 1) 核心种子 ===\n"
+        f"{data['core_seed_result']}\n\n"
+        "#=== 2) 角色动力学 ===\n"
+        f"{data['character_dynamics_result']}\n\n"
+        "#=== 3) 世界观 ===\n"
+        f"{data['world_building_result']}\n\n"
+        "#=== 4) 三幕式情节架构 ===\n"
+        f"{data['plot_arch_result']}\n"
+    )
+
+    arch_file = os.path.join(filepath, "Novel_architecture.txt")
+    clear_file_content(arch_file)
+    save_string_to_txt(final_content, arch_file)
+    logging.info("Novel_architecture.txt has been generated successfully.")
+
+
 def Novel_architecture_generate(
     interface_format: str,
     api_key: str,
@@ -465,21 +960,20 @@ def Novel_architecture_generate(
     filepath: str,
     temperature: float = 0.7,
     max_tokens: int = 2048,
-    timeout: int = 600
+    timeout: int = 600,
+    cancel_token: Optional[CancelToken] = None
 ) -> None:
     """
-    依次调用:
+    按 build_architecture_steps 声明的依赖图生成：
       1. core_seed_prompt
-      2. character_dynamics_prompt
+      2. character_dynamics_prompt（与 3 并发）
       3. world_building_prompt
       4. plot_architecture_prompt
-    若在中间任何一步报错且重试多次失败，则将已经生成的内容写入 partial_architecture.json 并退出；
-    下次调用时可从该步骤继续。
+    以及依据角色动力学生成的初始角色状态表（存储到 character_state.txt，后续维护更新）。
+    每个步骤完成即写入 partial_architecture.json；任一步骤重试多次仍失败时，
+    已完成（包括并发中完成）的内容都会保存，下次调用从未完成的步骤继续。
     最终输出 Novel_architecture.txt
-
-    新增：
-    - 在完成角色动力学设定后，依据该角色体系，使用 create_character_state_prompt 生成初始角色状态表，
-      并存储到 character_state.txt，后续维护更新。
+    cancel_token 被取消时，运行中的步骤立即停止，已完成的步骤同样保存，之后抛出 OperationCancelled。
     """
     os.makedirs(filepath, exist_ok=True)
 
@@ -493,121 +987,29 @@ def Novel_architecture_generate(
         api_key=api_key,
         temperature=temperature,
         max_tokens=max_tokens,
-        timeout=timeout
+        timeout=timeout,
+        cancel_token=cancel_token
     )
 
-    # Step1: 核心种子
-    if "core_seed_result" not in partial_data:
-        logging.info("Step1: Generating core_seed_prompt (核心种子) ...")
-        prompt_core = core_seed_prompt.format(
-            topic=topic,
-            genre=genre,
-            number_of_chapters=number_of_chapters,
-            word_number=word_number
-        )
-        core_seed_result = invoke_with_cleaning(llm_adapter, prompt_core)
-        if not core_seed_result.strip():
-            # 多次重试依旧失败，则写入已完成内容后退出
-            logging.warning("core_seed_prompt generation failed and returned empty.")
-            save_partial_architecture_data(filepath, partial_data)
-            return
-        partial_data["core_seed_result"] = core_seed_result
-        save_partial_architecture_data(filepath, partial_data)
-    else:
-        logging.info("Step1 already done. Skipping...")
-
-    # Step2: 角色动力学
-    if "character_dynamics_result" not in partial_data:
-        logging.info("Step2: Generating character_dynamics_prompt ...")
-        prompt_character = character_dynamics_prompt.format(core_seed=partial_data["core_seed_result"].strip())
-        character_dynamics_result = invoke_with_cleaning(llm_adapter, prompt_character)
-        if not character_dynamics_result.strip():
-            logging.warning("character_dynamics_prompt generation failed.")
-            # 写入目前已有结果，然后退出
-            save_partial_architecture_data(filepath, partial_data)
-            return
-        partial_data["character_dynamics_result"] = character_dynamics_result
-        save_partial_architecture_data(filepath, partial_data)
-    else:
-        logging.info("Step2 already done. Skipping...")
+    steps = build_architecture_steps(llm_adapter, topic, genre, number_of_chapters, word_number)
+    for step in steps:
+        if step.name in partial_data:
+            logging.info(f"{step.label} already done. Skipping...")
 
-    # 在完成角色动力学设定后，生成初始角色状态表
-    if "character_dynamics_result" in partial_data and "character_state_result" not in partial_data:
-        logging.info("Generating initial character state from character dynamics ...")
-        prompt_char_state_init = create_character_state_prompt.format(
-            character_dynamics=partial_data["character_dynamics_result"].strip()
-        )
-        character_state_init = invoke_with_cleaning(llm_adapter, prompt_char_state_init)
-        if not character_state_init.strip():
-            logging.warning("create_character_state_prompt generation failed.")
-            # 写入目前已有结果，然后退出
-            save_partial_architecture_data(filepath, partial_data)
-            return
-
-        partial_data["character_state_result"] = character_state_init
-        # 保存到文件
-        character_state_file = os.path.join(filepath, "character_state.txt")
-        clear_file_content(character_state_file)
-        save_string_to_txt(character_state_init, character_state_file)
-
-        save_partial_architecture_data(filepath, partial_data)
-        logging.info("Initial character state created and saved.")
-
-    # Step3: 世界观
-    if "world_building_result" not in partial_data:
-        logging.info("Step3: Generating world_building_prompt ...")
-        prompt_world = world_building_prompt.format(core_seed=partial_data["core_seed_result"].strip())
-        world_building_result = invoke_with_cleaning(llm_adapter, prompt_world)
-        if not world_building_result.strip():
-            logging.warning("world_building_prompt generation failed.")
-            save_partial_architecture_data(filepath, partial_data)
-            return
-        partial_data["world_building_result"] = world_building_result
+    def on_result(name: str, result: str):
+        if name == "character_state_result":
+            save_initial_character_state(filepath, result)
         save_partial_architecture_data(filepath, partial_data)
-    else:
-        logging.info("Step3 already done. Skipping...")
-
-    # Step4: 三幕式情节
-    if "plot_arch_result" not in partial_data:
-        logging.info("Step4: Generating plot_architecture_prompt ...")
-        prompt_plot = plot_architecture_prompt.format(
-            core_seed=partial_data["core_seed_result"].strip(),
-            character_dynamics=partial_data["character_dynamics_result"].strip(),
-            world_building=partial_data["world_building_result"].strip()
-        )
-        plot_arch_result = invoke_with_cleaning(llm_adapter, prompt_plot)
-        if not plot_arch_result.strip():
-            logging.warning("plot_architecture_prompt generation failed.")
-            save_partial_architecture_data(filepath, partial_data)
-            return
-        partial_data["plot_arch_result"] = plot_arch_result
+
+    if not run_step_graph(steps, partial_data, on_result):
+        # 写入目前已有结果，然后退出
+        logging.warning("Novel architecture generation stopped, completed steps saved to partial_architecture.json.")
         save_partial_architecture_data(filepath, partial_data)
-    else:
-        logging.info("Step4 already done. Skipping...")
+        check_cancelled(cancel_token)
+        return
 
     # 如果能走到这里，说明全部步骤都完成了
-    core_seed_result = partial_data["core_seed_result"]
-    character_dynamics_result = partial_data["character_dynamics_result"]
-    world_building_result = partial_data["world_building_result"]
-    plot_arch_result = partial_data["plot_arch_result"]
-
-    final_content = (
-        "#=== 0) 小说设定 ===\n"
-        f"主题：{topic},类型：{genre},篇幅：约{number_of_chapters}章（每章{word_number}字）\n\n"
-        "#=== 1) 核心种子 ===\n"
-        f"{core_seed_result}\n\n"
-        "#=== 2) 角色动力学 ===\n"
-        f"{character_dynamics_result}\n\n"
-        "#=== 3) 世界观 ===\n"
-        f"{world_building_result}\n\n"
-        "#=== 4) 三幕式情节架构 ===\n"
-        f"{plot_arch_result}\n"
-    )
-
-    arch_file = os.path.join(filepath, "Novel_architecture.txt")
-    clear_file_content(arch_file)
-    save_string_to_txt(final_content, arch_file)
-    logging.info("Novel_architecture.txt has been generated successfully.")
+    write_architecture_file(filepath, topic, genre, number_of_chapters, word_number, partial_data)
 
     # 全部生成完成后，可以考虑删除 partial_architecture.json，或保留做追溯
     # 这里选择删除
@@ -653,6 +1055,32 @@ def limit_chapter_blueprint(blueprint_text: str, limit_chapters: int = 100) -> s
     return "\n\n".join(selected).strip()
 
 
+def max_blueprint_chapter(blueprint_text: str) -> int:
+    """章节目录中已有的最大章节号，没有时返回 0。"""
+    numbers = [int(x) for x in re.findall(r"第\s*(\d+)\s*章", blueprint_text) if x.isdigit()]
+    return max(numbers) if numbers else 0
+
+
+def generate_blueprint_chunk(
+    llm_adapter,
+    architecture_text: str,
+    existing_blueprint: str,
+    number_of_chapters: int,
+    start: int,
+    end: int
+) -> str:
+    """生成第 start..end 章的目录，existing_blueprint 为此前已生成的目录（仅保留最近100章作为上下文）。"""
+    chunk_prompt = chunked_chapter_blueprint_prompt.format(
+        novel_architecture=architecture_text,
+        chapter_list=limit_chapter_blueprint(existing_blueprint, 100),
+        number_of_chapters=number_of_chapters,
+        n=start,
+        m=end
+    )
+    logging.info(f"Generating chapters [{start}..{end}] in a chunk...")
+    return invoke_with_cleaning(llm_adapter, chunk_prompt).strip()
+
+
 # ============ 2) 生成章节蓝图（新增分块逻辑 + 断点续跑） ============
 
 def Chapter_blueprint_generate(
@@ -664,26 +1092,32 @@ def Chapter_blueprint_generate(
     number_of_chapters: int,
     temperature: float = 0.7,
     max_tokens: int = 4096,
-    timeout: int = 600
-) -> None:
+    timeout: int = 600,
+    arc_parallel: Optional[bool] = None,
+    max_workers: int = 4,
+    cancel_token: Optional[CancelToken] = None
+) -> bool:
     """
     若 Novel_directory.txt 已存在且内容非空，则表示可能是之前的部分生成结果；
       解析其中已有的章节数，从下一个章节继续分块生成；
       对于已有章节目录，传入时仅保留最近100章目录，避免prompt过长。
     否则：
       - 若章节数 <= chunk_size，直接一次性生成
-      - 若章节数 > chunk_size，进行分块生成
-    生成完成后输出至 Novel_directory.txt。
+      - 若分块数较多（或 arc_parallel=True），先划分剧情弧线，再按弧线并行生成（见 arc_blueprint）
+      - 否则进行分块生成
+    arc_parallel 为 None 时按分块数自动选择，False 时始终逐块生成。
+    生成完成后输出至 Novel_directory.txt，全部章节都已生成时返回 True，否则返回 False（已生成的部分保留）。
+    cancel_token 被取消时抛出 OperationCancelled，已写入的目录（或弧线中间结果）保留，可继续生成。
     """
     arch_file = os.path.join(filepath, "Novel_architecture.txt")
     if not os.path.exists(arch_file):
         logging.warning("Novel_architecture.txt not found. Please generate architecture first.")
-        return
+        return False
 
     architecture_text = read_file(arch_file).strip()
     if not architecture_text:
         logging.warning("Novel_architecture.txt is empty.")
-        return
+        return False
 
     llm_adapter = create_llm_adapter(
         interface_format=interface_format,
@@ -692,7 +1126,8 @@ def Chapter_blueprint_generate(
         api_key=api_key,
         temperature=temperature,
         max_tokens=max_tokens,
-        timeout=timeout
+        timeout=timeout,
+        cancel_token=cancel_token
     )
 
     filename_dir = os.path.join(filepath, "Novel_directory.txt")
@@ -708,14 +1143,7 @@ def Chapter_blueprint_generate(
     if existing_blueprint:
         logging.info("Detected existing blueprint content. Will resume chunked generation from that point.")
 
-        pattern = r"第\s*(\d+)\s*章"
-        existing_chapter_numbers = re.findall(pattern, existing_blueprint)
-        existing_chapter_numbers = [int(x) for x in existing_chapter_numbers if x.isdigit()]
-
-        if existing_chapter_numbers:
-            max_existing_chap = max(existing_chapter_numbers)
-        else:
-            max_existing_chap = 0
+        max_existing_chap = max_blueprint_chapter(existing_blueprint)
 
         logging.info(f"Existing blueprint indicates up to chapter {max_existing_chap} has been generated.")
 
@@ -723,24 +1151,15 @@ def Chapter_blueprint_generate(
         current_start = max_existing_chap + 1
         while current_start <= number_of_chapters:
             current_end = min(current_start + chunk_size - 1, number_of_chapters)
-            limited_blueprint = limit_chapter_blueprint(final_blueprint, 100)
-
-            chunk_prompt = chunked_chapter_blueprint_prompt.format(
-                novel_architecture=architecture_text,
-                chapter_list=limited_blueprint,  # 只保留最近100章
-                number_of_chapters=number_of_chapters,
-                n=current_start,
-                m=current_end
+            chunk_result = generate_blueprint_chunk(
+                llm_adapter, architecture_text, final_blueprint, number_of_chapters, current_start, current_end
             )
-            logging.info(f"Generating chapters [{current_start}..{current_end}] in a chunk...")
-
-            chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt)
-            if not chunk_result.strip():
+            if not chunk_result:
                 logging.warning(f"Chunk generation for chapters [{current_start}..{current_end}] is empty.")
                 # 写入当前已经有的 final_blueprint，并结束
                 clear_file_content(filename_dir)
                 save_string_to_txt(final_blueprint.strip(), filename_dir)
-                return
+                return False
 
             final_blueprint += "\n\n" + chunk_result.strip()
 
@@ -751,9 +1170,26 @@ def Chapter_blueprint_generate(
             current_start = current_end + 1
 
         logging.info("All chapters blueprint have been generated (resumed chunked).")
-        return
+        return True
 
     # 如果 Novel_directory.txt 为空，则分情况：
+    # 0) 长篇按剧情弧线并行生成
+    if chunk_size < number_of_chapters and (
+        arc_parallel or (arc_parallel is None and should_use_arc_mode(number_of_chapters, chunk_size))
+    ):
+        logging.info("Will generate chapter blueprint by arcs in parallel.")
+        ok = Arc_blueprint_generate(
+            lambda prompt: invoke_with_cleaning(llm_adapter, prompt),
+            filepath,
+            architecture_text,
+            number_of_chapters,
+            chunk_size,
+            max_workers=max_workers
+        )
+        if not ok:
+            logging.warning("Chapter blueprint by arcs is incomplete; finished arcs are kept and will be reused on retry.")
+        return ok
+
     # 1) 如果 chunk_size >= number_of_chapters，可以一次性生成
     if chunk_size >= number_of_chapters:
         prompt = chapter_blueprint_prompt.format(
@@ -763,12 +1199,12 @@ def Chapter_blueprint_generate(
         blueprint_text = invoke_with_cleaning(llm_adapter, prompt)
         if not blueprint_text.strip():
             logging.warning("Chapter blueprint generation result is empty.")
-            return
+            return False
 
         clear_file_content(filename_dir)
         save_string_to_txt(blueprint_text, filename_dir)
         logging.info("Novel_directory.txt (chapter blueprint) has been generated successfully (single-shot).")
-        return
+        return True
 
     # 2) 如果 chunk_size < number_of_chapters，则进行分块生成
     logging.info("Will generate chapter blueprint in chunked mode from scratch.")
@@ -776,24 +1212,15 @@ def Chapter_blueprint_generate(
     current_start = 1
     while current_start <= number_of_chapters:
         current_end = min(current_start + chunk_size - 1, number_of_chapters)
-        limited_blueprint = limit_chapter_blueprint(final_blueprint, 100)
-
-        chunk_prompt = chunked_chapter_blueprint_prompt.format(
-            novel_architecture=architecture_text,
-            chapter_list=limited_blueprint,  # 只保留最近100章
-            number_of_chapters=number_of_chapters,
-            n=current_start,
-            m=current_end
+        chunk_result = generate_blueprint_chunk(
+            llm_adapter, architecture_text, final_blueprint, number_of_chapters, current_start, current_end
         )
-        logging.info(f"Generating chapters [{current_start}..{current_end}] in a chunk...")
-
-        chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt)
-        if not chunk_result.strip():
+        if not chunk_result:
             logging.warning(f"Chunk generation for chapters [{current_start}..{current_end}] is empty.")
             # 写入已经生成的 final_blueprint
             clear_file_content(filename_dir)
             save_string_to_txt(final_blueprint.strip(), filename_dir)
-            return
+            return False
 
         if final_blueprint.strip():
             final_blueprint += "\n\n" + chunk_result.strip()
@@ -807,6 +1234,7 @@ def Chapter_blueprint_generate(
         current_start = current_end + 1
 
     logging.info("Novel_directory.txt (chapter blueprint) has been generated successfully (chunked).")
+    return True
 
 
 # ============ 3) 生成章节草稿 ============
@@ -833,12 +1261,25 @@ def generate_chapter_draft(
     max_tokens: int = 2048,
     timeout: int = 600,
     chapter_lang_format: str = "中文",
+    retrieval_collections: Optional[List[dict]] = None,
+    enable_rerank: bool = False,
+    cancel_token: Optional[CancelToken] = None,
+    num_candidates: int = 1,
+    scene_parallel: bool = False,
 ) -> str:
     """
     根据 novel_number 判断是否为第一章。
     - 若是第一章，则使用 first_chapter_draft_prompt
     - 否则使用 next_chapter_draft_prompt
+    retrieval_collections 可指定各集合的检索条数与权重，为空时按 embedding_retrieval_k 使用默认配置；
+    enable_rerank 开启后对检索候选做本地 cross-encoder 重排序。
+    近期摘要与检索结果由 build_next_chapter_context 计算，上一章定稿后已预取且输入未变时直接复用。
     最终将生成文本存入 chapters/chapter_{novel_number}.txt。
+    cancel_token 被取消时抛出 OperationCancelled，章节文件保持不变。
+    num_candidates > 1 时用同一提示词并发生成多份草稿，按本地信号打分排序（见 draft_candidates），
+    排序结果保存在 draft_candidates/chapter_{novel_number}.json，得分最高的一份写入章节文件并返回。
+    scene_parallel=True 且单份生成时，目标字数超过单次调用的输出能力则先规划场景、再并行生成各场景并修订衔接处
+    （见 scene_chapter），场景模式失败时回退为整章一次生成；默认始终整章生成。
     """
     arch_file = os.path.join(filepath, "Novel_architecture.txt")
     novel_architecture_text = read_file(arch_file)
@@ -891,17 +1332,27 @@ def generate_chapter_draft(
         )
     else:
         # 若不是第一章，则获取最近几章文本，并做摘要与检索
-        recent_3_texts = get_last_n_chapters_text(chapters_dir, novel_number, n=3)
-        short_summary, next_chapter_keywords = summarize_recent_chapters(
+        # （可能在等待后台预取完成，放在可取消的等待中）
+        context = run_cancellable(lambda: build_next_chapter_context(
+            filepath=filepath,
+            novel_number=novel_number,
             interface_format=interface_format,
             api_key=api_key,
             base_url=base_url,
             model_name=model_name,
             temperature=temperature,
             max_tokens=max_tokens,
-            chapters_text_list=recent_3_texts,
-            timeout=timeout
-        )
+            timeout=timeout,
+            embedding_api_key=embedding_api_key,
+            embedding_url=embedding_url,
+            embedding_interface_format=embedding_interface_format,
+            embedding_model_name=embedding_model_name,
+            embedding_retrieval_k=embedding_retrieval_k,
+            retrieval_collections=retrieval_collections,
+            enable_rerank=enable_rerank,
+            cancel_token=cancel_token
+        ), cancel_token)
+        recent_3_texts = context["recent_texts"]
 
         # 从最近章节中获取最后一段作为前章结尾
         previous_chapter_excerpt = ""
@@ -914,20 +1365,7 @@ def generate_chapter_draft(
                     previous_chapter_excerpt = text_block
                 break
 
-        # 从向量库检索上下文
-        embedding_adapter = create_embedding_adapter(
-            embedding_interface_format,
-            embedding_api_key,
-            embedding_url,
-            embedding_model_name
-        )
-        retrieval_query = short_summary + " " + next_chapter_keywords
-        relevant_context = get_relevant_context_from_vector_store(
-            embedding_adapter=embedding_adapter,
-            query=retrieval_query,
-            filepath=filepath,
-            k=embedding_retrieval_k
-        )
+        relevant_context = context["relevant_context"]
         if not relevant_context.strip():
             relevant_context = "（无检索到的上下文）"
 
@@ -962,10 +1400,41 @@ def generate_chapter_draft(
         api_key=api_key,
         temperature=temperature,
         max_tokens=max_tokens,
-        timeout=timeout
+        timeout=timeout,
+        cancel_token=cancel_token
     )
     # logging.info(f"[Draft] Chapter prompt_text: {prompt_text} ")
-    chapter_content = invoke_with_cleaning(llm_adapter, prompt_text)
+    if num_candidates > 1:
+        ranked = generate_draft_candidates(
+            llm_adapter,
+            prompt_text,
+            num_candidates,
+            word_number=word_number,
+            characters_involved=characters_involved,
+            key_items=key_items,
+            chapter_summary=chapter_summary,
+            embedding_interface_format=embedding_interface_format,
+            embedding_api_key=embedding_api_key,
+            embedding_url=embedding_url,
+            embedding_model_name=embedding_model_name
+        )
+        check_cancelled(cancel_token)
+        save_draft_candidates(filepath, novel_number, ranked)
+        chapter_content = ranked[0]["text"] if ranked else ""
+    else:
+        chapter_content = ""
+        if scene_parallel and should_use_scene_mode(word_number, max_tokens, chapter_lang_format):
+            logging.info(f"[Draft] Chapter {novel_number} will be generated scene by scene in parallel.")
+            chapter_content = Scene_chapter_generate(
+                lambda prompt: invoke_with_cleaning(llm_adapter, prompt),
+                prompt_text,
+                word_number,
+                max_tokens,
+                lang=chapter_lang_format
+            )
+        if not chapter_content:
+            chapter_content = invoke_with_cleaning(llm_adapter, prompt_text)
+    check_cancelled(cancel_token)
     if not chapter_content.strip():
         logging.warning("Generated chapter draft is empty.")
 
@@ -977,8 +1446,72 @@ def generate_chapter_draft(
     return chapter_content
 
 
+def generate_draft_candidates(
+    llm_adapter,
+    prompt_text: str,
+    num_candidates: int,
+    word_number: int,
+    characters_involved: str,
+    key_items: str,
+    chapter_summary: str,
+    embedding_interface_format: str,
+    embedding_api_key: str,
+    embedding_url: str,
+    embedding_model_name: str
+) -> List[dict]:
+    """
+    用同一提示词并发请求 num_candidates 份草稿（依靠采样得到不同结果），
+    再按字数、重复率、要素覆盖与摘要相似度打分，返回从高到低排序的候选列表。
+    """
+    with ThreadPoolExecutor(max_workers=num_candidates, thread_name_prefix="candidate") as executor:
+        futures = [executor.submit(invoke_with_cleaning, llm_adapter, prompt_text) for _ in range(num_candidates)]
+        texts = []
+        for i, future in enumerate(futures):
+            try:
+                texts.append(future.result())
+            except OperationCancelled:
+                raise
+            except Exception as e:
+                logging.warning(f"Draft candidate {i + 1} failed: {e}")
+                texts.append("")
+
+    try:
+        embedding_adapter = create_embedding_adapter(
+            embedding_interface_format,
+            embedding_api_key,
+            embedding_url,
+            embedding_model_name
+        )
+    except Exception as e:
+        logging.warning(f"Embedding adapter unavailable, candidates are scored without similarity: {e}")
+        embedding_adapter = None
+
+    ranked = score_draft_candidates(
+        texts,
+        word_number,
+        characters_involved=characters_involved,
+        key_items=key_items,
+        chapter_summary=chapter_summary,
+        embedding_adapter=embedding_adapter
+    )
+    for rank, candidate in enumerate(ranked, start=1):
+        logging.info(
+            f"[Draft] Rank {rank}: candidate {candidate['index'] + 1}, score={candidate['score']:.2f}, "
+            f"words={candidate['words']}, missing={candidate['missing']}, similarity={candidate['similarity']}"
+        )
+    return ranked
+
+
 # ============ 4) 定稿章节 ============
 
+def _write_text_atomic(path: str, content: str):
+    """先写临时文件再整体替换，避免定稿中断时留下写了一半的文件。"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
 def finalize_chapter(
     novel_number: int,
     word_number: int,
@@ -993,18 +1526,44 @@ def finalize_chapter(
     embedding_model_name: str,
     interface_format: str,
     max_tokens: int,
-    timeout: int = 600
-):
+    timeout: int = 600,
+    deadline_seconds: Optional[float] = None,
+    atomic: bool = False,
+    cancel_token: Optional[CancelToken] = None,
+    checkpoint: bool = False
+) -> dict:
     """
     对指定章节做最终处理：更新全局摘要、更新角色状态、插入向量库等。
     默认无需再做扩写操作，若有需要可在外部调用 enrich_chapter_text 处理后再定稿。
+
+    三个部分只依赖章节正文与各自的旧状态，并发执行，共用一个截止时间 deadline_seconds（默认等于 timeout）；
+    全部结束（或到期）后统一提交：
+    - atomic=False：逐部分回退，失败或超时的摘要/角色状态保留旧内容，向量库跳过本章；
+    - atomic=True：任一部分失败则什么都不提交，文件与向量库保持定稿前的状态。
+    返回各部分是否已提交，如 {"summary": True, "character_state": True, "vectors": False, "errors": {...}}，
+    errors 记录未提交部分的原因（见 FINALIZE_ERROR_*），可用 describe_finalize_status 生成说明。
+    各部分的模型调用使用一个随截止时间到期的子令牌：到期或 cancel_token 被取消时，
+    仍在进行的调用立即停止，不会在定稿返回后继续消耗 token。
+    cancel_token 被取消时不提交任何部分（与 atomic 失败相同），抛出 OperationCancelled。
+    checkpoint=True 时每个部分提交后记入断点（见 finalize_parts），重跑同一章时跳过已提交的部分，
+    避免中断后重跑把同一章的内容再次并入全局摘要与角色状态。
     """
+    status = {"summary": False, "character_state": False, "vectors": False, "errors": {}}
+    errors = status["errors"]
     chapters_dir = os.path.join(filepath, "chapters")
     chapter_file = os.path.join(chapters_dir, f"chapter_{novel_number}.txt")
     chapter_text = read_file(chapter_file).strip()
     if not chapter_text:
         logging.warning(f"Chapter {novel_number} is empty, cannot finalize.")
-        return
+        errors.update({name: FINALIZE_ERROR_EMPTY_CHAPTER for name in FINALIZE_PARTS})
+        return status
+
+    committed = set(load_committed_parts(filepath, novel_number)) if checkpoint else set()
+    if committed:
+        logging.info(f"Chapter {novel_number}: {sorted(committed)} already committed by an earlier run, skipped.")
+        status.update({name: True for name in committed})
+        if all(name in committed for name in FINALIZE_PARTS):
+            return status
 
     # 进行摘要、角色状态更新
     global_summary_file = os.path.join(filepath, "global_summary.txt")
@@ -1013,6 +1572,8 @@ def finalize_chapter(
     character_state_file = os.path.join(filepath, "character_state.txt")
     old_character_state = read_file(character_state_file)
 
+    deadline = timeout if deadline_seconds is None else deadline_seconds
+    part_token = CancelToken(deadline_seconds=deadline, parent=cancel_token)
     llm_adapter = create_llm_adapter(
         interface_format=interface_format,
         base_url=base_url,
@@ -1020,43 +1581,106 @@ def finalize_chapter(
         api_key=api_key,
         temperature=temperature,
         max_tokens=max_tokens,
-        timeout=timeout
-    )
-
-    # 更新全局摘要
-    prompt_summary = summary_prompt.format(
-        chapter_text=chapter_text,
-        global_summary=old_global_summary
+        timeout=timeout,
+        cancel_token=part_token
     )
-    new_global_summary = invoke_with_cleaning(llm_adapter, prompt_summary)
-    if not new_global_summary.strip():
-        new_global_summary = old_global_summary
-
-    # 更新角色状态
-    prompt_char_state = update_character_state_prompt.format(
-        chapter_text=chapter_text,
-        old_state=old_character_state
-    )
-    new_char_state = invoke_with_cleaning(llm_adapter, prompt_char_state)
-    if not new_char_state.strip():
-        new_char_state = old_character_state
-
-    clear_file_content(global_summary_file)
-    save_string_to_txt(new_global_summary, global_summary_file)
-
-    clear_file_content(character_state_file)
-    save_string_to_txt(new_char_state, character_state_file)
-
-    # 更新向量库
     embedding_adapter = create_embedding_adapter(
         embedding_interface_format,
         embedding_api_key,
         embedding_url,
         embedding_model_name
     )
-    update_vector_store(embedding_adapter, chapter_text, filepath)
+
+    def update_summary():
+        # 更新全局摘要
+        prompt_summary = summary_prompt.format(
+            chapter_text=chapter_text,
+            global_summary=old_global_summary
+        )
+        return invoke_with_cleaning(llm_adapter, prompt_summary)
+
+    def update_character_state():
+        # 更新角色状态
+        prompt_char_state = update_character_state_prompt.format(
+            chapter_text=chapter_text,
+            old_state=old_character_state
+        )
+        return invoke_with_cleaning(llm_adapter, prompt_char_state)
+
+    def prepare_vectors():
+        # 切分并算好向量，提交时再写入向量库
+        return prepare_chapter_segments(embedding_adapter, chapter_text, filepath, embed=True)
+
+    parts = {"summary": update_summary, "character_state": update_character_state, "vectors": prepare_vectors}
+    start = time.time()
+    futures = run_parts_until_deadline(
+        {name: func for name, func in parts.items() if name not in committed},
+        part_token,
+        cancel_token
+    )
+    vectors_future = futures.get("vectors")
+
+    if cancel_token is not None and cancel_token.cancelled:
+        logging.warning(f"Chapter {novel_number} finalize cancelled, nothing committed.")
+        if vectors_future is None:
+            pass
+        elif vectors_future.done():
+            if not vectors_future.exception():
+                discard_chapter_segments(filepath, vectors_future.result())
+        else:
+            vectors_future.add_done_callback(
+                lambda f: discard_chapter_segments(filepath, f.result()) if not f.exception() else None
+            )
+        cancel_token.raise_if_cancelled()
+
+    # 没有需要写入的分段（空章节或全部近重复）也算成功
+    results, ok, part_errors = collect_part_results(futures, allow_empty=("vectors",))
+    errors.update(part_errors)
+    ok.update({name: True for name in committed})
+    if vectors_future is not None and not vectors_future.done():
+        # 超时的准备结果到达后撤销其签名
+        vectors_future.add_done_callback(
+            lambda f: discard_chapter_segments(filepath, f.result()) if not f.exception() else None
+        )
+    logging.info(f"Finalize parts for chapter {novel_number} done in {time.time() - start:.1f}s: {ok}")
+
+    if atomic and not all(ok.values()):
+        logging.warning(f"Chapter {novel_number} finalize aborted, nothing committed (atomic mode).")
+        discard_chapter_segments(filepath, results.get("vectors"))
+        for name in FINALIZE_PARTS:
+            if name not in committed:
+                errors.setdefault(name, FINALIZE_ERROR_ABORTED)
+        return status
+
+    # 提交：先写向量库（最可能失败），再替换摘要与角色状态文件；已提交的部分不再写入
+    check_cancelled(cancel_token)
+    if ok["vectors"] and "vectors" not in committed:
+        prepared = results.get("vectors")
+        if prepared:
+            status["vectors"] = commit_chapter_segments(embedding_adapter, filepath, prepared)
+        else:
+            status["vectors"] = True
+        if not status["vectors"]:
+            errors["vectors"] = FINALIZE_ERROR_FAILED
+        elif checkpoint:
+            mark_part_committed(filepath, novel_number, "vectors")
+        if atomic and not status["vectors"]:
+            logging.warning(f"Chapter {novel_number} finalize aborted, vector store write failed (atomic mode).")
+            errors.setdefault("summary", FINALIZE_ERROR_ABORTED)
+            errors.setdefault("character_state", FINALIZE_ERROR_ABORTED)
+            return status
+
+    for name, path in (("summary", global_summary_file), ("character_state", character_state_file)):
+        if name in committed:
+            continue
+        if ok[name]:
+            _write_text_atomic(path, results[name])
+            if checkpoint:
+                mark_part_committed(filepath, novel_number, name)
+        status[name] = ok[name]
 
     logging.info(f"Chapter {novel_number} has been finalized.")
+    return status
 
 
 def enrich_chapter_text(
@@ -1068,10 +1692,17 @@ def enrich_chapter_text(
     temperature: float,
     interface_format: str,
     max_tokens: int,
-    timeout: int=600
+    timeout: int=600,
+    cancel_token: Optional[CancelToken] = None,
+    scene_parallel: bool = False,
+    chapter_lang_format: str = "中文"
 ) -> str:
     """
     对章节文本进行扩写，使其更接近 word_number 字数，保持剧情连贯。
+    scene_parallel=True 且目标字数超过单次调用的输出能力时，以原文为依据规划场景并并行扩写各场景，
+    每次调用只需输出一个场景；场景模式失败时回退为整章一次扩写。
+    chapter_lang_format 决定字数按字符（中日韩）还是按单词估算单次调用的输出能力。
+    cancel_token 被取消时抛出 OperationCancelled。
     """
     llm_adapter = create_llm_adapter(
         interface_format=interface_format,
@@ -1080,13 +1711,34 @@ def enrich_chapter_text(
         api_key=api_key,
         temperature=temperature,
         max_tokens=max_tokens,
-        timeout=timeout
+        timeout=timeout,
+        cancel_token=cancel_token
     )
     prompt = f"""以下章节文本较短，请在保持剧情连贯的前提下进行扩写，使其更充实，接近 {word_number} 字左右：
 原内容：
 {chapter_text}
 """
-    enriched_text = invoke_with_cleaning(llm_adapter, prompt)
+    enriched_text = ""
+    if scene_parallel and should_use_scene_mode(word_number, max_tokens, chapter_lang_format):
+        logging.info("Enriching chapter scene by scene in parallel.")
+        # 原文不放入共享要求，由分场景生成按场景切片后只发送各自对应的部分
+        chapter_request = f"""以下章节文本较短，需要在保持剧情走向、人物与已有细节的前提下扩写为约 {word_number} 字的完整章节，原文随后按场景分片提供。
+
+格式要求：
+- 仅返回章节正文文本；
+- 不使用分章节小标题；
+- 不要使用markdown格式。
+"""
+        enriched_text = Scene_chapter_generate(
+            lambda p: invoke_with_cleaning(llm_adapter, p),
+            chapter_request,
+            word_number,
+            max_tokens,
+            source_text=chapter_text,
+            lang=chapter_lang_format
+        )
+    if not enriched_text:
+        enriched_text = invoke_with_cleaning(llm_adapter, prompt)
     return enriched_text if enriched_text else chapter_text
 
 
@@ -1094,83 +1746,8 @@ def enrich_chapter_text(
 
 def advanced_split_content(content: str,
                            similarity_threshold: float = 0.7,
-                           max_length: int = 500) -> List[str]:
-    nltk.download('punkt', quiet=True)
-    nltk.download('punkt_tab', quiet=True)
-    sentences = nltk.sent_tokenize(content)
-    if not sentences:
-        return []
-
-    model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
-    embeddings = model.encode(sentences)
-
-    merged_paragraphs = []
-    current_sentences = [sentences[0]]
-    current_embedding = embeddings[0]
-
-    for i in range(1, len(sentences)):
-        sim = cosine_similarity([current_embedding], [embeddings[i]])[0][0]
-        if sim >= similarity_threshold:
-            current_sentences.append(sentences[i])
-            current_embedding = (current_embedding + embeddings[i]) / 2.0
-        else:
-            merged_paragraphs.append(" ".join(current_sentences))
-            current_sentences = [sentences[i]]
-            current_embedding = embeddings[i]
-
-    if current_sentences:
-        merged_paragraphs.append(" ".join(current_sentences))
-
-    final_segments = []
-    for para in merged_paragraphs:
-        if len(para) > max_length:
-            sub_segments = split_by_length(para, max_length=max_length)
-            final_segments.extend(sub_segments)
-        else:
-            final_segments.append(para)
-
-    return final_segments
-
-def import_knowledge_file(
-    embedding_api_key: str,
-    embedding_url: str,
-    embedding_interface_format: str,
-    embedding_model_name: str,
-    file_path: str,
-    filepath: str
-):
-    logging.info(f"开始导入知识库文件: {file_path}, 接口格式: {embedding_interface_format}, 模型: {embedding_model_name}")
-    if not os.path.exists(file_path):
-        logging.warning(f"知识库文件不存在: {file_path}")
-        return
-
-    content = read_file(file_path)
-    if not content.strip():
-        logging.warning("知识库文件内容为空。")
-        return
-
-    paragraphs = advanced_split_content(content)
-
-    embedding_adapter = create_embedding_adapter(
-        interface_format=embedding_interface_format,
-        api_key=embedding_api_key,
-        base_url=embedding_url if embedding_url else "http://localhost:11434/api",
-        model_name=embedding_model_name
-    )
-
-    store = load_vector_store(embedding_adapter, filepath)
-    if not store:
-        logging.info("Vector store does not exist or load failed. Initializing a new one for knowledge import...")
-        store = init_vector_store(embedding_adapter, paragraphs, filepath)
-        if store:
-            logging.info("知识库文件已成功导入至向量库(新初始化)。")
-        else:
-            logging.warning("知识库导入失败，跳过。")
-    else:
-        try:
-            docs = [Document(page_content=str(p)) for p in paragraphs]
-            store.add_documents(docs)
-            logging.info("知识库文件已成功导入至向量库(追加模式)。")
-        except Exception as e:
-            logging.warning(f"知识库导入失败: {e}")
-            traceback.print_exc()
+                           max_length: int = 500,
+                           overlap: int = DEFAULT_SEGMENT_OVERLAP) -> List[str]:
+    """知识库导入使用的分段，与章节分段共用同一套语义合并流程。"""
+    return split_text_semantic(content, similarity_threshold=similarity_threshold,
+                               max_length=max_length, overlap=overlap)
@@ -0,0 +1,321 @@
+# pipeline_scheduler.py
+# -*- coding: utf-8 -*-
+"""
+带持久化日志的流水线调度：把生成流程的各阶段（架构步骤、目录分块、每章草稿/定稿）建模为依赖图，
+依赖都已完成的节点并发执行（不超过并发上限），每个节点的开始/完成/失败追加写入项目目录下的
+pipeline_journal.jsonl。进程崩溃或中断后重新运行，已完成的节点直接复用结果，未完成的节点重新执行。
+
+同一项目同一时间只允许一个调度进程（pipeline.lock），进程内每个节点只会被提交一次，
+因此任一节点最多只有一个正在运行的执行。
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import traceback
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from step_graph import Step, run_step_graph
+
+JOURNAL_FILE_NAME = "pipeline_journal.jsonl"
+LOCK_FILE_NAME = "pipeline.lock"
+# 日志行数超过该值时，运行前压缩为每个节点一条最终记录
+JOURNAL_COMPACT_LINES = 2000
+
+EVENT_START = "start"
+EVENT_DONE = "done"
+EVENT_FAILED = "failed"
+EVENT_RESET = "reset"
+
+
+class PipelineNode(Step):
+    """
+    流水线节点。除 Step 的参数外，existing() 可返回节点产物已存在时的结果
+    （例如界面中已生成过的架构文件），日志中没有该节点记录时据此直接视为已完成。
+    节点的结果会写入日志，需可被 JSON 序列化。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        deps: List[str],
+        run: Callable[[Dict[str, Any]], Any],
+        label: str = "",
+        existing: Optional[Callable[[], Any]] = None
+    ):
+        super().__init__(name, deps, run, label)
+        self.existing = existing
+
+
+# ============ 进程互斥 ============
+
+# Windows 下锁定 pid 之后的一个字节，其他进程仍可读取 pid 用于提示
+_WIN_LOCK_OFFSET = 64
+
+
+def _try_lock(fd: int) -> bool:
+    """对已打开的锁文件加非阻塞的排他锁，已被占用时返回 False。锁随文件关闭或进程退出自动释放。"""
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+            os.lseek(fd, _WIN_LOCK_OFFSET, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int):
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+            os.lseek(fd, _WIN_LOCK_OFFSET, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    except OSError:
+        pass
+
+
+class PipelineBusyError(RuntimeError):
+    """该项目已有其他进程在运行流水线。"""
+
+
+class ProjectLock:
+    """
+    项目级互斥锁：在整个运行期间对 pipeline.lock 持有操作系统的文件锁（fcntl.flock / msvcrt.locking），
+    持有进程崩溃时锁由系统释放，不需要判断残留的锁是否过期。文件中记录持有者 pid，仅用于提示。
+    锁按打开的文件区分，同一进程内的两个 ProjectLock 也互斥。锁文件在释放后保留，不删除。
+    """
+
+    def __init__(self, filepath: str):
+        self.path = os.path.join(filepath, LOCK_FILE_NAME)
+        self.fd: Optional[int] = None
+
+    @property
+    def acquired(self) -> bool:
+        return self.fd is not None
+
+    def _read_owner(self) -> str:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return f.read(_WIN_LOCK_OFFSET).strip() or "unknown"
+        except OSError:
+            return "unknown"
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not _try_lock(fd):
+            os.close(fd)
+            raise PipelineBusyError(
+                f"Pipeline is already running in process {self._read_owner()} ({self.path})."
+            )
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode("utf-8"))
+        except OSError as e:
+            logging.warning(f"Failed to record the owner of pipeline lock {self.path}: {e}")
+        self.fd = fd
+
+    def release(self):
+        if self.fd is not None:
+            _unlock(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+# ============ 持久化日志 ============
+
+class JobJournal:
+    """
+    追加写入的 JSONL 节点日志，每行一个事件：
+      {"ts", "node", "event": start|done|failed|reset, "pid", "result"?, "error"?}
+    按顺序重放得到每个节点的最终状态；只有 start 没有后续事件的节点是上次运行中被中断的节点。
+    """
+
+    def __init__(self, filepath: str):
+        self.path = os.path.join(filepath, JOURNAL_FILE_NAME)
+        self.lock = threading.Lock()
+        self.states: Dict[str, dict] = {}
+        self.line_count = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                self.line_count += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 崩溃时写了一半的最后一行
+                    logging.warning("Skipped a truncated line in the pipeline journal.")
+                    continue
+                self._apply(record)
+        for name, state in self.states.items():
+            if state["status"] == EVENT_START:
+                logging.warning(f"Node '{name}' was interrupted in a previous run, it will run again.")
+
+    def _apply(self, record: dict):
+        name = record.get("node")
+        event = record.get("event")
+        if not name or not event:
+            return
+        if event == EVENT_RESET:
+            self.states.pop(name, None)
+            return
+        state = self.states.setdefault(name, {"status": "", "attempts": 0})
+        state["status"] = event
+        state["ts"] = record.get("ts", "")
+        if event == EVENT_START:
+            state["attempts"] += 1
+        elif event == EVENT_DONE:
+            state["result"] = record.get("result")
+        elif event == EVENT_FAILED:
+            state["error"] = record.get("error", "")
+
+    def _append(self, record: dict):
+        record = {"ts": time.strftime("%Y-%m-%d %H:%M:%S"), "pid": os.getpid(), **record}
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(record)
+
+    def start(self, name: str):
+        self._append({"node": name, "event": EVENT_START})
+
+    def done(self, name: str, result: Any):
+        self._append({"node": name, "event": EVENT_DONE, "result": result})
+
+    def failed(self, name: str, error: str):
+        self._append({"node": name, "event": EVENT_FAILED, "error": error})
+
+    def reset(self, name: str):
+        if name in self.states:
+            self._append({"node": name, "event": EVENT_RESET})
+
+    def completed(self) -> Dict[str, Any]:
+        """已完成节点的结果。"""
+        with self.lock:
+            return {n: s.get("result") for n, s in self.states.items() if s["status"] == EVENT_DONE}
+
+    def compact(self):
+        """按当前状态重写日志（每个节点一条记录），原子替换。"""
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for name, state in self.states.items():
+                        record = {"ts": state.get("ts", ""), "node": name, "event": state["status"]}
+                        if state["status"] == EVENT_DONE:
+                            record["result"] = state.get("result")
+                        elif state["status"] == EVENT_FAILED:
+                            record["error"] = state.get("error", "")
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                os.replace(tmp_path, self.path)
+                self.line_count = len(self.states)
+            except Exception as e:
+                logging.warning(f"Failed to compact pipeline journal: {e}")
+                traceback.print_exc()
+
+
+# ============ 调度 ============
+
+def run_pipeline(
+    filepath: str,
+    nodes: List[PipelineNode],
+    max_workers: int = 2,
+    reset: Iterable[str] = (),
+    on_result: Optional[Callable[[str, Any], None]] = None
+) -> bool:
+    """
+    在项目目录 filepath 下运行节点图：持有项目锁，从日志恢复已完成节点，
+    其余节点按依赖并发执行（最多 max_workers 个），每个事件立即写入日志。
+    reset 中的节点先清除已有记录（强制重新执行）。全部完成返回 True。
+    节点抛出异常或返回空结果视为失败，之后不再启动新节点，已在运行的节点照常完成并记录。
+    """
+    with ProjectLock(filepath):
+        journal = JobJournal(filepath)
+        if journal.line_count > JOURNAL_COMPACT_LINES:
+            journal.compact()
+        for name in reset:
+            journal.reset(name)
+
+        results = journal.completed()
+        for node in nodes:
+            if node.name in results or node.existing is None:
+                continue
+            try:
+                found = node.existing()
+            except Exception as e:
+                logging.warning(f"{node.label}: failed to check existing output: {e}")
+                found = None
+            if found:
+                logging.info(f"{node.label}: output already exists, skipped.")
+                results[node.name] = found
+                journal.done(node.name, found)
+
+        for node in nodes:
+            if node.name in results:
+                logging.info(f"{node.label}: already done, skipped.")
+
+        def handle_result(name: str, result: Any):
+            journal.done(name, result)
+            if on_result:
+                on_result(name, result)
+
+        return run_step_graph(
+            nodes,
+            results,
+            handle_result,
+            is_success=lambda r: r is not None and bool(str(r).strip()),
+            max_workers=max(1, max_workers),
+            on_start=journal.start,
+            on_error=journal.failed
+        )
+
+
+def journal_status(filepath: str) -> Dict[str, dict]:
+    """读取项目的节点状态（不加锁，只读），供命令行/界面展示进度。"""
+    return JobJournal(filepath).states if os.path.isfile(os.path.join(filepath, JOURNAL_FILE_NAME)) else {}
+
+
+# 节点状态在进度输出中的名称：只有 start 记录的节点正在运行或上次运行中被中断
+_STATUS_TEXT = {EVENT_START: "started", EVENT_DONE: "done", EVENT_FAILED: "failed"}
+
+
+def format_journal_status(states: Dict[str, dict]) -> List[str]:
+    """把节点状态整理为每个节点一行（按日志中首次出现的顺序），最后一行为各状态的计数。"""
+    lines = []
+    counts: Dict[str, int] = {}
+    for name, state in states.items():
+        status = _STATUS_TEXT.get(state["status"], state["status"])
+        counts[status] = counts.get(status, 0) + 1
+        line = f"{name:<24} {status:<8} attempts={state.get('attempts', 0)}  {state.get('ts', '')}"
+        if state["status"] == EVENT_FAILED and state.get("error"):
+            line += f"  {state['error']}"
+        lines.append(line)
+    lines.append(", ".join(f"{n} {s}" for s, n in counts.items()) if counts else "no nodes recorded")
+    return lines
@@ -209,6 +209,103 @@ chunked_chapter_blueprint_prompt = """\
 仅给出最终文本，不要解释任何内容。
 """
 
+# =============== 5.1 剧情弧线划分（长篇目录并行生成）===================
+arc_outline_prompt = """\
+根据小说架构：\n
+{novel_architecture}
+
+将全书{number_of_chapters}章划分为约{arc_count}个剧情弧线（卷），各弧线覆盖连续的章节区间，
+区间首尾相接，从第1章开始、到第{number_of_chapters}章结束。
+
+每个弧线需明确：
+- 弧线名称
+- 章节区间
+- 弧线概要：本阶段的主要冲突、关键转折、角色变化，以及弧线结束时的局面（100字以内）
+
+输出格式示例：
+第1弧 - [弧线名称]
+章节区间：第1章-第40章
+弧线概要：[...]
+
+第2弧 - [弧线名称]
+章节区间：第41章-第85章
+弧线概要：[...]
+
+仅给出最终文本，不要解释任何内容。
+"""
+
+arc_chapter_blueprint_prompt = """\
+根据小说架构：\n
+{novel_architecture}
+
+全书共{number_of_chapters}章，剧情弧线划分如下：
+{arc_outline}
+
+当前弧线：
+{current_arc}
+
+下一弧线（当前弧线结尾需为其做好铺垫；若为空则说明当前为最后一个弧线）：
+{next_arc}
+
+衔接参考（紧邻本段之前的内容；若为空则说明从全书开头开始）：
+{previous_tail}
+
+现在请设计第{n}章到第{m}章的节奏分布，剧情需落在当前弧线之内，并自然承接衔接参考：
+1. 章节集群划分：
+- 每3-5章构成一个悬念单元，包含完整的小高潮
+- 单元之间设置"认知过山车"（连续2章紧张→1章缓冲）
+- 关键转折章需预留多视角铺垫
+
+2. 每章需明确：
+- 章节定位（角色/事件/主题等）
+- 核心悬念类型（信息差/道德困境/时间压力等）
+- 情感基调迁移（如从怀疑→恐惧→决绝）
+- 伏笔操作（埋设/强化/回收）
+- 认知颠覆强度（1-5级）
+
+输出格式示例：
+第n章 - [标题]
+本章定位：[角色/事件/主题/...]
+核心作用：[推进/转折/揭示/...]
+悬念密度：[紧凑/渐进/爆发/...]
+伏笔操作：埋设(A线索)→强化(B矛盾)...
+认知颠覆：★☆☆☆☆
+本章简述：[一句话概括]
+
+第n+1章 - [标题]
+本章定位：[角色/事件/主题/...]
+核心作用：[推进/转折/揭示/...]
+悬念密度：[紧凑/渐进/爆发/...]
+伏笔操作：埋设(A线索)→强化(B矛盾)...
+认知颠覆：★☆☆☆☆
+本章简述：[一句话概括]
+
+要求：
+- 使用精炼语言描述，每章字数控制在100字以内。
+- 合理安排节奏，确保整体悬念曲线的连贯性。
+- 在生成{number_of_chapters}章前不要出现结局章节。
+- 只输出第{n}章到第{m}章，章节编号必须连续。
+
+仅给出最终文本，不要解释任何内容。
+"""
+
+blueprint_seam_prompt = """\
+以下是小说章节目录中两个剧情弧线的衔接处。
+
+前一弧线的结尾章节：
+{previous_entries}
+
+后一弧线《{next_arc_title}》的概要：
+{next_arc_summary}
+
+后一弧线的开头章节：
+{next_entries}
+
+请检查衔接处的时间线、人物状态与悬念承接是否连贯，在保持章节编号与格式不变的前提下，
+改写后一弧线开头的这些章节，使之自然承接前文；若已经连贯，原样输出。
+只输出第{n}章到第{m}章，不要解释任何内容。
+"""
+
 # =============== 6. 全局摘要更新 ===================
 summary_prompt = """\
 以下是新完成的章节文本：
@@ -455,4 +552,79 @@ next_chapter_draft_prompt = """\
 - 不使用分章节小标题；
 - 不要使用markdown格式。
 
-"""
\ No newline at end of file
+"""
+# =============== 9. 分场景生成（长章节） ===================
+# 9.1 场景规划：在完整的草稿/扩写要求之后附加，先规划场景而不写正文
+chapter_scene_plan_prompt = """\
+{chapter_request}
+
+---
+现在先不要写正文。请把本章拆分为{scene_count}个连续的场景，场景之间首尾相接，合计约{word_number}字，
+最后一个场景承担本章结尾的"钩链转折"。
+
+每个场景需明确：
+- 场景标题
+- 目标字数
+- 场景内容：出场人物、地点、主要事件与冲突、情绪走向，以及场景结束时的落点（100字以内）
+
+输出格式示例：
+场景1 - [场景标题]
+目标字数：1500
+场景内容：[...]
+
+场景2 - [场景标题]
+目标字数：1800
+场景内容：[...]
+
+仅给出最终文本，不要解释任何内容。
+"""
+
+# 9.2 单个场景的正文
+chapter_scene_prompt = """\
+{chapter_request}
+
+---
+本章已拆分为以下场景：
+{scene_plan}
+
+上一场景的规划（若为空则说明当前为本章第一个场景）：
+{previous_scene}
+
+下一场景的规划（若为空则说明当前为本章最后一个场景）：
+{next_scene}
+
+现在只写场景{scene_index}《{scene_title}》的正文，约{scene_words}字：
+{scene_summary}
+{scene_source}
+要求：
+- 开头承接上一场景的落点，结尾停在本场景的落点，为下一场景留出衔接，不要提前写下一场景的内容；
+- 仅返回本场景的正文文本，不使用小标题，不要使用markdown格式。
+"""
+
+# 9.3 场景衔接处修订
+scene_seam_prompt = """\
+以下是同一章节中相邻两个场景的衔接处。
+
+前一场景的结尾段：
+{previous_tail}
+
+后一场景的开头段：
+{next_head}
+
+请检查衔接处的时间、地点、人物动作与情绪是否连贯，去掉重复交代的内容，必要时补充简短的过渡，
+在不改变剧情的前提下改写这两段，使之自然衔接。
+输出时先写改写后的前一场景结尾段，再单独一行写"{separator}"，再写改写后的后一场景开头段；
+若已经连贯，原样输出。不要解释任何内容。
+"""
+
+# 9.4 扩写时场景规划所附的原文（按片段编号，每个片段对应一个场景）
+scene_source_plan_suffix = """
+原内容（已按顺序分为{fragment_count}个片段，请为每个片段规划一个场景，场景数与片段数相同）：
+{fragments}
+"""
+
+# 9.5 扩写时单个场景所附的原文片段
+scene_source_prompt = """
+本场景对应的原文片段（在此基础上扩写，保留其中的情节与细节）：
+{source}
+"""
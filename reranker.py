@@ -0,0 +1,74 @@
+# reranker.py
+# -*- coding: utf-8 -*-
+"""
+检索结果的本地 cross-encoder 重排序。
+模型在首次使用时加载且全进程只加载一次；打分放在单独的工作线程中执行，
+超过时间上限则放弃重排序，沿用向量检索的原始顺序。
+"""
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional
+
+# 多语言 MiniLM cross-encoder，CPU 上对几十条候选打分约百毫秒级
+DEFAULT_RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+_model = None
+_model_name = None
+_model_lock = threading.Lock()
+# 单线程执行：模型加载/打分超时后仍在后台完成，下一次调用可直接复用已加载的模型
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+
+def _get_model(model_name: str):
+    global _model, _model_name
+    with _model_lock:
+        if _model is None or _model_name != model_name:
+            from sentence_transformers import CrossEncoder
+            start = time.time()
+            _model = CrossEncoder(model_name)
+            _model_name = model_name
+            logging.info(f"Rerank model '{model_name}' loaded in {time.time() - start:.2f}s.")
+        return _model
+
+
+def _score(query: str, candidates: List[str], model_name: str) -> List[float]:
+    model = _get_model(model_name)
+    # 一次批量打分
+    scores = model.predict([(query, c) for c in candidates])
+    return [float(s) for s in scores]
+
+
+def rerank(
+    query: str,
+    candidates: List[str],
+    top_n: Optional[int] = None,
+    timeout: float = 2.0,
+    model_name: str = DEFAULT_RERANK_MODEL
+) -> List[str]:
+    """
+    用 cross-encoder 对 candidates 重新排序并返回前 top_n 条。
+    模型加载或打分失败、耗时超过 timeout 秒时，返回原顺序的前 top_n 条。
+    """
+    if top_n is None:
+        top_n = len(candidates)
+    if len(candidates) <= 1 or not query.strip():
+        return candidates[:top_n]
+
+    start = time.time()
+    future = _executor.submit(_score, query, candidates, model_name)
+    try:
+        scores = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        logging.warning(f"Rerank exceeded {timeout}s, falling back to vector order.")
+        return candidates[:top_n]
+    except Exception as e:
+        logging.warning(f"Rerank failed, falling back to vector order: {e}")
+        traceback.print_exc()
+        return candidates[:top_n]
+
+    order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+    logging.info(f"Reranked {len(candidates)} candidates in {time.time() - start:.2f}s.")
+    return [candidates[i] for i in order[:top_n]]
@@ -0,0 +1,312 @@
+# scene_chapter.py
+# -*- coding: utf-8 -*-
+"""
+长章节的分场景并行生成：
+1. 一次调用在完整的章节要求（草稿提示词或扩写要求）之后规划场景：标题、目标字数、场景内容；
+2. 各场景并行生成正文，共用同一份章节要求，并附带全部场景规划与相邻场景的规划作为衔接参考，
+   每个场景的目标字数都在单次调用的 max_tokens 能容纳的范围内；
+3. 按顺序拼接，并在相邻场景的衔接处（前一场景的最后一段 + 后一场景的第一段）并行做一次连贯性修订。
+规划的场景合计字数不足时，把篇幅大的场景拆为多个部分，保证各场景目标字数之和不低于本章字数。
+扩写时原文按段落切为片段：规划调用附带一次全部片段，各场景只附带自己对应的片段。
+开启分场景生成（scene_parallel）且目标字数超过单次调用的输出上限时，草稿生成与扩写改用该方式，
+不再需要整章重发的扩写二次调用。中日韩语言的字数按字符计，其他语言按单词计。
+"""
+import re
+import math
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from cancellation import OperationCancelled
+from utils import count_chinese_and_english
+from prompt_definitions import (
+    chapter_scene_plan_prompt,
+    chapter_scene_prompt,
+    scene_seam_prompt,
+    scene_source_plan_suffix,
+    scene_source_prompt
+)
+
+# 每个汉字大约消耗的输出 token 数（偏保守）
+TOKENS_PER_CHAR = 1.5
+# 非中日韩语言的字数按单词计，每个单词（含标点、空格）大约消耗的输出 token 数（偏保守）
+TOKENS_PER_WORD = 1.8
+_CJK_LANGUAGES = ("中文", "汉语", "简体", "繁体", "chinese", "日文", "日语", "japanese", "韩文", "韩语", "korean")
+_CJK_LANGUAGE_CODES = ("zh", "ja", "ko")
+# 单次调用按 max_tokens 的该比例估算可稳定输出的长度
+SAFE_OUTPUT_RATIO = 0.6
+# 单个场景的目标字数上限（模型单次输出通常难以稳定超过该长度）
+SCENE_MAX_WORDS = 2000
+MIN_SCENES = 2
+MAX_SCENES = 12
+# 单个场景的最小目标字数
+SCENE_MIN_WORDS = 200
+SEAM_SEPARATOR = "=====衔接分隔====="
+
+_SCENE_HEAD = re.compile(r'^\s*场景\s*(\d+)\s*[-—:：]?\s*\[?(.*?)\]?\s*$', re.MULTILINE)
+_SCENE_WORDS = re.compile(r'目标字数[:：]\s*(\d+)')
+_SCENE_SUMMARY = re.compile(r'场景内容[:：]\s*\[?(.*?)\]?\s*$', re.MULTILINE | re.DOTALL)
+
+
+# ============ 场景数估算 ============
+
+def is_cjk_language(lang: str) -> bool:
+    """章节语言是否按字符计字数（中日韩），未指定时视为中文。"""
+    lang = (lang or "中文").strip().lower()
+    if lang.replace("_", "-").split("-")[0] in _CJK_LANGUAGE_CODES:
+        return True
+    return any(name in lang for name in _CJK_LANGUAGES)
+
+
+def single_call_capacity(max_tokens: int, lang: str = "中文") -> int:
+    """单次调用可稳定输出的字数估计（中日韩语言为字符数，其他语言为单词数）。"""
+    tokens_per_word = TOKENS_PER_CHAR if is_cjk_language(lang) else TOKENS_PER_WORD
+    return int(max_tokens * SAFE_OUTPUT_RATIO / tokens_per_word)
+
+
+def should_use_scene_mode(word_number: int, max_tokens: int, lang: str = "中文") -> bool:
+    """目标字数超过单次调用的输出能力时才需要分场景生成。"""
+    return word_number > single_call_capacity(max_tokens, lang)
+
+
+def scene_words_limit(max_tokens: int, lang: str = "中文") -> int:
+    return max(SCENE_MIN_WORDS, min(SCENE_MAX_WORDS, single_call_capacity(max_tokens, lang)))
+
+
+def suggested_scene_count(word_number: int, max_tokens: int, lang: str = "中文") -> int:
+    count = math.ceil(word_number / scene_words_limit(max_tokens, lang))
+    return max(MIN_SCENES, min(MAX_SCENES, count))
+
+
+# ============ 场景规划 ============
+
+def parse_scene_plan(plan_text: str) -> List[dict]:
+    """解析场景规划，返回 [{"title", "words", "summary"}]（按出现顺序）。"""
+    heads = list(_SCENE_HEAD.finditer(plan_text))
+    scenes = []
+    for i, head in enumerate(heads):
+        body_end = heads[i + 1].start() if i + 1 < len(heads) else len(plan_text)
+        body = plan_text[head.end():body_end]
+        words = _SCENE_WORDS.search(body)
+        summary = _SCENE_SUMMARY.search(body)
+        scenes.append({
+            "title": head.group(2).strip() or f"场景{i + 1}",
+            "words": int(words.group(1)) if words else 0,
+            "summary": summary.group(1).strip() if summary else body.strip(),
+        })
+    return scenes
+
+
+def normalize_scenes(scenes: List[dict], word_number: int, max_tokens: int, lang: str = "中文") -> List[dict]:
+    """
+    按规划中的目标字数比例把本章字数分配给各场景（未给出时平均分配）。
+    分到的字数超过单次调用输出能力的场景拆为多个部分，使各部分都不超过上限，
+    且合计不低于 word_number（总部分数超过 MAX_SCENES 时无法达到，记录警告）。
+    没有可用的场景时返回空列表。
+    """
+    if not scenes:
+        return []
+    scenes = scenes[:MAX_SCENES]
+    limit = scene_words_limit(max_tokens, lang)
+    planned = [s["words"] if s["words"] > 0 else 0 for s in scenes]
+    if not all(planned):
+        planned = [1] * len(scenes)
+    total = sum(planned)
+    shares = [word_number * weight / total for weight in planned]
+    parts = [max(1, math.ceil(share / limit)) for share in shares]
+    if len(scenes) < MIN_SCENES and sum(parts) < MIN_SCENES:
+        parts[0] = MIN_SCENES
+    if sum(parts) > MAX_SCENES:
+        logging.warning(
+            f"{word_number} words need more than {MAX_SCENES} scenes of at most {limit} words, the chapter may be short."
+        )
+
+    result = []
+    for scene, share, count in zip(scenes, shares, parts):
+        words = min(limit, max(SCENE_MIN_WORDS, math.ceil(share / count)))
+        # 拆分的场景把对应的原文片段也按段落分给各部分
+        sources = split_source_fragments(scene.get("source", ""), count) if count > 1 else []
+        for part in range(count):
+            item = {**scene, "index": len(result), "words": words}
+            if sources:
+                item["source"] = sources[part] if part < len(sources) else ""
+            if count > 1:
+                item["title"] = f"{scene['title']}（{part + 1}/{count}）"
+                item["summary"] = (
+                    f"{scene['summary']}（该场景分{count}部分写作，这是第{part + 1}部分，"
+                    f"只写对应的约{words}字，与前后部分首尾相接）"
+                )
+            result.append(item)
+            if len(result) >= MAX_SCENES:
+                return result
+    return result
+
+
+def split_source_fragments(text: str, count: int) -> List[str]:
+    """把原文按段落切成至多 count 个长度相近的片段（不会在段落中间切开）。"""
+    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+    if not paragraphs:
+        return []
+    count = max(1, min(count, len(paragraphs)))
+    target = sum(len(p) for p in paragraphs) / count
+    fragments, current, size = [], [], 0
+    for i, paragraph in enumerate(paragraphs):
+        current.append(paragraph)
+        size += len(paragraph)
+        remaining_paragraphs = len(paragraphs) - i - 1
+        remaining_fragments = count - len(fragments) - 1
+        if remaining_fragments > 0 and (size >= target or remaining_paragraphs == remaining_fragments):
+            fragments.append("\n".join(current))
+            current, size = [], 0
+    if current:
+        fragments.append("\n".join(current))
+    return fragments
+
+
+def attach_source_fragments(scenes: List[dict], fragments: List[str]) -> List[dict]:
+    """第 i 个规划场景对应第 i 个片段；片段多于场景时，多出的片段并入最后一个场景。"""
+    if not fragments:
+        return scenes
+    result = []
+    for i, scene in enumerate(scenes):
+        if i < len(fragments):
+            source = "\n".join(fragments[i:]) if i == len(scenes) - 1 else fragments[i]
+        else:
+            source = ""
+        result.append({**scene, "source": source})
+    return result
+
+
+def format_scene(scene: Optional[dict]) -> str:
+    if not scene:
+        return ""
+    return f"场景{scene['index'] + 1} - {scene['title']}（约{scene['words']}字）\n场景内容：{scene['summary']}"
+
+
+# ============ 场景正文 ============
+
+def generate_scene(invoke: Callable[[str], str], chapter_request: str, scenes: List[dict], index: int) -> str:
+    scene = scenes[index]
+    prompt = chapter_scene_prompt.format(
+        chapter_request=chapter_request,
+        scene_plan="\n\n".join(format_scene(s) for s in scenes),
+        previous_scene=format_scene(scenes[index - 1]) if index > 0 else "",
+        next_scene=format_scene(scenes[index + 1]) if index + 1 < len(scenes) else "",
+        scene_index=index + 1,
+        scene_title=scene["title"],
+        scene_words=scene["words"],
+        scene_summary=scene["summary"],
+        scene_source=scene_source_prompt.format(source=scene["source"]) if scene.get("source") else ""
+    )
+    logging.info(f"Generating scene {index + 1}/{len(scenes)} (~{scene['words']} chars) ...")
+    return invoke(prompt).strip()
+
+
+# ============ 衔接修订 ============
+
+def split_edges(text: str) -> Tuple[str, List[str], str]:
+    """拆分为 (第一段, 中间各段, 最后一段)；只有一段时视为只有结尾段。"""
+    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+    if not paragraphs:
+        return "", [], ""
+    if len(paragraphs) == 1:
+        return "", [], paragraphs[0]
+    return paragraphs[0], paragraphs[1:-1], paragraphs[-1]
+
+
+def smooth_seam(invoke: Callable[[str], str], previous_tail: str, next_head: str) -> Optional[Tuple[str, str]]:
+    """修订一处衔接，返回 (新的前一场景结尾段, 新的后一场景开头段)；结果无法解析时返回 None。"""
+    result = invoke(scene_seam_prompt.format(
+        previous_tail=previous_tail,
+        next_head=next_head,
+        separator=SEAM_SEPARATOR
+    ))
+    if SEAM_SEPARATOR not in result:
+        return None
+    tail, head = (part.strip() for part in result.split(SEAM_SEPARATOR, 1))
+    # 改写结果明显缩水时视为无效，保留原文
+    if not tail or not head or len(tail) + len(head) < 0.5 * (len(previous_tail) + len(next_head)):
+        return None
+    return tail, head
+
+
+def Scene_chapter_generate(
+    invoke: Callable[[str], str],
+    chapter_request: str,
+    word_number: int,
+    max_tokens: int,
+    max_workers: int = 4,
+    smooth_seams: bool = True,
+    source_text: str = "",
+    lang: str = "中文"
+) -> str:
+    """
+    按场景并行生成整章正文并返回；场景规划无法解析或有场景生成失败时返回空字符串，由调用方回退。
+    invoke(prompt) 负责调用模型并返回清理后的文本（可在多个线程中同时调用）。
+    chapter_request 为完整的章节要求（草稿提示词或扩写要求），作为各场景共享的上下文。
+    source_text 为扩写时的原文，不放入 chapter_request：规划时附带全部片段，各场景只附带对应的片段。
+    lang 为章节语言，决定字数按字符还是按单词估算单次调用的输出能力。
+    """
+    scene_count = suggested_scene_count(word_number, max_tokens, lang)
+    fragments = split_source_fragments(source_text, scene_count) if source_text.strip() else []
+    plan_request = chapter_request
+    if fragments:
+        scene_count = len(fragments)
+        plan_request += scene_source_plan_suffix.format(
+            fragment_count=len(fragments),
+            fragments="\n\n".join(f"【片段{i + 1}】\n{f}" for i, f in enumerate(fragments))
+        )
+    plan_text = invoke(chapter_scene_plan_prompt.format(
+        chapter_request=plan_request,
+        scene_count=scene_count,
+        word_number=word_number
+    ))
+    planned = attach_source_fragments(parse_scene_plan(plan_text), fragments)
+    scenes = normalize_scenes(planned, word_number, max_tokens, lang)
+    if not scenes:
+        logging.warning("Scene plan could not be parsed, scene mode skipped.")
+        return ""
+    logging.info(f"Chapter planned as {len(scenes)} scenes: {[s['words'] for s in scenes]}")
+
+    workers = max(1, min(max_workers, len(scenes)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scene") as executor:
+        futures = [executor.submit(generate_scene, invoke, chapter_request, scenes, i) for i in range(len(scenes))]
+        texts = []
+        for i, future in enumerate(futures):
+            try:
+                texts.append(future.result())
+            except OperationCancelled:
+                raise
+            except Exception as e:
+                logging.warning(f"Scene {i + 1} generation failed: {e}")
+                traceback.print_exc()
+                texts.append("")
+    if not all(texts):
+        logging.warning("Some scenes are empty, scene mode skipped.")
+        return ""
+
+    edges = [list(split_edges(t)) for t in texts]
+    if smooth_seams:
+        seam_indices = [i for i in range(len(edges) - 1) if edges[i][2] and edges[i + 1][0]]
+        if seam_indices:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(seam_indices))), thread_name_prefix="scene-seam") as executor:
+                futures = {i: executor.submit(smooth_seam, invoke, edges[i][2], edges[i + 1][0]) for i in seam_indices}
+                for i, future in futures.items():
+                    try:
+                        revised = future.result()
+                    except OperationCancelled:
+                        raise
+                    except Exception as e:
+                        logging.warning(f"Seam revision after scene {i + 1} failed, kept as is: {e}")
+                        continue
+                    if revised:
+                        edges[i][2], edges[i + 1][0] = revised
+
+    chapter_text = "\n".join(
+        "\n".join([p for p in [head] + body + [tail] if p]) for head, body, tail in edges
+    )
+    logging.info(
+        f"Scene-parallel chapter generated ({len(scenes)} scenes, {count_chinese_and_english(chapter_text)} words)."
+    )
+    return chapter_text
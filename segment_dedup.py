@@ -0,0 +1,271 @@
+# segment_dedup.py
+# -*- coding: utf-8 -*-
+"""
+写入向量库前的近重复分段过滤：
+每个分段按字符 shingle 计算 64 位 SimHash，与同一集合已写入分段的签名比较，
+汉明距离不超过阈值即视为重复而不写入。签名按集合持久化在向量库目录下，
+跨多次导入/定稿同样生效；清空向量库时随目录一起删除。
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import traceback
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+SIGNATURE_FILE_NAME = "segment_signatures.json"
+# 字符 shingle 长度（中日韩文本按字、其他文本按字母计）
+SHINGLE_SIZE = 4
+# 汉明距离不超过该值视为近重复（64 位 SimHash 的常用阈值）
+DEFAULT_MAX_DISTANCE = 3
+# 短于该长度的分段 SimHash 不稳定，只过滤完全相同的签名
+MIN_NEAR_DUP_CHARS = 30
+# 64 位签名拆成 4 段 16 位做分桶：距离 <=3 的两个签名至少有一段完全相同
+_BANDS = 4
+_BAND_BITS = 16
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_for_signature(text: str) -> str:
+    """去掉空白与标点并转小写，使排版差异不影响签名。"""
+    return _NON_WORD.sub("", text).lower()
+
+
+def simhash(text: str, shingle_size: int = SHINGLE_SIZE) -> int:
+    """计算文本的 64 位 SimHash（字符 shingle，稳定哈希，跨进程结果一致）。"""
+    import numpy as np
+
+    norm = normalize_for_signature(text)
+    if not norm:
+        return 0
+    if len(norm) <= shingle_size:
+        shingles = {norm}
+    else:
+        shingles = {norm[i:i + shingle_size] for i in range(len(norm) - shingle_size + 1)}
+
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+    # (n, 64) 位矩阵，按列统计 1 的个数，超过一半的位置 1
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    set_bits = np.flatnonzero(bits.sum(axis=0) * 2 > len(shingles))
+    value = 0
+    for b in set_bits.tolist():
+        value |= 1 << b
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SegmentSignatureIndex:
+    """单个向量库目录下、按集合划分的分段签名索引。"""
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.path = os.path.join(store_dir, SIGNATURE_FILE_NAME)
+        self.lock = threading.RLock()
+        # 每个集合的签名及其出现次数（不同分段可能得到相同签名）
+        self.signatures: Dict[str, Counter] = {}
+        self.bands: Dict[str, List[Dict[int, List[int]]]] = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for name, values in data.get("collections", {}).items():
+                self._reset_collection(name)
+                for v in values:
+                    self._add(name, int(v, 16))
+        except Exception as e:
+            logging.warning(f"Failed to load segment signature index, starting empty: {e}")
+            self.signatures.clear()
+            self.bands.clear()
+
+    def _reset_collection(self, name: str):
+        self.signatures[name] = Counter()
+        self.bands[name] = [{} for _ in range(_BANDS)]
+
+    def _add(self, name: str, sig: int):
+        self.signatures[name][sig] += 1
+        for i, band in enumerate(self.bands[name]):
+            band.setdefault((sig >> (i * _BAND_BITS)) & _BAND_MASK, []).append(sig)
+
+    def _remove(self, name: str, sig: int):
+        """移除一次该签名：只改动它所在的四个分桶，不重建整个集合的索引。"""
+        counts = self.signatures.get(name)
+        if not counts or not counts[sig]:
+            return
+        counts[sig] -= 1
+        if not counts[sig]:
+            del counts[sig]
+        for i, band in enumerate(self.bands[name]):
+            key = (sig >> (i * _BAND_BITS)) & _BAND_MASK
+            bucket = band.get(key)
+            if bucket:
+                bucket.remove(sig)
+                if not bucket:
+                    del band[key]
+
+    def _bootstrap_from_store(self, name: str):
+        """索引中还没有该集合时，从向量库中已有的分段补建签名（老项目首次启用时）。"""
+        self._reset_collection(name)
+        if not os.path.isdir(self.store_dir):
+            return
+        try:
+            import chromadb
+            from chromadb.config import Settings
+            client = chromadb.PersistentClient(path=self.store_dir, settings=Settings(anonymized_telemetry=False))
+            names = [c if isinstance(c, str) else c.name for c in client.list_collections()]
+            if name not in names:
+                return
+            collection = client.get_collection(name)
+            offset, page = 0, 1000
+            while True:
+                result = collection.get(include=["documents"], limit=page, offset=offset)
+                docs = result.get("documents") or []
+                for doc in docs:
+                    if doc:
+                        self._add(name, simhash(doc))
+                if len(docs) < page:
+                    break
+                offset += page
+            self.dirty = True
+            logging.info(
+                f"Built {sum(self.signatures[name].values())} segment signatures for '{name}' from the vector store."
+            )
+        except Exception as e:
+            logging.warning(f"Failed to build segment signatures for '{name}': {e}")
+            traceback.print_exc()
+
+    def find_duplicate(self, name: str, sig: int, text_len: int, max_distance: int = DEFAULT_MAX_DISTANCE) -> bool:
+        limit = max_distance if text_len >= MIN_NEAR_DUP_CHARS else 0
+        for i, band in enumerate(self.bands.get(name, [])):
+            for other in band.get((sig >> (i * _BAND_BITS)) & _BAND_MASK, ()):
+                if hamming_distance(sig, other) <= limit:
+                    return True
+        return False
+
+    def filter_indices(
+        self,
+        name: str,
+        segments: List[str],
+        max_distance: int = DEFAULT_MAX_DISTANCE
+    ) -> Tuple[List[int], List[int]]:
+        """
+        过滤与已有分段（以及本批中靠前分段）近重复的分段。
+        保留分段的签名立即计入索引，返回 (保留分段的下标, 对应签名)；写入失败时应调用 discard 撤销。
+        """
+        with self.lock:
+            if name not in self.signatures:
+                self._bootstrap_from_store(name)
+            kept, sigs = [], []
+            for i, seg in enumerate(segments):
+                sig = simhash(seg)
+                if self.find_duplicate(name, sig, len(seg), max_distance):
+                    continue
+                self._add(name, sig)
+                kept.append(i)
+                sigs.append(sig)
+            if sigs:
+                self.dirty = True
+            return kept, sigs
+
+    def add_signatures(self, name: str, sigs: List[int]):
+        """登记已在向量库中的分段签名（不做重复检查）。"""
+        if not sigs:
+            return
+        with self.lock:
+            if name not in self.signatures:
+                self._bootstrap_from_store(name)
+            for sig in sigs:
+                self._add(name, sig)
+            self.dirty = True
+
+    def discard(self, name: str, sigs: List[int]):
+        """撤销未能写入向量库的分段签名。"""
+        if not sigs:
+            return
+        with self.lock:
+            for sig in sigs:
+                self._remove(name, sig)
+            self.dirty = True
+
+    def clear(self, name: Optional[str] = None):
+        with self.lock:
+            if name is None:
+                self.signatures.clear()
+                self.bands.clear()
+            else:
+                self.signatures.pop(name, None)
+                self.bands.pop(name, None)
+            self.dirty = True
+
+    def save(self):
+        """原子写入签名文件（先写临时文件再替换）。"""
+        with self.lock:
+            if not self.dirty:
+                return
+            if not os.path.isdir(self.store_dir):
+                # 向量库目录不存在（尚未创建或已被清空），没有需要保存的签名
+                return
+            data = {
+                "version": 1,
+                "collections": {
+                    name: [format(s, "016x") for s in counts.elements()] for name, counts in self.signatures.items()
+                }
+            }
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+                self.dirty = False
+            except Exception as e:
+                logging.warning(f"Failed to save segment signature index: {e}")
+                traceback.print_exc()
+
+
+_indexes: Dict[str, SegmentSignatureIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_signature_index(store_dir: str) -> SegmentSignatureIndex:
+    """返回向量库目录对应的签名索引（进程内共享同一实例）。"""
+    key = os.path.abspath(store_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = SegmentSignatureIndex(key)
+            _indexes[key] = index
+        return index
+
+
+def invalidate_signature_index(store_dir: str, collection_name: Optional[str] = None):
+    """
+    向量库被清空或整体替换后调用：collection_name 为空时丢弃整个缓存（下次从文件重新加载），
+    否则只清除该集合的签名并保存。
+    """
+    key = os.path.abspath(store_dir)
+    with _indexes_lock:
+        if collection_name is None:
+            _indexes.pop(key, None)
+            return
+        index = _indexes.get(key)
+    if index is None:
+        index = get_signature_index(store_dir)
+    index.clear(collection_name)
+    index.save()
+
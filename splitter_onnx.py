@@ -0,0 +1,302 @@
+# splitter_onnx.py
+# -*- coding: utf-8 -*-
+"""
+切分模型的 ONNX 后端：把 MiniLM 句向量模型导出为 ONNX（可选 int8 动态量化），
+运行时只依赖 onnxruntime + tokenizers + numpy，不需要导入 PyTorch。
+输出与 sentence_transformers 相同（mean pooling，未归一化），可直接用于余弦相似度比较。
+
+用法：
+    python splitter_onnx.py export            # 导出 fp32 与 int8 模型（导出时需要 torch）
+    python splitter_onnx.py bench --file a.txt # 对比各后端的导入耗时、内存与吞吐
+    python splitter_onnx.py compare           # 对比 ONNX 与原模型输出的余弦一致性
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+from typing import List
+
+SPLITTER_ONNX_DIR = os.path.join(
+    getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__))),
+    "onnx_models"
+)
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+EXPORT_INFO_FILE = "export_info.json"
+
+SPLITTER_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def get_onnx_model_dir(model_name: str) -> str:
+    return os.path.join(SPLITTER_ONNX_DIR, model_name.replace("/", "__"))
+
+
+def onnx_model_available(model_name: str, quantized: bool = False) -> bool:
+    """检查 ONNX 模型文件是否已导出，以及 onnxruntime/tokenizers 是否可导入。"""
+    model_dir = get_onnx_model_dir(model_name)
+    model_file = ONNX_INT8_FILE if quantized else ONNX_FP32_FILE
+    if not os.path.isfile(os.path.join(model_dir, model_file)):
+        return False
+    if not os.path.isfile(os.path.join(model_dir, "tokenizer.json")):
+        return False
+    try:
+        import onnxruntime  # noqa: F401
+        import tokenizers  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class OnnxSentenceEncoder:
+    """
+    与 SentenceTransformer.encode 接口兼容的 ONNX 编码器（只实现切分流程用到的部分）。
+    """
+
+    def __init__(self, model_name: str, quantized: bool = False, num_threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = get_onnx_model_dir(model_name)
+        info = {}
+        info_path = os.path.join(model_dir, EXPORT_INFO_FILE)
+        if os.path.isfile(info_path):
+            with open(info_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        self.max_seq_length = int(info.get("max_seq_length", 128))
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=int(info.get("pad_token_id", 0)))
+
+        options = ort.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        model_file = ONNX_INT8_FILE if quantized else ONNX_FP32_FILE
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences: List[str], batch_size: int = 64, convert_to_numpy: bool = True, **kwargs):
+        import numpy as np
+
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        if not sentences:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # 按长度排序后分批，减少补齐的 token 数，最后再恢复原顺序
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+        outputs = [None] * len(sentences)
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start:start + batch_size]
+            encodings = self.tokenizer.encode_batch([sentences[i] for i in batch_idx])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # mean pooling，与 sentence_transformers 的 Pooling 层一致
+            mask = attention_mask[..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            counts = np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled = summed / counts
+            for row, i in enumerate(batch_idx):
+                outputs[i] = pooled[row]
+        return np.stack(outputs).astype(np.float32)
+
+
+def export_splitter_onnx(model_name: str, quantize: bool = True, opset: int = 14) -> str:
+    """
+    把 sentence_transformers 模型导出为 ONNX（需要 torch），quantize=True 时同时生成 int8 动态量化版本。
+    返回导出目录。
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = get_onnx_model_dir(model_name)
+    os.makedirs(model_dir, exist_ok=True)
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    tokenizer.save_pretrained(model_dir)
+
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids)[0]
+
+    dummy = tokenizer(["导出用的示例句子。", "An example sentence."], padding=True, return_tensors="pt")
+    fp32_path = os.path.join(model_dir, ONNX_FP32_FILE)
+    dynamic = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(transformer),
+            (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["token_embeddings"],
+            dynamic_axes={
+                "input_ids": dynamic,
+                "attention_mask": dynamic,
+                "token_type_ids": dynamic,
+                "token_embeddings": dynamic
+            },
+            opset_version=opset
+        )
+    logging.info(f"Exported ONNX splitter model to {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(model_dir, ONNX_INT8_FILE)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        logging.info(f"Exported int8 ONNX splitter model to {int8_path}")
+
+    with open(os.path.join(model_dir, EXPORT_INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "max_seq_length": st_model.max_seq_length,
+            "pad_token_id": tokenizer.pad_token_id or 0
+        }, f, ensure_ascii=False, indent=2)
+    return model_dir
+
+
+# ============ 基准与一致性检查 ============
+
+_SAMPLE_SENTENCES = [
+    "夜色降临，林远独自站在城墙上，望着远处的烽火。",
+    "她把那封信折好，塞进了袖口。",
+    "The old lighthouse keeper had not spoken to anyone in years.",
+    "Rain hammered the tin roof as the engine finally coughed to life.",
+    "王府的账册里少了三页，恰好是去年秋天的那几笔。",
+]
+
+
+def _load_benchmark_sentences(file_path: str = "") -> List[str]:
+    if not file_path:
+        return _SAMPLE_SENTENCES * 200
+    from text_splitter import sent_tokenize
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        return sent_tokenize(f.read())
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return 0.0
+
+
+def _bench_single_backend(backend: str, file_path: str) -> dict:
+    """在当前进程中测量单个后端（应在全新进程中运行，导入耗时与内存才有意义）。"""
+    start = time.time()
+    import text_splitter
+    # 入口处已导入过 text_splitter，环境变量不再生效，需显式切换后端
+    text_splitter.set_splitter_backend(backend)
+    model = text_splitter.get_splitter_model()
+    load_seconds = time.time() - start
+    # ONNX 模型不可用时 get_splitter_model 会回退到 torch，如实报告实际加载的后端
+    loaded = backend if backend == "torch" or isinstance(model, OnnxSentenceEncoder) else "torch"
+
+    sentences = _load_benchmark_sentences(file_path)
+    model.encode(sentences[:32], convert_to_numpy=True)
+    start = time.time()
+    model.encode(sentences, convert_to_numpy=True)
+    elapsed = max(time.time() - start, 1e-6)
+    return {
+        "backend": backend,
+        "loaded_backend": loaded,
+        "import_and_load_seconds": round(load_seconds, 2),
+        "rss_mb": round(_peak_rss_mb(), 1),
+        "sentences": len(sentences),
+        "sentences_per_sec": round(len(sentences) / elapsed, 1)
+    }
+
+
+def benchmark_backends(backends: List[str], file_path: str = "") -> List[dict]:
+    """每个后端在独立子进程中测量导入耗时、内存占用与每秒编码句数。"""
+    results = []
+    for backend in backends:
+        cmd = [sys.executable, os.path.abspath(__file__), "_bench_one", "--backend", backend]
+        if file_path:
+            cmd += ["--file", file_path]
+        proc = subprocess.run(cmd, capture_output=True, text=True, env={**os.environ, "SPLITTER_BACKEND": backend})
+        if proc.returncode != 0:
+            print(f"{backend:<10} failed: {proc.stderr.strip().splitlines()[-1:]}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(result)
+        if result.get("loaded_backend", backend) != backend:
+            print(f"{backend:<10} not available, measured {result['loaded_backend']} instead")
+        print(f"{backend:<10} load {result['import_and_load_seconds']:>6.2f}s  "
+              f"rss {result['rss_mb']:>8.1f}MB  {result['sentences_per_sec']:>10.1f} sentences/s")
+    return results
+
+
+def compare_with_torch(model_name: str, file_path: str = "") -> dict:
+    """计算 ONNX（fp32/int8）输出与原模型输出逐句的余弦相似度（均值与最小值）。"""
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+
+    sentences = _load_benchmark_sentences(file_path)[:1000]
+    reference = SentenceTransformer(model_name, device="cpu").encode(sentences, convert_to_numpy=True)
+    ref_unit = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    report = {}
+    for quantized in (False, True):
+        if not onnx_model_available(model_name, quantized):
+            continue
+        vectors = OnnxSentenceEncoder(model_name, quantized).encode(sentences)
+        unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        cos = np.einsum("ij,ij->i", unit, ref_unit)
+        key = "onnx-int8" if quantized else "onnx"
+        report[key] = {"mean_cosine": round(float(cos.mean()), 5), "min_cosine": round(float(cos.min()), 5)}
+        print(f"{key:<10} mean cosine {cos.mean():.5f}  min cosine {cos.min():.5f}")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    from text_splitter import SPLITTER_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="切分模型 ONNX 后端：导出、基准与一致性检查")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export", help="导出 ONNX 模型")
+    p_export.add_argument("--no-quantize", action="store_true", help="不生成 int8 量化模型")
+    p_bench = sub.add_parser("bench", help="对比各后端的导入耗时、内存与吞吐")
+    p_bench.add_argument("--file", default="", help="用于测试的文本文件（默认使用内置例句）")
+    p_bench.add_argument("--backends", nargs="+", default=list(SPLITTER_BACKENDS))
+    p_compare = sub.add_parser("compare", help="对比 ONNX 与原模型输出的余弦一致性")
+    p_compare.add_argument("--file", default="")
+    p_one = sub.add_parser("_bench_one")
+    p_one.add_argument("--backend", required=True)
+    p_one.add_argument("--file", default="")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_splitter_onnx(SPLITTER_MODEL_NAME, quantize=not args.no_quantize)
+    elif args.command == "bench":
+        benchmark_backends(args.backends, args.file)
+    elif args.command == "compare":
+        compare_with_torch(SPLITTER_MODEL_NAME, args.file)
+    else:
+        print(json.dumps(_bench_single_backend(args.backend, args.file)))
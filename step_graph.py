@@ -0,0 +1,111 @@
+# step_graph.py
+# -*- coding: utf-8 -*-
+"""
+按显式声明的依赖关系执行一组步骤：依赖都已完成的步骤并发执行，其余等待。
+任一步骤失败后不再启动新步骤，已在运行的步骤照常完成并保存结果，下次可从断点继续。
+"""
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Step:
+    """
+    一个步骤：name 为结果键名，deps 为所依赖步骤的 name，
+    run(results) 接收已完成步骤的结果字典并返回本步骤的结果。
+    """
+
+    def __init__(self, name: str, deps: List[str], run: Callable[[Dict[str, Any]], Any], label: str = ""):
+        self.name = name
+        self.deps = list(deps)
+        self.run = run
+        self.label = label or name
+
+
+def validate_step_graph(steps: List[Step]):
+    """检查依赖是否都已声明且不存在环，有问题时抛出 ValueError。"""
+    names = {s.name for s in steps}
+    for s in steps:
+        missing = [d for d in s.deps if d not in names]
+        if missing:
+            raise ValueError(f"Step '{s.name}' depends on undeclared steps: {missing}")
+    visiting, visited = set(), set()
+    by_name = {s.name: s for s in steps}
+
+    def visit(name: str):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Step graph has a cycle at '{name}'")
+        visiting.add(name)
+        for d in by_name[name].deps:
+            visit(d)
+        visiting.discard(name)
+        visited.add(name)
+
+    for s in steps:
+        visit(s.name)
+
+
+def run_step_graph(
+    steps: List[Step],
+    results: Dict[str, Any],
+    on_result: Callable[[str, Any], None],
+    is_success: Callable[[Any], bool] = lambda r: bool(r and str(r).strip()),
+    max_workers: Optional[int] = None,
+    on_start: Optional[Callable[[str], None]] = None,
+    on_error: Optional[Callable[[str, str], None]] = None
+) -> bool:
+    """
+    执行 steps 中 results 里尚未有结果的步骤，同时运行的步骤不超过 max_workers 个。
+    每个步骤成功后在调度线程中调用 on_result(name, result)（同一时间只有一个回调在执行，
+    回调内可直接写断点文件）；结果也会写入 results。
+    on_start(name) 在步骤提交前、on_error(name, message) 在步骤失败后调用，同样在调度线程中执行。
+    全部完成返回 True；有步骤失败或抛出异常返回 False。
+    """
+    validate_step_graph(steps)
+    pending = [s for s in steps if s.name not in results]
+    if not pending:
+        return True
+
+    workers = max_workers or len(pending)
+    running = {}
+    failed = False
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="step") as executor:
+        while pending or running:
+            if not failed:
+                for step in list(pending):
+                    if all(d in results for d in step.deps):
+                        logging.info(f"{step.label}: start ...")
+                        if on_start:
+                            on_start(step.name)
+                        # 传入结果字典的副本，运行中的步骤不会看到并发写入
+                        running[executor.submit(step.run, dict(results))] = step
+                        pending.remove(step)
+            if not running:
+                # 剩余步骤的依赖已无法满足
+                break
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.warning(f"{step.label} failed: {e}")
+                    traceback.print_exc()
+                    failed = True
+                    if on_error:
+                        on_error(step.name, str(e))
+                    continue
+                if not is_success(result):
+                    logging.warning(f"{step.label} returned empty result.")
+                    failed = True
+                    if on_error:
+                        on_error(step.name, "empty result")
+                    continue
+                results[step.name] = result
+                on_result(step.name, result)
+                logging.info(f"{step.label}: done.")
+    return not failed and not pending
@@ -0,0 +1,7 @@
+# tests/conftest.py
+# -*- coding: utf-8 -*-
+"""项目模块位于仓库根目录（平铺结构），测试时把根目录加入导入路径。"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
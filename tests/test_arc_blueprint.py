@@ -0,0 +1,52 @@
+# tests/test_arc_blueprint.py
+# -*- coding: utf-8 -*-
+from arc_blueprint import missing_ranges, normalize_arcs, parse_arc_outline
+
+
+def arc(title, start, end):
+    return {"title": title, "start": start, "end": end, "summary": ""}
+
+
+def spans(arcs):
+    return [(a["title"], a["start"], a["end"]) for a in arcs]
+
+
+def test_normalize_makes_arcs_contiguous_and_complete():
+    arcs = normalize_arcs([arc("B", 12, 18), arc("A", 1, 9), arc("C", 20, 40)], 30, 3)
+    assert spans(arcs) == [("A", 1, 9), ("B", 10, 18), ("C", 19, 30)]
+    assert [a["index"] for a in arcs] == [0, 1, 2]
+
+
+def test_normalize_drops_arc_inside_previous_one():
+    arcs = normalize_arcs([arc("A", 1, 10), arc("B", 5, 8), arc("C", 9, 20)], 20, 2)
+    assert spans(arcs) == [("A", 1, 10), ("C", 11, 20)]
+
+
+def test_normalize_trims_partial_overlap():
+    arcs = normalize_arcs([arc("A", 1, 10), arc("B", 8, 20)], 20, 2)
+    assert spans(arcs) == [("A", 1, 10), ("B", 11, 20)]
+
+
+def test_normalize_ignores_arcs_beyond_last_chapter():
+    arcs = normalize_arcs([arc("A", 1, 10), arc("B", 25, 30)], 20, 2)
+    assert spans(arcs) == [("A", 1, 20)]
+
+
+def test_normalize_falls_back_to_even_split():
+    arcs = normalize_arcs([], 25, 3)
+    assert [(a["start"], a["end"]) for a in arcs] == [(1, 9), (10, 18), (19, 25)]
+
+
+def test_parse_outline_reads_ranges_and_summaries():
+    text = "第1弧 - [开端]\n章节区间：第1章-第10章\n弧线概要：[主角离家]\n\n第2弧 - 转折\n章节区间：第11章至第20章\n弧线概要：遇敌"
+    assert parse_arc_outline(text) == [
+        {"title": "开端", "start": 1, "end": 10, "summary": "主角离家"},
+        {"title": "转折", "start": 11, "end": 20, "summary": "遇敌"},
+    ]
+
+
+def test_missing_ranges():
+    entries = {1: "", 2: "", 5: "", 8: ""}
+    assert missing_ranges(entries, 10) == [(3, 4), (6, 7), (9, 10)]
+    assert missing_ranges({n: "" for n in range(1, 6)}, 5) == []
+    assert missing_ranges({}, 3) == [(1, 3)]
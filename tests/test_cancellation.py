@@ -0,0 +1,71 @@
+# tests/test_cancellation.py
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+
+from cancellation import CancelToken, OperationCancelled, check_cancelled, run_cancellable
+
+
+class CancelTokenTest(unittest.TestCase):
+    def test_cancel_keeps_first_reason(self):
+        token = CancelToken()
+        token.cancel("stop")
+        token.cancel("again")
+        self.assertTrue(token.cancelled)
+        self.assertEqual(token.reason, "stop")
+
+    def test_deadline_counts_as_cancel(self):
+        token = CancelToken(deadline_seconds=0.05)
+        self.assertFalse(token.cancelled)
+        time.sleep(0.08)
+        self.assertTrue(token.cancelled)
+        self.assertEqual(token.reason, "deadline exceeded")
+        self.assertEqual(token.remaining(), 0.0)
+
+    def test_wait_returns_early_on_cancel(self):
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel).start()
+        start = time.monotonic()
+        self.assertTrue(token.wait(5))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_check_cancelled_accepts_none(self):
+        check_cancelled(None)
+        token = CancelToken()
+        token.cancel()
+        with self.assertRaises(OperationCancelled):
+            check_cancelled(token)
+
+
+class RunCancellableTest(unittest.TestCase):
+    def test_without_token_runs_inline(self):
+        self.assertEqual(run_cancellable(threading.current_thread, None), threading.current_thread())
+
+    def test_returns_value_and_reraises_error(self):
+        self.assertEqual(run_cancellable(lambda: 42, CancelToken()), 42)
+        with self.assertRaises(ValueError):
+            run_cancellable(lambda: int("x"), CancelToken())
+
+    def test_cancel_stops_waiting_for_slow_call(self):
+        token = CancelToken()
+        release = threading.Event()
+        threading.Timer(0.1, token.cancel, args=("user",)).start()
+        start = time.monotonic()
+        with self.assertRaises(OperationCancelled) as ctx:
+            run_cancellable(lambda: release.wait(10), token)
+        release.set()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(str(ctx.exception), "user")
+
+    def test_already_cancelled_token_skips_call(self):
+        token = CancelToken()
+        token.cancel()
+        calls = []
+        with self.assertRaises(OperationCancelled):
+            run_cancellable(lambda: calls.append(1), token)
+        self.assertEqual(calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
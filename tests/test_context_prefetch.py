@@ -0,0 +1,22 @@
+# tests/test_context_prefetch.py
+# -*- coding: utf-8 -*-
+from context_prefetch import hash_inputs
+
+
+def test_hash_is_stable_and_order_sensitive():
+    assert hash_inputs("a", 1, ["x"]) == hash_inputs("a", 1, ["x"])
+    assert hash_inputs("a", "b") != hash_inputs("b", "a")
+
+
+def test_hash_separates_part_boundaries():
+    assert hash_inputs("ab", "c") != hash_inputs("a", "bc")
+
+
+def test_hash_ignores_dict_key_order():
+    assert hash_inputs({"k": 2, "n": [1, 2]}) == hash_inputs({"n": [1, 2], "k": 2})
+    assert hash_inputs({"k": 2}) != hash_inputs({"k": 3})
+
+
+def test_hash_distinguishes_types():
+    assert hash_inputs(1) != hash_inputs([1])
+    assert hash_inputs(None) != hash_inputs("")
@@ -0,0 +1,68 @@
+# tests/test_draft_candidates.py
+# -*- coding: utf-8 -*-
+import pytest
+
+from draft_candidates import repetition_rate, score_draft_candidates, split_required_terms
+
+GOOD = "林风推开木门，山间的晨雾还没有散尽。他背起药篓，沿着溪边的小路往深处走去，" \
+       "手里攥着师父留下的铜铃。远处传来几声鸟鸣，阿青从竹林里探出头来喊他的名字。"
+
+
+class FakeEmbedding:
+    """按预设表返回向量，用于检验相似度信号。"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def embed_query(self, text):
+        return self.table[text]
+
+    def embed_documents(self, texts):
+        return [self.table[t] for t in texts]
+
+
+def test_split_required_terms():
+    assert split_required_terms("林风，阿青、 林风 / 铜铃") == ["林风", "阿青", "铜铃"]
+    assert split_required_terms("") == []
+
+
+def test_repetition_rate():
+    assert repetition_rate("短") == 0.0
+    assert repetition_rate("哈" * 100) > 0.9
+    assert repetition_rate(GOOD) < 0.05
+
+
+def test_ranking_prefers_coverage_and_low_repetition():
+    looping = "林风走啊走，" * 12
+    missing = GOOD.replace("阿青", "少女").replace("铜铃", "玉佩")
+    ranked = score_draft_candidates([looping, missing, GOOD, ""], len(GOOD),
+                                    characters_involved="林风、阿青", key_items="铜铃")
+    assert [c["index"] for c in ranked] == [2, 1, 0, 3]
+    assert ranked[0]["coverage"] == 1.0 and ranked[0]["missing"] == []
+    assert ranked[1]["missing"] == ["阿青", "铜铃"]
+    # 空候选排最后且得 0 分
+    assert ranked[-1]["score"] == 0.0 and ranked[-1]["length"] is None
+
+
+def test_unprovided_signals_are_not_weighted():
+    ranked = score_draft_candidates([GOOD], len(GOOD))
+    assert ranked[0]["coverage"] is None and ranked[0]["similarity"] is None
+    assert ranked[0]["score"] == pytest.approx(1.0)
+
+
+def test_similarity_breaks_ties():
+    other = GOOD.replace("晨雾", "夜雾")
+    embedding = FakeEmbedding({"简述": [1.0, 0.0], GOOD: [0.0, 1.0], other: [1.0, 0.1]})
+    ranked = score_draft_candidates([GOOD, other], len(GOOD), chapter_summary="简述",
+                                    embedding_adapter=embedding)
+    assert ranked[0]["index"] == 1
+    assert ranked[0]["similarity"] > 0.9 and ranked[1]["similarity"] == pytest.approx(0.0)
+
+
+def test_embedding_failure_skips_similarity():
+    class Broken:
+        def embed_query(self, text):
+            raise RuntimeError("offline")
+
+    ranked = score_draft_candidates([GOOD], len(GOOD), chapter_summary="简述", embedding_adapter=Broken())
+    assert ranked[0]["similarity"] is None
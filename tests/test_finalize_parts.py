@@ -0,0 +1,132 @@
+# tests/test_finalize_parts.py
+# -*- coding: utf-8 -*-
+import threading
+import time
+from concurrent.futures import Future
+
+from cancellation import CancelToken, OperationCancelled, run_cancellable
+from finalize_parts import (
+    CHECKPOINT_FILE_NAME,
+    FINALIZE_ERROR_FAILED,
+    FINALIZE_ERROR_TIMEOUT,
+    clear_committed_parts,
+    collect_part_results,
+    describe_finalize_status,
+    load_committed_parts,
+    mark_part_committed,
+    run_parts_until_deadline,
+)
+
+
+def _done(value=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(value)
+    return future
+
+
+def test_child_token_follows_parent_but_not_the_reverse():
+    parent = CancelToken()
+    child = CancelToken(parent=parent)
+    child.cancel("child only")
+    assert not parent.cancelled
+
+    other = CancelToken(parent=parent)
+    parent.cancel("stop")
+    assert other.cancelled and other.reason == "stop"
+
+
+def test_deadline_cancels_the_part_token_and_stops_slow_parts():
+    part_token = CancelToken(deadline_seconds=0.3)
+    stopped = threading.Event()
+
+    def slow():
+        try:
+            return run_cancellable(lambda: time.sleep(5) or "late", part_token)
+        except OperationCancelled:
+            stopped.set()
+            raise
+
+    start = time.monotonic()
+    futures = run_parts_until_deadline({"fast": lambda: "ok", "slow": slow}, part_token)
+    assert time.monotonic() - start < 2
+    assert part_token.cancelled
+    assert stopped.wait(2)
+
+    results, ok, errors = collect_part_results(futures)
+    assert results["fast"] == "ok" and ok["fast"]
+    assert not ok["slow"] and errors["slow"] == FINALIZE_ERROR_TIMEOUT
+
+
+def test_parent_cancel_returns_before_the_deadline():
+    parent = CancelToken()
+    part_token = CancelToken(deadline_seconds=30, parent=parent)
+    threading.Timer(0.2, parent.cancel, args=("user stop",)).start()
+    start = time.monotonic()
+    run_parts_until_deadline({"slow": lambda: run_cancellable(lambda: time.sleep(5), part_token)}, part_token, parent)
+    assert time.monotonic() - start < 2
+    assert part_token.cancelled and part_token.reason == "user stop"
+
+
+def test_all_parts_finishing_leaves_the_token_alone():
+    part_token = CancelToken(deadline_seconds=30)
+    futures = run_parts_until_deadline({"a": lambda: 1, "b": lambda: 2}, part_token)
+    assert not part_token.cancelled
+    assert {name: f.result() for name, f in futures.items()} == {"a": 1, "b": 2}
+
+
+def test_collect_maps_each_outcome():
+    pending = Future()
+    futures = {
+        "summary": _done("新摘要"),
+        "character_state": _done("   "),
+        "vectors": _done(None),
+        "broken": _done(error=ValueError("bad json")),
+        "stopped": _done(error=OperationCancelled("deadline exceeded")),
+        "pending": pending,
+    }
+    results, ok, errors = collect_part_results(futures, allow_empty=("vectors",))
+    assert ok == {
+        "summary": True, "character_state": False, "vectors": True,
+        "broken": False, "stopped": False, "pending": False,
+    }
+    assert errors == {
+        "character_state": FINALIZE_ERROR_FAILED,
+        "broken": FINALIZE_ERROR_FAILED,
+        "stopped": FINALIZE_ERROR_TIMEOUT,
+        "pending": FINALIZE_ERROR_TIMEOUT,
+    }
+    assert results["summary"] == "新摘要" and "pending" not in results
+
+
+def test_describe_lists_only_uncommitted_parts():
+    assert describe_finalize_status({"summary": True, "character_state": True, "vectors": True, "errors": {}}) == []
+    lines = describe_finalize_status({
+        "summary": True, "character_state": False, "vectors": False,
+        "errors": {"character_state": FINALIZE_ERROR_TIMEOUT},
+    })
+    assert lines == ["角色状态未更新（超过截止时间）", "向量库未更新（未完成）"]
+
+
+def test_checkpoint_survives_reload_and_is_per_chapter(tmp_path):
+    filepath = str(tmp_path)
+    assert load_committed_parts(filepath, 3) == []
+    mark_part_committed(filepath, 3, "vectors")
+    mark_part_committed(filepath, 3, "summary")
+    mark_part_committed(filepath, 3, "summary")
+    mark_part_committed(filepath, 4, "character_state")
+    assert load_committed_parts(filepath, 3) == ["vectors", "summary"]
+    assert load_committed_parts(filepath, 4) == ["character_state"]
+
+    clear_committed_parts(filepath, [3, 99])
+    assert load_committed_parts(filepath, 3) == []
+    assert load_committed_parts(filepath, 4) == ["character_state"]
+
+
+def test_unreadable_checkpoint_runs_everything_again(tmp_path):
+    (tmp_path / CHECKPOINT_FILE_NAME).write_text("{truncated", encoding="utf-8")
+    assert load_committed_parts(str(tmp_path), 1) == []
+    mark_part_committed(str(tmp_path), 1, "summary")
+    assert load_committed_parts(str(tmp_path), 1) == ["summary"]
@@ -0,0 +1,130 @@
+# tests/test_import_manifest.py
+# -*- coding: utf-8 -*-
+import os
+
+from import_manifest import (
+    MANIFEST_FILE_NAME,
+    PLAN_CHANGED,
+    PLAN_NEW,
+    PLAN_SKIP,
+    ImportManifest,
+    file_sha256,
+    make_segment_id,
+    normalize_file_key,
+    remove_manifest_collection,
+)
+from segment_dedup import SegmentSignatureIndex, simhash
+
+NAME = "knowledge_collection"
+FP = "local:model-a"
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_segment_ids_are_stable_and_count_repeats(tmp_path):
+    key = normalize_file_key(str(tmp_path / "a.txt"))
+    assert make_segment_id(key, "段落") == make_segment_id(key, "段落")
+    assert make_segment_id(key, "段落", 0) != make_segment_id(key, "段落", 1)
+    assert make_segment_id(key, "段落") != make_segment_id(key + "x", "段落")
+
+
+def test_plan_new_then_skip_after_record(tmp_path):
+    path = write(tmp_path / "a.txt", "第一章")
+    manifest = ImportManifest(str(tmp_path))
+    plan, entry, sha = manifest.plan(NAME, path, FP)
+    assert (plan, entry) == (PLAN_NEW, None)
+    assert sha == file_sha256(path)
+
+    manifest.record(NAME, path, sha, FP, ["id-1"])
+    manifest.save()
+    reloaded = ImportManifest(str(tmp_path))
+    assert reloaded.plan(NAME, path, FP)[0] == PLAN_SKIP
+    # 换了 Embedding 模型的同一文件需要重新导入
+    assert reloaded.plan(NAME, path, "local:model-b")[0] == PLAN_CHANGED
+
+
+def test_touched_but_unchanged_file_is_skipped(tmp_path):
+    path = write(tmp_path / "a.txt", "第一章")
+    manifest = ImportManifest(str(tmp_path))
+    manifest.record(NAME, path, file_sha256(path), FP, ["id-1"])
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    plan, entry, _ = manifest.plan(NAME, path, FP)
+    assert plan == PLAN_SKIP
+    assert entry["mtime_ns"] == os.stat(path).st_mtime_ns
+
+
+def test_same_content_under_another_path_is_skipped(tmp_path):
+    first = write(tmp_path / "a.txt", "相同内容")
+    copy = write(tmp_path / "b.txt", "相同内容")
+    manifest = ImportManifest(str(tmp_path))
+    manifest.record(NAME, first, file_sha256(first), FP, ["id-1"])
+    plan, entry, _ = manifest.plan(NAME, copy, FP)
+    assert plan == PLAN_SKIP and entry["file"] == normalize_file_key(first)
+    # 其他集合不受影响
+    assert manifest.plan("other_collection", copy, FP)[0] == PLAN_NEW
+
+
+def test_failed_reimport_keeps_old_entry_for_retry(tmp_path):
+    # 修改后的文件未能完整导入时不调用 record：清单仍是旧条目，重试时按“已变化”处理并带回旧分段 id
+    path = write(tmp_path / "a.txt", "旧版本")
+    manifest = ImportManifest(str(tmp_path))
+    manifest.record(NAME, path, file_sha256(path), FP, ["old-1", "old-2"])
+    manifest.save()
+
+    write(tmp_path / "a.txt", "新版本，内容更长")
+    plan, entry, _ = manifest.plan(NAME, path, FP)
+    assert plan == PLAN_CHANGED
+
+    retry = ImportManifest(str(tmp_path))
+    plan, entry, _ = retry.plan(NAME, path, FP)
+    assert plan == PLAN_CHANGED
+    assert entry["segment_ids"] == ["old-1", "old-2"]
+
+
+def test_signature_rollback_restores_index(tmp_path):
+    # 导入器撤销未提交文件的顺序：撤销旧签名 -> 登记新签名 -> 失败时撤销新签名并恢复旧签名
+    index = SegmentSignatureIndex(str(tmp_path / "vectorstore"))
+    old = [simhash("旧的段落内容" * 10)]
+    new = [simhash("全新的段落内容，与旧版本无关" * 10)]
+    index.add_signatures(NAME, old)
+
+    index.discard(NAME, old)
+    index.add_signatures(NAME, new)
+    index.discard(NAME, new)
+    index.add_signatures(NAME, old)
+
+    assert index.find_duplicate(NAME, old[0], 1000)
+    assert not index.find_duplicate(NAME, new[0], 1000)
+
+
+def test_prune_merge_and_remove_collection(tmp_path):
+    a = write(tmp_path / "a.txt", "甲")
+    b = write(tmp_path / "b.txt", "乙")
+    manifest = ImportManifest(str(tmp_path))
+    manifest.record(NAME, a, file_sha256(a), FP, ["x", "y", "z"])
+    assert manifest.prune_segment_ids(NAME, {"x", "z"}) == 1
+    assert manifest.get(NAME, normalize_file_key(a))["segment_ids"] == ["x", "z"]
+
+    foreign = [
+        {"file": normalize_file_key(a), "segment_ids": ["other"]},
+        {"file": normalize_file_key(b), "segment_ids": ["b-1"]},
+    ]
+    assert manifest.merge_entries(NAME, foreign) == 1
+    assert manifest.get(NAME, normalize_file_key(a))["segment_ids"] == ["x", "z"]
+    manifest.save()
+
+    remove_manifest_collection(str(tmp_path), NAME)
+    assert ImportManifest(str(tmp_path)).collection_entries(NAME) == []
+
+
+def test_unreadable_manifest_starts_empty(tmp_path):
+    (tmp_path / MANIFEST_FILE_NAME).write_text("{not json", encoding="utf-8")
+    manifest = ImportManifest(str(tmp_path))
+    assert manifest.entries == {}
+    manifest.save()
+    assert not os.path.exists(str(tmp_path / MANIFEST_FILE_NAME) + ".tmp")
+    assert ImportManifest(str(tmp_path)).entries == {}
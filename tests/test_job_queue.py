@@ -0,0 +1,90 @@
+# tests/test_job_queue.py
+# -*- coding: utf-8 -*-
+import time
+from contextlib import closing
+
+import pytest
+
+from job_queue import STATUS_DONE, STATUS_QUEUED, STATUS_RUNNING, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path))
+
+
+def set_field(queue, job_id, **fields):
+    assignments = ", ".join(f"{k}=?" for k in fields)
+    with closing(queue._connect()) as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id=?", (*fields.values(), job_id))
+
+
+def job_status(queue, job_id):
+    with closing(queue._connect()) as conn:
+        return conn.execute("SELECT status FROM jobs WHERE id=?", (job_id,)).fetchone()["status"]
+
+
+def test_chain_runs_in_order_one_job_per_project(queue):
+    ids = queue.submit_project("a.json", "/novels/a", 1, 2, setup=True)
+    first = queue.claim("w1")
+    assert first["id"] == ids[0] and first["kind"] == "setup"
+    # 同一项目已有运行中的任务，后续任务要等依赖完成
+    assert queue.claim("w2") is None
+    assert queue.finish(first["id"], "w1", STATUS_DONE)
+    assert queue.claim("w2")["chapter"] == 1
+
+
+def test_higher_priority_first(queue):
+    queue.submit_project("a.json", "/novels/a", 1, 1, priority=0)
+    queue.submit_project("b.json", "/novels/b", 1, 1, priority=5)
+    assert queue.claim("w1")["project"] == "/novels/b"
+
+
+def test_least_recently_served_project_first(queue):
+    queue.submit_project("a.json", "/novels/a", 1, 3)
+    queue.submit_project("b.json", "/novels/b", 1, 3)
+    first = queue.claim("w1")
+    second = queue.claim("w2")
+    assert {first["project"], second["project"]} == {"/novels/a", "/novels/b"}
+    time.sleep(0.01)
+    queue.finish(first["id"], "w1", STATUS_DONE)
+    time.sleep(0.01)
+    queue.finish(second["id"], "w2", STATUS_DONE)
+    # 两个项目都可调度时，先选上次启动更早的项目
+    assert queue.claim("w3")["project"] == first["project"]
+
+
+def test_postponed_job_waits(queue):
+    (job_id,) = queue.submit_project("a.json", "/novels/a", 1, 1)
+    job = queue.claim("w1")
+    assert queue.postpone(job_id, "w1", 60, "busy")
+    assert queue.claim("w1") is None
+    set_field(queue, job_id, not_before=0)
+    assert queue.claim("w1")["id"] == job["id"]
+
+
+def test_expired_lease_is_requeued_and_old_worker_cannot_finish(queue):
+    (job_id,) = queue.submit_project("a.json", "/novels/a", 1, 1)
+    queue.claim("w1")
+    assert queue.renew(job_id, "w1")
+    set_field(queue, job_id, lease_until=time.time() - 1)
+
+    job = queue.claim("w2")
+    assert job["id"] == job_id and job["attempts"] == 1
+    assert job_status(queue, job_id) == STATUS_RUNNING
+    # 租约已被 w2 接管，旧执行的续约与结果都不生效
+    assert not queue.renew(job_id, "w1")
+    assert not queue.finish(job_id, "w1", STATUS_DONE)
+    assert not queue.postpone(job_id, "w1", 60, "busy")
+    assert job_status(queue, job_id) == STATUS_RUNNING
+    assert queue.finish(job_id, "w2", STATUS_DONE)
+    assert job_status(queue, job_id) == STATUS_DONE
+
+
+def test_cancel_only_touches_queued_jobs(queue):
+    ids = queue.submit_project("a.json", "/novels/a", 1, 3)
+    queue.claim("w1")
+    assert queue.cancel("/novels/a") == 2
+    assert job_status(queue, ids[0]) == STATUS_RUNNING
+    assert queue.retry("/novels/a") == 0
+    assert job_status(queue, ids[1]) != STATUS_QUEUED
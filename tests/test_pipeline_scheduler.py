@@ -0,0 +1,83 @@
+# tests/test_pipeline_scheduler.py
+# -*- coding: utf-8 -*-
+import pytest
+
+from pipeline_scheduler import JobJournal, PipelineBusyError, ProjectLock, format_journal_status, journal_status
+
+
+def test_journal_replays_final_state(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.start("arch")
+    journal.done("arch", {"ok": True})
+    journal.start("chapter:1")
+    journal.failed("chapter:1", "boom")
+    journal.start("chapter:1")
+    journal.done("chapter:1", 1)
+    journal.start("chapter:2")
+
+    replayed = JobJournal(str(tmp_path))
+    assert replayed.completed() == {"arch": {"ok": True}, "chapter:1": 1}
+    assert replayed.states["chapter:1"]["attempts"] == 2
+    # 只有 start 的节点是被中断的节点
+    assert replayed.states["chapter:2"]["status"] == "start"
+
+
+def test_journal_reset_forgets_node(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.start("arch")
+    journal.done("arch", "x")
+    journal.reset("arch")
+    assert "arch" not in JobJournal(str(tmp_path)).states
+
+
+def test_journal_skips_truncated_last_line(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.start("arch")
+    journal.done("arch", "x")
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"node": "chapter:1", "ev')
+    assert JobJournal(str(tmp_path)).completed() == {"arch": "x"}
+
+
+def test_journal_compact_keeps_one_line_per_node(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    for _ in range(3):
+        journal.start("arch")
+        journal.failed("arch", "retry")
+    journal.start("arch")
+    journal.done("arch", [1, 2])
+    journal.start("chapter:1")
+    journal.failed("chapter:1", "boom")
+    journal.compact()
+
+    with open(journal.path, "r", encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 2
+    replayed = JobJournal(str(tmp_path))
+    assert replayed.completed() == {"arch": [1, 2]}
+    assert replayed.states["chapter:1"]["error"] == "boom"
+
+
+def test_project_lock_is_exclusive_and_reusable(tmp_path):
+    with ProjectLock(str(tmp_path)):
+        with pytest.raises(PipelineBusyError):
+            ProjectLock(str(tmp_path)).acquire()
+    with ProjectLock(str(tmp_path)) as lock:
+        assert lock.acquired
+
+
+def test_status_lines_follow_journal(tmp_path):
+    assert format_journal_status(journal_status(str(tmp_path))) == ["no nodes recorded"]
+
+    journal = JobJournal(str(tmp_path))
+    journal.start("draft:1")
+    journal.done("draft:1", {"words": 3000})
+    journal.start("finalize:1")
+    journal.failed("finalize:1", "finalize incomplete")
+    journal.start("draft:2")
+
+    lines = format_journal_status(journal_status(str(tmp_path)))
+    assert [line.split()[:2] for line in lines[:3]] == [
+        ["draft:1", "done"], ["finalize:1", "failed"], ["draft:2", "started"]
+    ]
+    assert lines[1].endswith("finalize incomplete")
+    assert lines[-1] == "1 done, 1 failed, 1 started"
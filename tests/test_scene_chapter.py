@@ -0,0 +1,103 @@
+# tests/test_scene_chapter.py
+# -*- coding: utf-8 -*-
+from scene_chapter import (
+    MAX_SCENES,
+    attach_source_fragments,
+    is_cjk_language,
+    normalize_scenes,
+    parse_scene_plan,
+    scene_words_limit,
+    should_use_scene_mode,
+    split_source_fragments
+)
+
+# max_tokens=2000 时单个场景上限为 800 字
+MAX_TOKENS = 2000
+
+
+def scene(title, words, summary="", **extra):
+    return {"title": title, "words": words, "summary": summary, **extra}
+
+
+def test_limit_for_test_tokens():
+    assert scene_words_limit(MAX_TOKENS) == 800
+
+
+def test_language_decides_counting_unit():
+    assert is_cjk_language("中文") and is_cjk_language("日语") and is_cjk_language("zh-CN")
+    assert is_cjk_language("") and is_cjk_language(None)
+    assert not is_cjk_language("英文") and not is_cjk_language("English")
+    # 英文按单词计，每个单词消耗的 token 更多，单个场景可容纳的字数更少
+    assert scene_words_limit(MAX_TOKENS, "英文") < scene_words_limit(MAX_TOKENS, "中文")
+    assert not should_use_scene_mode(750, MAX_TOKENS, "中文")
+    assert should_use_scene_mode(750, MAX_TOKENS, "英文")
+
+
+def test_normalize_reaches_target_when_plan_is_short():
+    scenes = normalize_scenes([scene("a", 100), scene("b", 300)], 6000, MAX_TOKENS)
+    assert sum(s["words"] for s in scenes) >= 6000
+    assert all(s["words"] <= 800 for s in scenes)
+    assert [s["index"] for s in scenes] == list(range(len(scenes)))
+
+
+def test_normalize_keeps_planned_proportions():
+    scenes = normalize_scenes([scene("a", 100), scene("b", 300)], 3200, MAX_TOKENS)
+    words_a = sum(s["words"] for s in scenes if s["title"].startswith("a"))
+    words_b = sum(s["words"] for s in scenes if s["title"].startswith("b"))
+    assert words_a + words_b >= 3200
+    assert words_b > 2 * words_a
+
+
+def test_normalize_splits_large_scene_into_parts():
+    scenes = normalize_scenes([scene("大战", 0, "决战"), scene("尾声", 0, "收尾")], 3000, MAX_TOKENS)
+    assert [s["title"] for s in scenes] == ["大战（1/2）", "大战（2/2）", "尾声（1/2）", "尾声（2/2）"]
+    assert "第1部分" in scenes[0]["summary"] and scenes[0]["summary"].startswith("决战")
+
+
+def test_normalize_single_scene_plan_yields_at_least_two():
+    scenes = normalize_scenes([scene("唯一", 500)], 1000, MAX_TOKENS)
+    assert len(scenes) >= 2
+    assert sum(s["words"] for s in scenes) >= 1000
+
+
+def test_normalize_caps_scene_count():
+    scenes = normalize_scenes([scene(str(i), 100) for i in range(20)], 20000, MAX_TOKENS)
+    assert len(scenes) == MAX_SCENES
+
+
+def test_normalize_empty_plan():
+    assert normalize_scenes([], 3000, MAX_TOKENS) == []
+
+
+def test_parse_scene_plan():
+    text = "场景1 - [相遇]\n目标字数：800\n场景内容：[两人在雨中相遇]\n场景2 - 告别\n目标字数：600\n场景内容：车站告别"
+    assert parse_scene_plan(text) == [
+        {"title": "相遇", "words": 800, "summary": "两人在雨中相遇"},
+        {"title": "告别", "words": 600, "summary": "车站告别"},
+    ]
+
+
+def test_split_source_fragments_keeps_paragraphs_whole():
+    paragraphs = [f"第{i}段" + "字" * (10 * (i + 1)) for i in range(6)]
+    fragments = split_source_fragments("\n\n".join(paragraphs), 3)
+    assert len(fragments) == 3
+    assert "\n".join(fragments).split("\n") == paragraphs
+
+
+def test_split_source_fragments_with_fewer_paragraphs_than_requested():
+    assert split_source_fragments("甲\n乙", 5) == ["甲", "乙"]
+    assert split_source_fragments("  \n", 3) == []
+
+
+def test_attach_fragments_extra_go_to_last_scene():
+    scenes = attach_source_fragments([scene("a", 0), scene("b", 0)], ["一", "二", "三"])
+    assert [s["source"] for s in scenes] == ["一", "二\n三"]
+
+
+def test_split_parts_share_their_source_slice():
+    planned = [scene("a", 0, source="段一\n段二\n段三\n段四"), scene("b", 0, source="段五")]
+    scenes = normalize_scenes(planned, 3000, MAX_TOKENS)
+    a_parts = [s for s in scenes if s["title"].startswith("a")]
+    assert len(a_parts) == 2
+    assert "\n".join(s["source"] for s in a_parts) == "段一\n段二\n段三\n段四"
+    assert a_parts[0]["source"] != a_parts[1]["source"]
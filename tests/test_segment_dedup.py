@@ -0,0 +1,77 @@
+# tests/test_segment_dedup.py
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from segment_dedup import MIN_NEAR_DUP_CHARS, SegmentSignatureIndex, hamming_distance, simhash
+
+NAME = "knowledge_collection"
+LONG = MIN_NEAR_DUP_CHARS
+
+
+@pytest.fixture
+def index(tmp_path):
+    # 向量库目录不存在：不会从 chromadb 补建签名，也不会写出签名文件
+    idx = SegmentSignatureIndex(str(tmp_path / "vectorstore"))
+    idx.add_signatures(NAME, [0x0123_4567_89AB_CDEF])
+    return idx
+
+
+def flip(sig: int, *bits: int) -> int:
+    for b in bits:
+        sig ^= 1 << b
+    return sig
+
+
+def test_band_lookup_finds_distance_three_across_bands(index):
+    # 三位分别落在三个不同的 16 位分段中，剩下的一段完全相同，仍能通过分桶找到
+    sig = flip(0x0123_4567_89AB_CDEF, 0, 20, 40)
+    assert hamming_distance(sig, 0x0123_4567_89AB_CDEF) == 3
+    assert index.find_duplicate(NAME, sig, LONG)
+
+
+def test_band_lookup_rejects_distance_four(index):
+    sig = flip(0x0123_4567_89AB_CDEF, 0, 20, 40, 60)
+    assert not index.find_duplicate(NAME, sig, LONG)
+
+
+def test_short_text_only_matches_exact_signature(index):
+    assert index.find_duplicate(NAME, 0x0123_4567_89AB_CDEF, LONG - 1)
+    assert not index.find_duplicate(NAME, flip(0x0123_4567_89AB_CDEF, 0), LONG - 1)
+
+
+def test_collections_are_separate(index):
+    assert not index.find_duplicate("novel_collection", 0x0123_4567_89AB_CDEF, LONG)
+
+
+def test_discard_removes_signature_from_bands(index):
+    index.discard(NAME, [0x0123_4567_89AB_CDEF])
+    assert not index.find_duplicate(NAME, 0x0123_4567_89AB_CDEF, LONG)
+
+
+def test_filter_indices_drops_near_duplicates_in_same_batch(index):
+    text = "夜色渐深，城门外的风卷起尘土，守卫们举着火把来回巡视，远处传来马蹄声。"
+    kept, sigs = index.filter_indices(NAME, [text, text + "。", "完全不同的一段内容，讲述山中老人采药的故事，与前文毫无关系。"])
+    assert kept == [0, 2]
+    assert sigs == [simhash(text), simhash("完全不同的一段内容，讲述山中老人采药的故事，与前文毫无关系。")]
+    assert not os.path.exists(index.path)
+
+
+def test_discard_removes_one_occurrence_and_keeps_other_buckets(tmp_path):
+    store_dir = tmp_path / "vectorstore"
+    store_dir.mkdir()
+    other = flip(0x0123_4567_89AB_CDEF, 0, 20, 40, 60)
+    idx = SegmentSignatureIndex(str(store_dir))
+    idx.add_signatures(NAME, [0x0123_4567_89AB_CDEF, 0x0123_4567_89AB_CDEF, other])
+
+    idx.discard(NAME, [0x0123_4567_89AB_CDEF, 0xFFFF])
+    assert idx.find_duplicate(NAME, 0x0123_4567_89AB_CDEF, LONG)
+    idx.discard(NAME, [0x0123_4567_89AB_CDEF])
+    assert not idx.find_duplicate(NAME, 0x0123_4567_89AB_CDEF, LONG)
+    assert idx.find_duplicate(NAME, other, LONG)
+
+    idx.save()
+    reloaded = SegmentSignatureIndex(str(store_dir))
+    assert reloaded.signatures[NAME] == {other: 1}
+    assert reloaded.find_duplicate(NAME, other, LONG)
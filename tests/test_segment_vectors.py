@@ -0,0 +1,57 @@
+# tests/test_segment_vectors.py
+# -*- coding: utf-8 -*-
+"""切分时由句向量合成分段向量（与 Embedding 共用切分模型时直接写入向量库）。"""
+import numpy as np
+
+import text_splitter
+from text_splitter import normalize_embeddings, pool_sentence_embeddings, split_text_semantic_with_embeddings
+
+
+class TopicModel:
+    """句中含“雨”的句子编码为 [1, 0]，其余为 [0, 1]；记录编码次数。"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, sentences, convert_to_numpy=True, **kwargs):
+        self.calls += 1
+        return np.array([[1.0, 0.0] if "雨" in s else [0.0, 1.0] for s in sentences], dtype=np.float32)
+
+
+def test_normalize_keeps_zero_rows():
+    out = normalize_embeddings([[3, 4], [0, 0]])
+    np.testing.assert_allclose(out, [[0.6, 0.8], [0, 0]])
+
+
+def test_pool_weights_sentences_by_length():
+    vec = pool_sentence_embeddings([[1, 0], [0, 1], [5, 5]], [0, 1], [3, 1])
+    np.testing.assert_allclose(vec, normalize_embeddings([3, 1]))
+    assert abs(np.linalg.norm(vec) - 1) < 1e-6
+
+
+def test_split_returns_one_vector_per_segment(monkeypatch):
+    model = TopicModel()
+    monkeypatch.setattr(text_splitter, "_model", model)
+    text = "下雨了。雨很大。天晴了。阳光很好。"
+    segments, vectors = split_text_semantic_with_embeddings(text, 0.7, max_length=100, mode="adjacent", overlap=0)
+
+    assert segments == ["下雨了。雨很大。", "天晴了。阳光很好。"]
+    np.testing.assert_allclose(np.stack(vectors), [[1, 0], [0, 1]], atol=1e-6)
+    # 分段向量由切分时的一次编码合成，不再单独编码分段
+    assert model.calls == 1
+
+
+def test_hard_cut_segment_has_no_vector(monkeypatch):
+    monkeypatch.setattr(text_splitter, "_model", TopicModel())
+    text = "雨" * 30 + "。短句。"
+    segments, vectors = split_text_semantic_with_embeddings(text, 0.0, max_length=12, mode="adjacent", overlap=0)
+
+    assert len(segments) == len(vectors)
+    assert all(len(s) <= 12 for s in segments)
+    # 含有被硬切开的半句的分段（即使也含完整句子）无法由句向量合成，写入时再由 Embedding 编码
+    assert segments[-1].endswith("。短句。")
+    assert vectors == [None] * len(segments)
+
+
+def test_blank_text_has_no_segments():
+    assert split_text_semantic_with_embeddings("  \n ") == ([], [])
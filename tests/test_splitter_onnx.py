@@ -0,0 +1,92 @@
+# tests/test_splitter_onnx.py
+# -*- coding: utf-8 -*-
+import types
+
+import numpy as np
+import pytest
+
+import splitter_onnx
+import text_splitter
+
+
+class FakeTokenizer:
+    """每个字符一个 token，按批内最长句子补齐。"""
+
+    def encode_batch(self, texts):
+        width = max(len(t) for t in texts)
+        return [
+            types.SimpleNamespace(
+                ids=[ord(c) for c in t] + [0] * (width - len(t)),
+                attention_mask=[1] * len(t) + [0] * (width - len(t)),
+            )
+            for t in texts
+        ]
+
+
+class FakeSession:
+    """token 向量取 [id, 1]，补齐位置为 [-100, -100]，错误地计入补齐位置会改变结果。"""
+
+    def run(self, _, feeds):
+        ids = feeds["input_ids"].astype(np.float32)
+        mask = feeds["attention_mask"][..., None]
+        tokens = np.stack([ids, np.ones_like(ids)], axis=-1)
+        return [np.where(mask == 1, tokens, -100.0)]
+
+
+def make_encoder():
+    encoder = object.__new__(splitter_onnx.OnnxSentenceEncoder)
+    encoder.tokenizer = FakeTokenizer()
+    encoder.session = FakeSession()
+    encoder.input_names = {"input_ids", "attention_mask"}
+    return encoder
+
+
+def test_encode_mean_pools_real_tokens_in_input_order():
+    sentences = ["ccc", "a", "bb"]
+    out = make_encoder().encode(sentences, batch_size=2)
+    expected = [[np.mean([ord(c) for c in s]), 1.0] for s in sentences]
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, expected)
+
+
+def test_encode_empty_and_single_string():
+    encoder = make_encoder()
+    assert encoder.encode([]).shape == (0, 0)
+    assert encoder.encode("ab").shape == (1, 2)
+
+
+def test_model_unavailable_without_exported_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(splitter_onnx, "SPLITTER_ONNX_DIR", str(tmp_path))
+    model_dir = tmp_path / "org__model"
+    model_dir.mkdir()
+    (model_dir / splitter_onnx.ONNX_FP32_FILE).write_bytes(b"")
+    # 缺少 tokenizer.json 或 int8 模型文件
+    assert not splitter_onnx.onnx_model_available("org/model")
+    (model_dir / "tokenizer.json").write_text("{}", encoding="utf-8")
+    assert not splitter_onnx.onnx_model_available("org/model", quantized=True)
+
+
+@pytest.mark.parametrize("given, stored", [("ONNX-int8 ", "onnx-int8"), ("torch", "torch")])
+def test_set_backend_resets_loaded_model(monkeypatch, given, stored):
+    monkeypatch.setenv("SPLITTER_BACKEND", "torch")
+    monkeypatch.setattr(text_splitter, "SPLITTER_BACKEND", "torch")
+    monkeypatch.setattr(text_splitter, "_model", object())
+    text_splitter.set_splitter_backend(given)
+    assert text_splitter.SPLITTER_BACKEND == stored
+    assert text_splitter._model is None
+
+
+def test_set_backend_rejects_unknown(monkeypatch):
+    monkeypatch.setattr(text_splitter, "SPLITTER_BACKEND", "torch")
+    with pytest.raises(ValueError):
+        text_splitter.set_splitter_backend("cuda")
+    assert text_splitter.SPLITTER_BACKEND == "torch"
+
+
+def test_onnx_backend_is_used_when_exported(monkeypatch):
+    encoder = make_encoder()
+    monkeypatch.setattr(text_splitter, "SPLITTER_BACKEND", "onnx-int8")
+    monkeypatch.setattr(text_splitter, "_model", None)
+    monkeypatch.setattr(splitter_onnx, "onnx_model_available", lambda name, quantized=False: quantized)
+    monkeypatch.setattr(splitter_onnx, "OnnxSentenceEncoder", lambda name, quantized, num_threads: encoder)
+    assert text_splitter.get_splitter_model() is encoder
@@ -0,0 +1,99 @@
+# tests/test_step_graph.py
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from step_graph import Step, run_step_graph, validate_step_graph
+
+
+def _const(value):
+    return lambda results: value
+
+
+@pytest.mark.parametrize("edges, message", [
+    ({"a": ["b"], "b": ["a"]}, "cycle"),
+    ({"a": ["a"]}, "cycle"),
+    ({"a": [], "b": ["c"], "c": ["b"]}, "cycle"),
+    ({"a": ["missing"]}, "undeclared"),
+])
+def test_validate_rejects_bad_graphs(edges, message):
+    steps = [Step(name, deps, _const(name)) for name, deps in edges.items()]
+    with pytest.raises(ValueError, match=message):
+        validate_step_graph(steps)
+    with pytest.raises(ValueError):
+        run_step_graph(steps, {}, on_result=lambda n, r: None)
+
+
+def test_independent_steps_run_concurrently():
+    # 两个无依赖的步骤都到达栅栏后才能返回，串行执行会超时
+    barrier = threading.Barrier(2, timeout=5)
+
+    def meet(results):
+        barrier.wait()
+        return "ok"
+
+    steps = [Step("a", [], meet), Step("b", [], meet), Step("c", ["a", "b"], lambda r: r["a"] + r["b"])]
+    results, order = {}, []
+    assert run_step_graph(steps, results, on_result=lambda n, r: order.append(n))
+    assert results["c"] == "okok"
+    assert order[-1] == "c"
+
+
+def test_dependents_see_only_finished_results():
+    seen = {}
+
+    def record(results):
+        seen["b"] = sorted(results)
+        return "B"
+
+    steps = [Step("a", [], _const("A")), Step("b", ["a"], record)]
+    assert run_step_graph(steps, {}, on_result=lambda n, r: None)
+    assert seen["b"] == ["a"]
+
+
+def test_existing_results_are_skipped():
+    def boom(results):
+        raise AssertionError("should not run")
+
+    results = {"a": "saved"}
+    steps = [Step("a", [], boom), Step("b", ["a"], lambda r: r["a"] + "!")]
+    assert run_step_graph(steps, results, on_result=lambda n, r: None)
+    assert results == {"a": "saved", "b": "saved!"}
+
+
+def test_failure_stops_new_steps_but_keeps_running_ones():
+    release = threading.Event()
+    errors, saved = {}, []
+
+    def fail(results):
+        release.set()
+        raise RuntimeError("llm error")
+
+    def slow(results):
+        release.wait(5)
+        return "slow"
+
+    steps = [
+        Step("fail", [], fail),
+        Step("slow", [], slow),
+        Step("after", ["fail"], _const("never")),
+    ]
+    results = {}
+    ok = run_step_graph(
+        steps, results,
+        on_result=lambda n, r: saved.append(n),
+        on_error=lambda n, msg: errors.update({n: msg}),
+    )
+    assert not ok
+    assert errors == {"fail": "llm error"}
+    # 已在运行的步骤照常完成并保存，依赖失败步骤的步骤不启动
+    assert saved == ["slow"]
+    assert "after" not in results
+
+
+def test_empty_result_counts_as_failure():
+    errors = []
+    steps = [Step("a", [], _const("  ")), Step("b", ["a"], _const("B"))]
+    assert not run_step_graph(steps, {}, on_result=lambda n, r: None, on_error=lambda n, m: errors.append((n, m)))
+    assert errors == [("a", "empty result")]
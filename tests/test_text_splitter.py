@@ -0,0 +1,86 @@
+# tests/test_text_splitter.py
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from text_splitter import (
+    POOL_MIN_BLOCKS_PER_WORKER,
+    _pack_units,
+    _split_oversized,
+    pack_pieces,
+    semantic_merge_groups,
+    should_use_split_pool
+)
+
+
+# ============ semantic_merge_groups ============
+
+def test_merge_groups_empty():
+    assert semantic_merge_groups(np.zeros((0, 3))) == []
+
+
+def test_merge_groups_adjacent_breaks_on_low_similarity():
+    vectors = [[1, 0], [1, 0.1], [0, 1], [0.1, 1], [1, 0]]
+    assert semantic_merge_groups(vectors, 0.7, mode="adjacent") == [(0, 2), (2, 4), (4, 5)]
+
+
+def test_merge_groups_centroid_covers_all_sentences():
+    vectors = [[1, 0], [1, 0.1], [0, 1], [0.1, 1], [1, 0]]
+    groups = semantic_merge_groups(vectors, 0.7, mode="centroid")
+    assert groups == [(0, 2), (2, 4), (4, 5)]
+    assert groups[0][0] == 0 and groups[-1][1] == len(vectors)
+    assert all(a[1] == b[0] for a, b in zip(groups, groups[1:]))
+
+
+def test_merge_groups_zero_vector_does_not_fail():
+    groups = semantic_merge_groups([[0, 0], [1, 0]], 0.7, mode="adjacent")
+    assert groups == [(0, 1), (1, 2)]
+
+
+# ============ 装箱与重叠 ============
+
+def test_pack_respects_max_length():
+    pieces = ["一二三。", "四五六。", "七八九。", "十十十。"]
+    segments = pack_pieces(pieces, max_length=8)
+    assert segments == ["一二三。四五六。", "七八九。十十十。"]
+
+
+def test_pack_overlap_carries_whole_sentences():
+    pieces = ["aaaa", "bbbb", "cccc", "dddd"]
+    segments = pack_pieces(pieces, max_length=12, overlap=4, joiner=" ")
+    assert segments == ["aaaa bbbb", "bbbb cccc", "cccc dddd"]
+    for seg in segments:
+        assert len(seg) <= 12
+
+
+def test_pack_overlap_never_exceeds_max_length():
+    pieces = ["x" * 6, "y" * 6, "z" * 6]
+    for seg in pack_pieces(pieces, max_length=10, overlap=6):
+        assert len(seg) <= 10
+
+
+def test_pack_units_mark_split_pieces():
+    groups = _pack_units(["短句。", "长" * 25], max_length=10, overlap=0, length_function=len, joiner="")
+    units = [u for g in groups for u in g]
+    assert units[0] == ("短句。", 3, 0, True)
+    assert all(u[2] == 1 and not u[3] for u in units[1:])
+    assert "".join(u[0] for u in units[1:]) == "长" * 25
+
+
+def test_oversized_splits_on_whitespace_before_hard_cut():
+    parts = _split_oversized("word " * 40, 50, len)
+    assert all(p.split() == ["word"] * len(p.split()) for p in parts)
+    assert sum(len(p.split()) for p in parts) == 40
+    assert all(len(p) <= 50 for p in parts)
+
+
+def test_oversized_hard_cuts_a_single_long_token():
+    parts = _split_oversized("a" * 120, 50, len)
+    assert parts == ["a" * 50, "a" * 50, "a" * 20]
+
+
+def test_split_pool_needs_several_blocks_per_worker():
+    block = 1024
+    enough = block * 4 * POOL_MIN_BLOCKS_PER_WORKER
+    assert should_use_split_pool(enough, block, 4)
+    assert not should_use_split_pool(enough - 1, block, 4)
+    assert not should_use_split_pool(10 ** 9, block, 1)
@@ -0,0 +1,585 @@
+# text_splitter.py
+# -*- coding: utf-8 -*-
+"""
+文本切分所需的共享资源：语义合并用的句向量模型在进程内只加载一次，
+所有切分入口（章节定稿、知识库导入）共用同一个实例；
+NLTK 分句数据每个进程只检查一次，切分过程中从不联网下载。
+"""
+import os
+import re
+import math
+import sys
+import logging
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+SPLITTER_MODEL_NAME = "paraphrase-MiniLM-L6-v2"
+# 切分模型后端：torch（sentence_transformers）、onnx、onnx-int8（需先用 splitter_onnx.py 导出模型）
+SPLITTER_BACKEND = os.environ.get("SPLITTER_BACKEND", "torch").strip().lower()
+
+# 随程序附带的 NLTK 数据目录（源码运行时位于项目根目录，PyInstaller 打包后位于解包目录）
+BUNDLED_NLTK_DATA_DIR = os.path.join(
+    getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__))),
+    "nltk_data"
+)
+# 用户数据目录下的 NLTK 数据目录：打包运行时解包目录是每次启动新建的临时目录，下载的数据要放在这里才能保留
+USER_NLTK_DATA_DIR = os.path.join(os.path.expanduser("~"), ".ai_novel_generator", "nltk_data")
+# 新版 nltk 使用 punkt_tab，旧版使用 punkt，任一可用即可
+NLTK_TOKENIZER_RESOURCES = ("tokenizers/punkt_tab", "tokenizers/punkt")
+
+_model = None
+_model_lock = threading.Lock()
+_onnx_threads = 0
+
+
+def _load_onnx_model(quantized: bool):
+    """加载 ONNX 后端；模型未导出或缺少 onnxruntime 时返回 None。"""
+    from splitter_onnx import onnx_model_available, OnnxSentenceEncoder
+    if not onnx_model_available(SPLITTER_MODEL_NAME, quantized):
+        logging.warning(
+            f"ONNX splitter model not available (backend '{SPLITTER_BACKEND}'), "
+            f"falling back to sentence_transformers. Run 'python splitter_onnx.py export' first."
+        )
+        return None
+    return OnnxSentenceEncoder(SPLITTER_MODEL_NAME, quantized=quantized, num_threads=_onnx_threads)
+
+
+def get_splitter_model():
+    """
+    返回共享的句向量模型，首次调用时加载（可能需要联网下载权重）。
+    多线程同时首次调用时只会加载一次。按 SPLITTER_BACKEND 选择后端，ONNX 不可用时回退到 torch。
+    """
+    global _model
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is None:
+            start = time.time()
+            model = None
+            if SPLITTER_BACKEND in ("onnx", "onnx-int8"):
+                try:
+                    model = _load_onnx_model(quantized=SPLITTER_BACKEND == "onnx-int8")
+                except Exception as e:
+                    logging.warning(f"Failed to load ONNX splitter model: {e}")
+                    traceback.print_exc()
+            backend = SPLITTER_BACKEND if model is not None else "torch"
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(SPLITTER_MODEL_NAME)
+            _model = model
+            logging.info(f"Splitter model '{SPLITTER_MODEL_NAME}' ({backend}) loaded in {time.time() - start:.2f}s.")
+    return _model
+
+
+def set_splitter_backend(backend: str):
+    """切换切分模型后端（torch / onnx / onnx-int8），已加载的模型会在下次使用时按新后端重新加载。"""
+    global SPLITTER_BACKEND, _model
+    backend = backend.strip().lower()
+    if backend not in ("torch", "onnx", "onnx-int8"):
+        raise ValueError(f"Unknown splitter backend: {backend}")
+    with _model_lock:
+        SPLITTER_BACKEND = backend
+        os.environ["SPLITTER_BACKEND"] = backend
+        _model = None
+
+
+def warm_up_splitter_model() -> threading.Thread:
+    """
+    在后台线程中准备 NLTK 分句数据并预加载切分模型，
+    避免首次定稿/导入时等待下载或加载。
+    """
+    def task():
+        try:
+            provision_nltk_resources()
+        except Exception as e:
+            logging.warning(f"NLTK provisioning failed: {e}")
+        try:
+            get_splitter_model()
+        except Exception as e:
+            logging.warning(f"Splitter model warm-up failed: {e}")
+
+    thread = threading.Thread(target=task, daemon=True)
+    thread.start()
+    return thread
+
+
+# ============ NLTK 分句数据 ============
+
+_nltk_checked = False
+_nltk_available = False
+_nltk_lock = threading.Lock()
+
+
+def default_nltk_download_dir() -> str:
+    """源码运行时下载到项目根目录的附带数据目录，打包运行时下载到用户数据目录。"""
+    return USER_NLTK_DATA_DIR if getattr(sys, "frozen", False) else BUNDLED_NLTK_DATA_DIR
+
+
+def _register_nltk_data_paths():
+    """把 NLTK_DATA 环境变量之外的附带数据目录与用户数据目录加入 nltk 的查找路径。"""
+    import nltk
+    for path in (USER_NLTK_DATA_DIR, BUNDLED_NLTK_DATA_DIR):
+        if os.path.isdir(path) and path not in nltk.data.path:
+            nltk.data.path.insert(0, path)
+
+
+def nltk_tokenizer_available() -> bool:
+    """
+    检查本地是否已有分句数据（每个进程只检查一次），不会触发下载。
+    """
+    global _nltk_checked, _nltk_available
+    if _nltk_checked:
+        return _nltk_available
+    with _nltk_lock:
+        if not _nltk_checked:
+            import nltk
+            _register_nltk_data_paths()
+            available = False
+            for resource in NLTK_TOKENIZER_RESOURCES:
+                try:
+                    nltk.data.find(resource)
+                    available = True
+                    break
+                except LookupError:
+                    continue
+            if not available:
+                logging.warning("NLTK punkt data not found, falling back to rule-based sentence splitting.")
+            _nltk_available = available
+            _nltk_checked = True
+    return _nltk_available
+
+
+def provision_nltk_resources(download_dir: Optional[str] = None) -> bool:
+    """
+    一次性准备 NLTK 分句数据：本地已有则直接返回，否则下载到 download_dir
+    （默认见 default_nltk_download_dir）。只应在启动预热或安装阶段调用，不在切分流程中调用。
+    """
+    global _nltk_checked
+    if nltk_tokenizer_available():
+        return True
+    import nltk
+    target = download_dir or default_nltk_download_dir()
+    try:
+        os.makedirs(target, exist_ok=True)
+        for resource in NLTK_TOKENIZER_RESOURCES:
+            nltk.download(resource.split("/")[-1], download_dir=target, quiet=True)
+        if target not in nltk.data.path:
+            nltk.data.path.insert(0, target)
+    except Exception as e:
+        logging.warning(f"Failed to download NLTK punkt data: {e}")
+    with _nltk_lock:
+        _nltk_checked = False
+    return nltk_tokenizer_available()
+
+
+_FALLBACK_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+# ============ 中日韩文本分句 ============
+
+_CJK_CHAR = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+# 一句 = 非句末标点串 + 句末标点（。！？及省略号，可连用）+ 紧随其后的右引号/右括号，
+# 使“……走吧。”这样的对白连同引号留在同一句中
+_CJK_SENTENCE = re.compile(
+    r'[^。！？!?…\n]+(?:(?:[。！？!?]|…+|\.{3,})+[”’」』）)】》"\']*)?'
+    r'|(?:[。！？!?]|…+)+[”’」』）)】》"\']*'
+)
+# 判定为中日韩文本所需的字符占比
+CJK_RATIO_THRESHOLD = 0.3
+
+
+def is_cjk_text(text: str, sample_chars: int = 2000) -> bool:
+    """取开头一段文本统计中日韩字符占非空白字符的比例，超过阈值则视为中日韩文本。"""
+    sample = "".join(text[:sample_chars].split())
+    if not sample:
+        return False
+    return len(_CJK_CHAR.findall(sample)) / len(sample) >= CJK_RATIO_THRESHOLD
+
+
+def cjk_sent_tokenize(text: str) -> List[str]:
+    """
+    基于标点规则的中日韩分句：按 。！？…… 断句，右引号/右括号随前句，换行视为硬边界。
+    单遍正则扫描，时间与文本长度成线性。
+    """
+    sentences = []
+    for line in text.splitlines():
+        for m in _CJK_SENTENCE.finditer(line):
+            sentence = m.group().strip()
+            if sentence:
+                sentences.append(sentence)
+    return sentences
+
+
+def sent_tokenize(text: str) -> List[str]:
+    """
+    分句：中日韩文本用标点规则分句；其他文本有本地 NLTK 数据时用 punkt，
+    否则按句末标点的简单规则切分。
+    """
+    if is_cjk_text(text):
+        return cjk_sent_tokenize(text)
+    if nltk_tokenizer_available():
+        import nltk
+        try:
+            return nltk.sent_tokenize(text)
+        except LookupError:
+            pass
+    return [s.strip() for s in _FALLBACK_SENTENCE_END.split(text) if s.strip()]
+
+
+# ============ 按长度切分（尊重句子/分句边界） ============
+
+# 相邻分段之间默认重叠的长度（与 max_length 同单位）
+DEFAULT_SEGMENT_OVERLAP = 80
+
+_CLAUSE_END = re.compile(r'(?<=[，、；：,;:])')
+
+_token_encoder = None
+_token_encoder_loaded = False
+
+
+def count_tokens(text: str) -> int:
+    """
+    统计 token 数：可用时使用 tiktoken 的 cl100k_base，
+    否则按“每个中日韩字符 1 个 token、其他每 4 个字符 1 个 token”估算。
+    """
+    global _token_encoder, _token_encoder_loaded
+    if not _token_encoder_loaded:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _token_encoder = None
+        _token_encoder_loaded = True
+    if _token_encoder is not None:
+        return len(_token_encoder.encode(text, disallowed_special=()))
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _hard_cut(text: str, max_length: int, length_function: Callable[[str], int]) -> List[str]:
+    """按字符硬切；按“字符/长度单位”比例换算出每段字符数，单位为 token 时同样适用。"""
+    window = max(1, int(max_length * len(text) / max(1, length_function(text))))
+    return [text[i:i + window] for i in range(0, len(text), window)]
+
+
+def _split_on_whitespace(clause: str, max_length: int, length_function: Callable[[str], int]) -> List[str]:
+    """在空白处拆分（英文等以空格分词的文本不会切断单词），单个词仍超长时才硬切。"""
+    space_len = length_function(" ")
+    result, current, current_len = [], [], 0
+    for word in clause.split():
+        word_len = length_function(word)
+        if current and current_len + space_len + word_len <= max_length:
+            current.append(word)
+            current_len += space_len + word_len
+            continue
+        if current:
+            result.append(" ".join(current))
+            current, current_len = [], 0
+        if word_len <= max_length:
+            current, current_len = [word], word_len
+        else:
+            result.extend(_hard_cut(word, max_length, length_function))
+    if current:
+        result.append(" ".join(current))
+    return result
+
+
+def _split_oversized(piece: str, max_length: int, length_function: Callable[[str], int]) -> List[str]:
+    """把超过 max_length 的单句先按逗号、分号等分句标点拆开，仍超长的再按空白拆分，最后才按字符硬切。"""
+    result = []
+    for clause in _CLAUSE_END.split(piece):
+        clause = clause.strip()
+        if not clause:
+            continue
+        if length_function(clause) <= max_length:
+            result.append(clause)
+        else:
+            result.extend(_split_on_whitespace(clause, max_length, length_function))
+    return result
+
+
+# 装箱单元：(文本, 长度, 来源片段下标, 是否为完整片段)
+_Unit = Tuple[str, int, int, bool]
+
+
+def _pack_units(pieces: List[str],
+                max_length: int,
+                overlap: int,
+                length_function: Callable[[str], int],
+                joiner: str) -> List[List[_Unit]]:
+    """pack_pieces 的实现，返回每个分段由哪些单元组成（供复用句向量时定位来源句子）。"""
+    units: List[_Unit] = []
+    for idx, piece in enumerate(pieces):
+        piece = piece.strip()
+        if not piece:
+            continue
+        piece_len = length_function(piece)
+        if piece_len > max_length:
+            units.extend((p, length_function(p), idx, False)
+                         for p in _split_oversized(piece, max_length, length_function))
+        else:
+            units.append((piece, piece_len, idx, True))
+
+    joiner_len = length_function(joiner) if joiner else 0
+    segments: List[List[_Unit]] = []
+    current: List[_Unit] = []
+    current_len = 0
+    for unit in units:
+        extra = unit[1] + (joiner_len if current else 0)
+        if current and current_len + extra > max_length:
+            segments.append(current)
+            # 从上一分段末尾取完整句子作为重叠部分
+            carried = []
+            carried_len = 0
+            for p in reversed(current):
+                if carried_len + p[1] > overlap or carried_len + p[1] + unit[1] > max_length:
+                    break
+                carried.insert(0, p)
+                carried_len += p[1] + joiner_len
+            current = carried
+            current_len = sum(p[1] for p in current) + joiner_len * max(0, len(current) - 1)
+            extra = unit[1] + (joiner_len if current else 0)
+        current.append(unit)
+        current_len += extra
+    if current:
+        segments.append(current)
+    return segments
+
+
+def pack_pieces(pieces: List[str],
+                max_length: int = 500,
+                overlap: int = 0,
+                length_function: Optional[Callable[[str], int]] = None,
+                joiner: str = "") -> List[str]:
+    """
+    把按顺序排列的句子/分句贪心装箱成不超过 max_length 的分段。
+    overlap > 0 时，新分段以前一分段末尾总长不超过 overlap 的若干完整句子开头。
+    每个片段只计算一次长度，整体为线性时间。
+    """
+    groups = _pack_units(pieces, max_length, overlap, length_function or len, joiner)
+    return [joiner.join(u[0] for u in units) for units in groups]
+
+
+# ============ 语义合并分段 ============
+
+
+def semantic_merge_groups(embeddings, similarity_threshold: float = 0.7, mode: str = "adjacent") -> List[Tuple[int, int]]:
+    """
+    根据句向量把相邻句子合并成段，返回每段的 [start, end) 句子下标区间。
+    句向量矩阵先整体归一化：
+    - mode="adjacent"（默认）：一次矩阵运算算出所有相邻句的余弦相似度，低于阈值处断开，完全向量化；
+    - mode="centroid"：与当前段的滑动质心（(质心+新句)/2）比较，与旧实现的合并结果一致；
+      质心依赖前面的断点，只能逐句循环（每步一次点积），约比 adjacent 慢 5 倍，仅用于需要复现旧分段时。
+    """
+    import numpy as np
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    n = len(vectors)
+    if n == 0:
+        return []
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit = vectors / norms
+
+    if mode == "adjacent":
+        sims = np.einsum("ij,ij->i", unit[:-1], unit[1:])
+        breaks = (np.flatnonzero(sims < similarity_threshold) + 1).tolist()
+        bounds = [0] + breaks + [n]
+        return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+    groups = []
+    start = 0
+    centroid = vectors[0].copy()
+    for i in range(1, n):
+        c_norm = math.sqrt(float(centroid @ centroid)) or 1.0
+        sim = float(centroid @ unit[i]) / c_norm
+        if sim >= similarity_threshold:
+            centroid = (centroid + vectors[i]) / 2.0
+        else:
+            groups.append((start, i))
+            start = i
+            centroid = vectors[i].copy()
+    groups.append((start, n))
+    return groups
+
+
+def normalize_embeddings(vectors):
+    """按行做 L2 归一化（零向量保持不变）。"""
+    import numpy as np
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def pool_sentence_embeddings(embeddings, indices: List[int], weights: List[int]):
+    """
+    由句向量合成分段向量：按句子长度加权平均后归一化。
+    句向量本身是 token 向量的均值，按长度加权近似于对整段 token 取均值。
+    """
+    import numpy as np
+    vectors = np.asarray(embeddings, dtype=np.float32)[indices]
+    w = np.asarray(weights, dtype=np.float32)[:, None]
+    return normalize_embeddings((vectors * w).sum(axis=0) / max(float(w.sum()), 1e-9))
+
+
+def split_text_semantic_with_embeddings(text: str,
+                                        similarity_threshold: float = 0.7,
+                                        max_length: int = 500,
+                                        mode: str = "adjacent",
+                                        overlap: int = DEFAULT_SEGMENT_OVERLAP,
+                                        length_function: Optional[Callable[[str], int]] = None) -> Tuple[List[str], list]:
+    """
+    统一的分段流程：分句 -> 批量编码 -> 语义合并 -> 超长段按句子边界装箱切分（带重叠）。
+    同时返回每个分段的向量（由所含句子的句向量合成，已归一化）；
+    分段中含有被硬切开的半句时无法合成，对应位置为 None。
+    """
+    if not text.strip():
+        return [], []
+
+    sentences = sent_tokenize(text)
+    if not sentences:
+        return [], []
+
+    length_function = length_function or len
+    joiner = "" if is_cjk_text(text) else " "
+    embeddings = get_splitter_model().encode(sentences, convert_to_numpy=True)
+    groups = semantic_merge_groups(embeddings, similarity_threshold, mode)
+    lengths = [len(s) for s in sentences]
+
+    segments, vectors = [], []
+    for start, end in groups:
+        para = joiner.join(sentences[start:end])
+        if length_function(para) > max_length:
+            for units in _pack_units(sentences[start:end], max_length, overlap, length_function, joiner):
+                segments.append(joiner.join(u[0] for u in units))
+                if all(u[3] for u in units):
+                    idx = [start + u[2] for u in units]
+                    vectors.append(pool_sentence_embeddings(embeddings, idx, [lengths[i] for i in idx]))
+                else:
+                    vectors.append(None)
+        else:
+            segments.append(para)
+            vectors.append(pool_sentence_embeddings(embeddings, list(range(start, end)), lengths[start:end]))
+    return segments, vectors
+
+
+def split_text_semantic(text: str,
+                        similarity_threshold: float = 0.7,
+                        max_length: int = 500,
+                        mode: str = "adjacent",
+                        overlap: int = DEFAULT_SEGMENT_OVERLAP,
+                        length_function: Optional[Callable[[str], int]] = None) -> List[str]:
+    """
+    统一的分段流程（只返回分段文本），章节定稿与知识库导入共用。
+    """
+    return split_text_semantic_with_embeddings(
+        text, similarity_threshold, max_length, mode, overlap, length_function
+    )[0]
+
+
+# ============ 多进程切分 ============
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+# 待切分内容至少够每个进程分到这么多块时才使用进程池，否则进程启动与模型加载的开销得不偿失
+POOL_MIN_BLOCKS_PER_WORKER = 4
+
+
+def default_split_workers() -> int:
+    """默认的切分进程数：留出一个核心给界面与写入线程，最多 4 个。"""
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def should_use_split_pool(total_bytes: int, block_chars: int, workers: int) -> bool:
+    """
+    按待切分文件的总字节数判断是否值得启动进程池（字节数按上限估算块数，中文每字约 3 字节，估算偏多）。
+    进程数不超过 1 时始终在进程内切分。
+    """
+    if workers <= 1:
+        return False
+    return total_bytes >= block_chars * workers * POOL_MIN_BLOCKS_PER_WORKER
+
+
+def _init_split_worker(torch_threads: int):
+    """子进程初始化：限制每个进程的推理线程数避免争抢 CPU，并预先加载切分模型。"""
+    global _onnx_threads
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    _onnx_threads = max(1, torch_threads)
+    if SPLITTER_BACKEND == "torch":
+        try:
+            import torch
+            torch.set_num_threads(max(1, torch_threads))
+        except Exception:
+            pass
+    get_splitter_model()
+
+
+def _split_block(block: str, split_kwargs: dict) -> Tuple[List[str], Optional[list]]:
+    """
+    在子进程中切分一个文本块，返回 (分段, 分段向量)。
+    split_kwargs 中 with_embeddings=True 时才回传分段向量，否则向量为 None。
+    """
+    kwargs = dict(split_kwargs)
+    with_embeddings = kwargs.pop("with_embeddings", False)
+    segments, vectors = split_text_semantic_with_embeddings(block, **kwargs)
+    keep = [i for i, s in enumerate(segments) if s.strip()]
+    return [segments[i] for i in keep], ([vectors[i] for i in keep] if with_embeddings else None)
+
+
+def get_split_worker_pool(max_workers: Optional[int] = None):
+    """
+    返回共享的切分进程池（首次调用时创建，进程数变化时重建）。
+    使用 spawn 方式启动子进程，避免在已有 Tk 主循环和模型线程的进程里 fork。
+    每个子进程各自加载一份切分模型，切分与编码完全在主进程之外执行，不占用主进程的 GIL。
+    """
+    global _pool, _pool_workers
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = max_workers or default_split_workers()
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            torch_threads = max(1, (os.cpu_count() or 1) // workers)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_split_worker,
+                initargs=(torch_threads,)
+            )
+            _pool_workers = workers
+            logging.info(f"Split worker pool started with {workers} processes.")
+        return _pool
+
+
+def shutdown_split_worker_pool():
+    """关闭共享的切分进程池（程序退出或需要释放内存时调用）。"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+            _pool_workers = 0
+
+
+def iter_split_parallel(blocks: Iterable[str],
+                        executor,
+                        max_in_flight: int = 8,
+                        **split_kwargs) -> Iterator[Tuple[List[str], Optional[list]]]:
+    """
+    把 blocks 逐个提交给 executor 并行切分，按提交顺序流式产出每块的 (分段, 分段向量)。
+    同时在途的块不超过 max_in_flight，读取速度不会远超切分速度。
+    """
+    pending = deque()
+    for block in blocks:
+        pending.append(executor.submit(_split_block, block, split_kwargs))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -19,16 +19,17 @@ tooltips = {
                   "deepseek-reasoner：8192\n"+
                   "deepseek-chat：4096\n",
     "embedding_api_key": "调用Embedding模型时所需的API Key。",
-    "embedding_interface_format": "Embedding模型接口风格，比如OpenAI或Ollama。",
+    "embedding_interface_format": "Embedding模型接口风格，比如OpenAI或Ollama；选择Local则在本机用sentence_transformers计算向量（与切分模型同名时复用切分阶段的向量，不再重复编码）。",
     "embedding_url": "Embedding模型接口地址。",
     "embedding_model_name": "Embedding模型名称，如text-embedding-ada-002。",
     "embedding_retrieval_k": "向量检索时返回的Top-K结果数量。",
+    "enable_rerank": "开启后先多取一批检索候选，再用本地 cross-encoder 模型重新排序，选出更相关的上下文。\n首次使用需下载模型；重排序超时会自动沿用向量检索顺序。",
     "topic": "小说的大致主题或主要故事背景描述。",
     "genre": "小说的题材类型，如玄幻、都市、科幻等。",
     "num_chapters": "小说期望的章节总数。",
     "word_number": "每章的目标字数。",
     "filepath": "生成文件存储的根目录路径。所有txt文件、向量库等放在该目录下。",
-    "chapter_num": "当前正在处理的章节号，用于生成草稿或定稿操作。",
+    "chapter_num": "当前正在处理的章节号，用于生成草稿或定稿操作。\n草稿候选数大于 1 时，会用同一提示词并发生成多份草稿，按字数、重复率、核心人物/关键道具覆盖与目录简述相似度打分排序，自动采用得分最高的一份，并可在弹出的列表中预览、改用其他候选。\n勾选“分场景并行”后，目标字数超过单次调用能稳定输出的长度时，草稿与扩写先规划场景再并行生成各场景（默认关闭）。",
     "user_guidance": "为本章提供的一些额外指令或写作引导。",
     "characters_involved": "本章需要重点描写或影响剧情的角色名单。",
     "key_items": "在本章中出现的重要道具、线索或物品。",
@@ -3,7 +3,6 @@
 
 import logging
 import os
-import re
 import threading
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
@@ -11,19 +10,28 @@ import tkinter as tk
 import traceback
 
 from config_manager import load_config, save_config, test_llm_config, test_embedding_config
-from utils import read_file, save_string_to_txt, clear_file_content
+from utils import read_file, save_string_to_txt, clear_file_content, count_chinese_and_english
 
 from novel_generator import (
     Novel_architecture_generate,
     Chapter_blueprint_generate,
     generate_chapter_draft,
     finalize_chapter,
-    import_knowledge_file,
     clear_vector_store,
     get_last_n_chapters_text,
-    enrich_chapter_text
+    enrich_chapter_text,
+    prefetch_next_chapter_context,
+    retrieval_collections_from_config,
+    KNOWLEDGE_COLLECTION
 )
+from finalize_parts import describe_finalize_status
 from consistency_checker import check_consistency
+from knowledge_importer import import_knowledge_file
+from embedding_adapters import create_embedding_adapter
+from text_splitter import SPLITTER_MODEL_NAME
+from embedding_migration import find_mismatched_collections, find_unsearchable_collections, start_background_reindex
+from draft_candidates import load_draft_candidates, describe_candidate
+from cancellation import CancelToken, OperationCancelled
 
 # ---- Import the tooltip texts ----
 from tooltips import tooltips
@@ -125,6 +133,7 @@ class NovelGeneratorGUI:
         self.embedding_url_var = ctk.StringVar(value=self.loaded_config.get("embedding_url", "https://api.openai.com/v1"))
         self.embedding_model_name_var = ctk.StringVar(value=self.loaded_config.get("embedding_model_name", "text-embedding-ada-002"))
         self.embedding_retrieval_k_var = ctk.StringVar(value=str(self.loaded_config.get("embedding_retrieval_k", 4)))
+        self.enable_rerank_var = ctk.BooleanVar(value=self.loaded_config.get("enable_rerank", False))
 
         # -- 小说参数相关 --
         self.topic_default = self.loaded_config.get("topic", "")
@@ -135,6 +144,8 @@ class NovelGeneratorGUI:
 
         # -- 章节参数及可选要素 --
         self.chapter_num_var = ctk.StringVar(value=str(self.loaded_config.get("chapter_num", "1")))
+        self.draft_candidates_var = ctk.StringVar(value=str(self.loaded_config.get("draft_candidates", 1)))
+        self.scene_parallel_var = ctk.BooleanVar(value=self.loaded_config.get("scene_parallel", False))
         self.characters_involved_var = ctk.StringVar(value=self.loaded_config.get("characters_involved", ""))
         self.key_items_var = ctk.StringVar(value=self.loaded_config.get("key_items", ""))
         self.scene_location_var = ctk.StringVar(value=self.loaded_config.get("scene_location", ""))
@@ -145,6 +156,10 @@ class NovelGeneratorGUI:
         # 用于存储本章指导（多行）
         self.user_guidance_default = self.loaded_config.get("user_guidance", "")
 
+        # 正在运行的生成任务的取消令牌
+        self.active_cancel_tokens = set()
+        self.cancel_tokens_lock = threading.Lock()
+
         # --------------- 整体Tab布局 ---------------
         self.tabview = ctk.CTkTabview(self.master)
         self.tabview.pack(fill="both", expand=True)
@@ -199,6 +214,28 @@ class NovelGeneratorGUI:
         """线程安全地启用按钮。"""
         self.master.after(0, lambda: btn.configure(state="normal"))
 
+    def begin_cancellable_task(self) -> CancelToken:
+        """登记一个新任务的取消令牌，“取消任务”按钮会取消所有已登记的任务。"""
+        token = CancelToken()
+        with self.cancel_tokens_lock:
+            self.active_cancel_tokens.add(token)
+        return token
+
+    def end_cancellable_task(self, token: CancelToken):
+        with self.cancel_tokens_lock:
+            self.active_cancel_tokens.discard(token)
+
+    def cancel_running_tasks(self):
+        """取消所有正在运行的生成任务，已完成的断点保留，可稍后继续。"""
+        with self.cancel_tokens_lock:
+            tokens = list(self.active_cancel_tokens)
+        if not tokens:
+            self.log("当前没有正在运行的生成任务。")
+            return
+        for token in tokens:
+            token.cancel()
+        self.log("已请求取消正在运行的任务...")
+
     def handle_exception(self, context: str):
         """在出现异常时，记录日志并输出到日志框。"""
         full_message = f"{context}\n{traceback.format_exc()}"
@@ -279,6 +316,15 @@ class NovelGeneratorGUI:
         )
         self.btn_finalize_chapter.grid(row=0, column=3, padx=5, pady=2, sticky="ew")
 
+        self.btn_cancel_task = ctk.CTkButton(
+            self.step_buttons_frame,
+            text="取消任务",
+            fg_color="gray",
+            command=self.cancel_running_tasks,
+            font=("Microsoft YaHei", 12)
+        )
+        self.btn_cancel_task.grid(row=1, column=3, padx=5, pady=2, sticky="ew")
+
         # 日志文本框
         log_label = ctk.CTkLabel(self.left_frame, text="输出日志 (只读)", font=("Microsoft YaHei", 12))
         log_label.grid(row=3, column=0, padx=5, pady=(5, 0), sticky="w")
@@ -560,8 +606,11 @@ class NovelGeneratorGUI:
             elif new_value == "Gemini":
                 self.embedding_url_var.set("https://generativelanguage.googleapis.com/v1beta/")
                 self.embedding_model_name_var.set("models/text-embedding-004")
+            elif new_value == "Local":
+                self.embedding_url_var.set("")
+                self.embedding_model_name_var.set(SPLITTER_MODEL_NAME)
 
-        for i in range(5):
+        for i in range(6):
             self.embeddings_config_tab.grid_rowconfigure(i, weight=0)
         self.embeddings_config_tab.grid_columnconfigure(0, weight=0)
         self.embeddings_config_tab.grid_columnconfigure(1, weight=1)
@@ -588,7 +637,7 @@ class NovelGeneratorGUI:
             column=0,
             font=("Microsoft YaHei", 12)
         )
-        emb_interface_options = ["DeepSeek", "OpenAI", "Azure OpenAI", "Gemini", "Ollama", "ML Studio"]
+        emb_interface_options = ["DeepSeek", "OpenAI", "Azure OpenAI", "Gemini", "Ollama", "ML Studio", "Local"]
         emb_interface_dropdown = ctk.CTkOptionMenu(
             self.embeddings_config_tab,
             values=emb_interface_options,
@@ -634,6 +683,18 @@ class NovelGeneratorGUI:
         emb_retrieval_k_entry = ctk.CTkEntry(self.embeddings_config_tab, textvariable=self.embedding_retrieval_k_var, font=("Microsoft YaHei", 12))
         emb_retrieval_k_entry.grid(row=4, column=1, padx=5, pady=5, sticky="nsew")
 
+        # 6) 本地重排序
+        self.create_label_with_help(
+            parent=self.embeddings_config_tab,
+            label_text="本地重排序:",
+            tooltip_key="enable_rerank",
+            row=5,
+            column=0,
+            font=("Microsoft YaHei", 12)
+        )
+        rerank_checkbox = ctk.CTkCheckBox(self.embeddings_config_tab, text="", variable=self.enable_rerank_var)
+        rerank_checkbox.grid(row=5, column=1, padx=5, pady=5, sticky="w")
+
         # 添加测试按钮
         test_btn = ctk.CTkButton(
             self.embeddings_config_tab,
@@ -641,7 +702,7 @@ class NovelGeneratorGUI:
             command=self.test_embedding_config,
             font=("Microsoft YaHei", 12)
         )
-        test_btn.grid(row=5, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+        test_btn.grid(row=6, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
 
     # ----------------- 小说参数区 -----------------
     def build_novel_params_area(self, start_row=1):
@@ -744,8 +805,20 @@ class NovelGeneratorGUI:
             column=0,
             font=("Microsoft YaHei", 12)
         )
-        chapter_num_entry = ctk.CTkEntry(self.params_frame, textvariable=self.chapter_num_var, width=80, font=("Microsoft YaHei", 12))
-        chapter_num_entry.grid(row=row_chap_num, column=1, padx=5, pady=5, sticky="w")
+        chapter_num_frame = ctk.CTkFrame(self.params_frame)
+        chapter_num_frame.grid(row=row_chap_num, column=1, padx=5, pady=5, sticky="ew")
+
+        chapter_num_entry = ctk.CTkEntry(chapter_num_frame, textvariable=self.chapter_num_var, width=80, font=("Microsoft YaHei", 12))
+        chapter_num_entry.grid(row=0, column=0, padx=5, pady=5, sticky="w")
+
+        candidates_label = ctk.CTkLabel(chapter_num_frame, text="草稿候选数:", font=("Microsoft YaHei", 12))
+        candidates_label.grid(row=0, column=1, padx=(15, 5), pady=5, sticky="e")
+
+        candidates_entry = ctk.CTkEntry(chapter_num_frame, textvariable=self.draft_candidates_var, width=60, font=("Microsoft YaHei", 12))
+        candidates_entry.grid(row=0, column=2, padx=5, pady=5, sticky="w")
+
+        scene_parallel_checkbox = ctk.CTkCheckBox(chapter_num_frame, text="分场景并行", variable=self.scene_parallel_var, font=("Microsoft YaHei", 12))
+        scene_parallel_checkbox.grid(row=0, column=3, padx=(15, 5), pady=5, sticky="w")
 
         # 6) 本章要求
         row_user_guide = 5
@@ -877,6 +950,14 @@ class NovelGeneratorGUI:
         )
         self.plot_arcs_btn.grid(row=0, column=3, padx=5, pady=5, sticky="ew")
 
+        self.btn_import_knowledge_dir = ctk.CTkButton(
+            self.optional_btn_frame,
+            text="导入知识库目录",
+            command=self.import_knowledge_dir_handler,
+            font=("Microsoft YaHei", 12)
+        )
+        self.btn_import_knowledge_dir.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+
     # ----------------- 配置的加载与保存 -----------------
     def load_config_btn(self):
         """
@@ -897,6 +978,7 @@ class NovelGeneratorGUI:
             self.embedding_url_var.set(cfg.get("embedding_url", ""))
             self.embedding_model_name_var.set(cfg.get("embedding_model_name", ""))
             self.embedding_retrieval_k_var.set(str(cfg.get("embedding_retrieval_k", 4)))
+            self.enable_rerank_var.set(cfg.get("enable_rerank", False))
 
             self.genre_var.set(cfg.get("genre", ""))
             self.num_chapters_var.set(str(cfg.get("num_chapters", 10)))
@@ -909,6 +991,8 @@ class NovelGeneratorGUI:
 
             # 新增：读取章节号、本章指导、可选元素
             self.chapter_num_var.set(str(cfg.get("chapter_num", "1")))
+            self.draft_candidates_var.set(str(cfg.get("draft_candidates", 1)))
+            self.scene_parallel_var.set(cfg.get("scene_parallel", False))
 
             user_guidance_value = cfg.get("user_guidance", "")
             self.user_guide_text.delete("0.0", "end")
@@ -942,6 +1026,7 @@ class NovelGeneratorGUI:
             "embedding_url": self.embedding_url_var.get(),
             "embedding_model_name": self.embedding_model_name_var.get(),
             "embedding_retrieval_k": self.safe_get_int(self.embedding_retrieval_k_var, 4),
+            "enable_rerank": self.enable_rerank_var.get(),
 
             "topic": self.topic_text.get("0.0", "end").strip(),
             "genre": self.genre_var.get(),
@@ -951,6 +1036,8 @@ class NovelGeneratorGUI:
 
             # 新增：章节号、本章指导、可选要素
             "chapter_num": self.chapter_num_var.get(),
+            "draft_candidates": self.safe_get_int(self.draft_candidates_var, 1),
+            "scene_parallel": self.scene_parallel_var.get(),
             "user_guidance": self.user_guide_text.get("0.0", "end").strip(),
             "characters_involved": self.characters_involved_var.get(),
             "key_items": self.key_items_var.get(),
@@ -958,13 +1045,74 @@ class NovelGeneratorGUI:
             "time_constraint": self.time_constraint_var.get(),
             "chapter_lang_format": self.chapter_lang_format_var.get()
         }
+        # 界面上没有的配置项（如各集合的检索权重）保留文件中已有的值
+        config_data = {**load_config(self.config_file), **config_data}
 
         if save_config(config_data, self.config_file):
             messagebox.showinfo("提示", "配置已保存至 config.json")
             self.log("配置已保存。")
+            self.check_embedding_migration()
         else:
             messagebox.showerror("错误", "保存配置失败。")
 
+    def check_embedding_migration(self):
+        """
+        若向量库记录的 Embedding 模型与当前配置不同，询问是否在后台重建索引。
+        重建期间原索引保持不变，完成后自动替换。
+        """
+        filepath = self.filepath_var.get().strip()
+        if not filepath or not os.path.exists(os.path.join(filepath, "vectorstore")):
+            return
+        try:
+            embedding_adapter = create_embedding_adapter(
+                interface_format=self.embedding_interface_format_var.get().strip(),
+                api_key=self.embedding_api_key_var.get().strip(),
+                base_url=self.embedding_url_var.get().strip(),
+                model_name=self.embedding_model_name_var.get().strip()
+            )
+            mismatched = find_mismatched_collections(embedding_adapter, filepath)
+            unsearchable = find_unsearchable_collections(filepath, mismatched)
+        except Exception:
+            self.handle_exception("检查向量库Embedding模型时出错")
+            return
+        if not mismatched:
+            return
+
+        if unsearchable:
+            retrieval_note = (
+                f"其中 {', '.join(unsearchable)} 的原模型在本次运行中不可用，重建完成前不会参与检索；"
+                "其余集合在重建期间仍用原模型检索。"
+            )
+        else:
+            retrieval_note = "重建完成前这些集合仍用原模型检索。"
+        ask = messagebox.askyesno(
+            "Embedding 模型已变更",
+            f"向量库中以下集合使用的 Embedding 模型与当前配置不同：\n{', '.join(mismatched)}\n\n"
+            f"是否在后台用当前模型重建索引？{retrieval_note}"
+        )
+        if unsearchable:
+            self.log(f"⚠️ 向量库集合 {', '.join(unsearchable)} 的 Embedding 模型与当前配置不同，重建索引完成前不参与检索。")
+        if not ask:
+            return
+
+        def on_done(success: bool):
+            if success:
+                self.safe_log("✅ 向量库索引重建完成。")
+            else:
+                self.safe_log("⚠️ 向量库索引重建未完成，原索引保持不变，可稍后重试。")
+
+        thread = start_background_reindex(
+            embedding_adapter,
+            filepath,
+            collection_names=mismatched,
+            progress_callback=self.safe_log,
+            on_done=on_done
+        )
+        if thread is None:
+            self.log("已有重建索引任务在运行。")
+        else:
+            self.log("已开始在后台重建向量库索引...")
+
     def browse_folder(self):
         selected_dir = filedialog.askdirectory()
         if selected_dir:
@@ -982,6 +1130,7 @@ class NovelGeneratorGUI:
 
         def task():
             self.disable_button_safe(self.btn_generate_architecture)
+            token = self.begin_cancellable_task()
             try:
                 interface_format = self.interface_format_var.get().strip()
                 api_key = self.api_key_var.get().strip()
@@ -1009,12 +1158,16 @@ class NovelGeneratorGUI:
                     filepath=filepath,
                     temperature=temperature,
                     max_tokens=max_tokens,
-                    timeout=timeout_val
+                    timeout=timeout_val,
+                    cancel_token=token
                 )
                 self.safe_log("✅ 小说架构生成完成。请在 'Novel Architecture' 标签页查看或编辑。")
+            except OperationCancelled:
+                self.safe_log("⏹ 小说架构生成已取消，已完成的步骤已保存，再次生成时继续。")
             except Exception:
                 self.handle_exception("生成小说架构时出错")
             finally:
+                self.end_cancellable_task(token)
                 self.enable_button_safe(self.btn_generate_architecture)
 
         threading.Thread(target=task, daemon=True).start()
@@ -1030,6 +1183,7 @@ class NovelGeneratorGUI:
 
         def task():
             self.disable_button_safe(self.btn_generate_directory)
+            token = self.begin_cancellable_task()
             try:
                 interface_format = self.interface_format_var.get().strip()
                 api_key = self.api_key_var.get().strip()
@@ -1041,7 +1195,7 @@ class NovelGeneratorGUI:
                 timeout_val = self.safe_get_int(self.timeout_var, 600)
 
                 self.safe_log("开始生成章节蓝图...")
-                Chapter_blueprint_generate(
+                ok = Chapter_blueprint_generate(
                     interface_format=interface_format,
                     api_key=api_key,
                     base_url=base_url,
@@ -1050,12 +1204,19 @@ class NovelGeneratorGUI:
                     filepath=filepath,
                     temperature=temperature,
                     max_tokens=max_tokens,
-                    timeout=timeout_val
+                    timeout=timeout_val,
+                    cancel_token=token
                 )
-                self.safe_log("✅ 章节蓝图生成完成。请在 'Chapter Blueprint' 标签页查看或编辑。")
+                if ok:
+                    self.safe_log("✅ 章节蓝图生成完成。请在 'Chapter Blueprint' 标签页查看或编辑。")
+                else:
+                    self.safe_log("⚠️ 章节蓝图未能完整生成，已生成的部分已保存，再次生成时继续。")
+            except OperationCancelled:
+                self.safe_log("⏹ 章节蓝图生成已取消，已生成的部分已保存，再次生成时继续。")
             except Exception:
                 self.handle_exception("生成章节蓝图时出错")
             finally:
+                self.end_cancellable_task(token)
                 self.enable_button_safe(self.btn_generate_directory)
 
         threading.Thread(target=task, daemon=True).start()
@@ -1071,6 +1232,7 @@ class NovelGeneratorGUI:
 
         def task():
             self.disable_button_safe(self.btn_generate_chapter)
+            token = self.begin_cancellable_task()
             try:
                 interface_format = self.interface_format_var.get().strip()
                 api_key = self.api_key_var.get().strip()
@@ -1096,8 +1258,14 @@ class NovelGeneratorGUI:
                 embedding_interface_format = self.embedding_interface_format_var.get().strip()
                 embedding_model_name = self.embedding_model_name_var.get().strip()
                 embedding_k = self.safe_get_int(self.embedding_retrieval_k_var, 4)
+                retrieval_collections = retrieval_collections_from_config(load_config(self.config_file), embedding_k)
+                enable_rerank = self.enable_rerank_var.get()
+                num_candidates = max(1, self.safe_get_int(self.draft_candidates_var, 1))
 
-                self.safe_log(f"开始生成第{chap_num}章草稿...")
+                if num_candidates > 1:
+                    self.safe_log(f"开始生成第{chap_num}章草稿（{num_candidates} 份候选并发生成）...")
+                else:
+                    self.safe_log(f"开始生成第{chap_num}章草稿...")
                 draft_text = generate_chapter_draft(
                     api_key=api_key,
                     base_url=base_url,
@@ -1116,24 +1284,90 @@ class NovelGeneratorGUI:
                     embedding_interface_format=embedding_interface_format,
                     embedding_model_name=embedding_model_name,
                     embedding_retrieval_k=embedding_k,
+                    retrieval_collections=retrieval_collections,
+                    enable_rerank=enable_rerank,
                     interface_format=interface_format,
                     max_tokens=max_tokens,
                     timeout=timeout_val,
-                    chapter_lang_format=chapter_lang_format
+                    chapter_lang_format=chapter_lang_format,
+                    cancel_token=token,
+                    num_candidates=num_candidates,
+                    scene_parallel=self.scene_parallel_var.get()
                 )
                 if draft_text:
                     self.safe_log(f"✅ 第{chap_num}章草稿生成完成。请在左侧查看或编辑。")
                     self.master.after(0, lambda: self.show_chapter_in_textbox(draft_text))
+                    if num_candidates > 1:
+                        ranked = load_draft_candidates(filepath, chap_num)
+                        for rank, candidate in enumerate(ranked, start=1):
+                            self.safe_log(describe_candidate(rank, candidate))
+                        self.master.after(0, lambda: self.show_draft_candidates_ui(filepath, chap_num, ranked))
                 else:
                     self.safe_log("⚠️ 本章草稿生成失败或无内容。")
 
+            except OperationCancelled:
+                self.safe_log("⏹ 章节草稿生成已取消，章节文件未改动。")
             except Exception:
                 self.handle_exception("生成章节草稿时出错")
             finally:
+                self.end_cancellable_task(token)
                 self.enable_button_safe(self.btn_generate_chapter)
 
         threading.Thread(target=task, daemon=True).start()
 
+    def show_draft_candidates_ui(self, filepath: str, chap_num: int, ranked: list):
+        """
+        按得分列出本章的候选草稿，可预览并采用其中一份（写入章节文件并显示在左侧）。
+        已自动采用得分最高的一份。
+        """
+        if len(ranked) < 2:
+            return
+
+        top = ctk.CTkToplevel(self.master)
+        top.title(f"第{chap_num}章候选草稿")
+        top.geometry("800x600")
+        top.grid_columnconfigure(0, weight=1)
+        top.grid_rowconfigure(1, weight=1)
+
+        list_frame = ctk.CTkFrame(top)
+        list_frame.grid(row=0, column=0, sticky="ew", padx=10, pady=(10, 5))
+        list_frame.columnconfigure(0, weight=1)
+
+        preview = ctk.CTkTextbox(top, wrap="word", font=("Microsoft YaHei", 12))
+        TextWidgetContextMenu(preview)
+        preview.grid(row=1, column=0, sticky="nsew", padx=10, pady=(5, 10))
+
+        def show_preview(candidate):
+            preview.configure(state="normal")
+            preview.delete("0.0", "end")
+            preview.insert("0.0", candidate["text"])
+            preview.configure(state="disabled")
+
+        def adopt(rank, candidate):
+            chapter_file = os.path.join(filepath, "chapters", f"chapter_{chap_num}.txt")
+            clear_file_content(chapter_file)
+            save_string_to_txt(candidate["text"], chapter_file)
+            self.show_chapter_in_textbox(candidate["text"])
+            self.log(f"已采用第{chap_num}章的第 {rank} 名候选草稿。")
+
+        for rank, candidate in enumerate(ranked, start=1):
+            if not candidate["text"].strip():
+                continue
+            label = ctk.CTkLabel(list_frame, text=describe_candidate(rank, candidate), anchor="w", font=("Microsoft YaHei", 12))
+            label.grid(row=rank, column=0, padx=5, pady=2, sticky="ew")
+            view_btn = ctk.CTkButton(
+                list_frame, text="预览", width=60, font=("Microsoft YaHei", 12),
+                command=lambda c=candidate: show_preview(c)
+            )
+            view_btn.grid(row=rank, column=1, padx=5, pady=2)
+            adopt_btn = ctk.CTkButton(
+                list_frame, text="采用", width=60, font=("Microsoft YaHei", 12),
+                command=lambda r=rank, c=candidate: adopt(r, c)
+            )
+            adopt_btn.grid(row=rank, column=2, padx=5, pady=2)
+
+        show_preview(ranked[0])
+
     def show_chapter_in_textbox(self, text: str):
         """
         将生成或读取到的章节文本内容显示到左侧文本框中。
@@ -1153,6 +1387,7 @@ class NovelGeneratorGUI:
 
         def task():
             self.disable_button_safe(self.btn_finalize_chapter)
+            token = self.begin_cancellable_task()
             try:
                 interface_format = self.interface_format_var.get().strip()
                 api_key = self.api_key_var.get().strip()
@@ -1190,6 +1425,7 @@ class NovelGeneratorGUI:
                     )
                     if ask:
                         # 调用 enrich_chapter_text 进行扩写
+                        # 开启分场景并行时，长章节按场景规划并行扩写，每个场景一次调用，避免整章重新生成一遍
                         self.safe_log("正在扩写章节内容...")
                         enriched = enrich_chapter_text(
                             chapter_text=edited_text,
@@ -1200,7 +1436,10 @@ class NovelGeneratorGUI:
                             temperature=temperature,
                             interface_format=interface_format,
                             max_tokens=max_tokens,
-                            timeout=timeout_val
+                            timeout=timeout_val,
+                            cancel_token=token,
+                            scene_parallel=self.scene_parallel_var.get(),
+                            chapter_lang_format=self.chapter_lang_format_var.get().strip()
                         )
                         edited_text = enriched
                         # 更新文本框显示
@@ -1212,7 +1451,7 @@ class NovelGeneratorGUI:
                 save_string_to_txt(edited_text, chapter_file)
 
                 # 调用 finalize_chapter 做最终处理（更新全局摘要、角色状态、向量库等）
-                finalize_chapter(
+                status = finalize_chapter(
                     novel_number=chap_num,
                     word_number=word_number,
                     api_key=api_key,
@@ -1226,16 +1465,49 @@ class NovelGeneratorGUI:
                     embedding_model_name=embedding_model_name,
                     interface_format=interface_format,
                     max_tokens=max_tokens,
-                    timeout=timeout_val
+                    timeout=timeout_val,
+                    cancel_token=token
                 )
-                self.safe_log(f"✅ 第{chap_num}章定稿完成（已更新全局摘要、角色状态、向量库）。")
+                problems = describe_finalize_status(status)
+                if problems:
+                    for problem in problems:
+                        self.safe_log(f"⚠️ 第{chap_num}章定稿：{problem}。")
+                    self.safe_log(f"⚠️ 第{chap_num}章定稿未完全完成，未更新的部分保留旧内容，可重新定稿。")
+                else:
+                    self.safe_log(f"✅ 第{chap_num}章定稿完成（已更新全局摘要、角色状态、向量库）。")
+
+                # 用户查看/编辑期间，在后台预先准备下一章草稿所需的摘要与检索上下文
+                if prefetch_next_chapter_context(
+                    filepath,
+                    chap_num + 1,
+                    interface_format=interface_format,
+                    api_key=api_key,
+                    base_url=base_url,
+                    model_name=model_name,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=timeout_val,
+                    embedding_api_key=embedding_api_key,
+                    embedding_url=embedding_url,
+                    embedding_interface_format=embedding_interface_format,
+                    embedding_model_name=embedding_model_name,
+                    embedding_retrieval_k=self.safe_get_int(self.embedding_retrieval_k_var, 4),
+                    retrieval_collections=retrieval_collections_from_config(
+                        load_config(self.config_file), self.safe_get_int(self.embedding_retrieval_k_var, 4)
+                    ),
+                    enable_rerank=self.enable_rerank_var.get()
+                ):
+                    self.safe_log(f"已在后台预取第{chap_num + 1}章的上下文。")
 
                 final_text = read_file(chapter_file)
                 self.master.after(0, lambda: self.show_chapter_in_textbox(final_text))
 
+            except OperationCancelled:
+                self.safe_log("⏹ 定稿已取消，全局摘要、角色状态与向量库保持定稿前的状态。")
             except Exception:
                 self.handle_exception("定稿章节时出错")
             finally:
+                self.end_cancellable_task(token)
                 self.enable_button_safe(self.btn_finalize_chapter)
 
         threading.Thread(target=task, daemon=True).start()
@@ -1304,30 +1576,50 @@ class NovelGeneratorGUI:
             filetypes=[("Text Files", "*.txt"), ("All Files", "*.*")]
         )
         if selected_file:
-            def task():
-                self.disable_button_safe(self.btn_import_knowledge)
-                try:
-                    emb_api_key = self.embedding_api_key_var.get().strip()
-                    emb_url = self.embedding_url_var.get().strip()
-                    emb_format = self.embedding_interface_format_var.get().strip()
-                    emb_model = self.embedding_model_name_var.get().strip()
-
-                    self.safe_log(f"开始导入知识库文件: {selected_file}")
-                    import_knowledge_file(
-                        embedding_api_key=emb_api_key,
-                        embedding_url=emb_url,
-                        embedding_interface_format=emb_format,
-                        embedding_model_name=emb_model,
-                        file_path=selected_file,
-                        filepath=self.filepath_var.get().strip()
+            self.start_knowledge_import(selected_file, self.btn_import_knowledge)
+
+    def import_knowledge_dir_handler(self):
+        """
+        导入整个目录下的 .txt/.md 文件到本地知识库，多个文件并行读取与切分。
+        """
+        selected_dir = filedialog.askdirectory(title="选择要导入的知识库目录")
+        if selected_dir:
+            self.start_knowledge_import(selected_dir, self.btn_import_knowledge_dir)
+
+    def start_knowledge_import(self, path: str, btn):
+        """在后台线程中导入知识库文件或目录，完成后输出导入速度。"""
+        def task():
+            self.disable_button_safe(btn)
+            try:
+                emb_api_key = self.embedding_api_key_var.get().strip()
+                emb_url = self.embedding_url_var.get().strip()
+                emb_format = self.embedding_interface_format_var.get().strip()
+                emb_model = self.embedding_model_name_var.get().strip()
+
+                self.safe_log(f"开始导入知识库: {path}")
+                stats = import_knowledge_file(
+                    embedding_api_key=emb_api_key,
+                    embedding_url=emb_url,
+                    embedding_interface_format=emb_format,
+                    embedding_model_name=emb_model,
+                    file_path=path,
+                    filepath=self.filepath_var.get().strip()
+                )
+                if stats:
+                    self.safe_log(
+                        f"✅ 知识库导入完成：{stats['files']} 个文件（{stats.get('skipped_files', 0)} 个未变化已跳过），"
+                        f"写入 {stats['segments']} 个分段，保留未变分段 {stats.get('reused_segments', 0)} 段，"
+                        f"删除过期分段 {stats.get('removed_segments', 0)} 段，跳过近重复 {stats.get('duplicate_segments', 0)} 段，"
+                        f"耗时 {stats['seconds']} 秒（{stats['segments_per_sec']} 段/秒）。"
                     )
-                    self.safe_log("✅ 知识库文件导入完成。")
-                except Exception:
-                    self.handle_exception("导入知识库时出错")
-                finally:
-                    self.enable_button_safe(self.btn_import_knowledge)
+                else:
+                    self.safe_log("⚠️ 知识库导入失败或无有效内容。")
+            except Exception:
+                self.handle_exception("导入知识库时出错")
+            finally:
+                self.enable_button_safe(btn)
 
-            threading.Thread(target=task, daemon=True).start()
+        threading.Thread(target=task, daemon=True).start()
 
     def clear_vectorstore_handler(self):
         """
@@ -1338,6 +1630,20 @@ class NovelGeneratorGUI:
             messagebox.showwarning("警告", "请先配置保存文件路径。")
             return
 
+        # 是：仅清空导入的知识库集合；否：清空全部；取消：不操作
+        choice = messagebox.askyesnocancel(
+            "清空向量库",
+            "是否仅清空导入的知识库？\n\n选择“是”只删除知识库集合，章节内容保留；\n选择“否”将删除全部向量数据（含章节）。"
+        )
+        if choice is None:
+            return
+        if choice:
+            if clear_vector_store(filepath, KNOWLEDGE_COLLECTION):
+                self.log("已清空知识库集合。")
+            else:
+                self.log("未能清空知识库集合，可能尚未导入过知识库。")
+            return
+
         first_confirm = messagebox.askyesno("警告", "确定要清空本地向量库吗？此操作不可恢复！")
         if first_confirm:
             second_confirm = messagebox.askyesno("二次确认", "你确定真的要删除所有向量数据吗？此操作不可恢复！")
@@ -1769,15 +2075,7 @@ class NovelGeneratorGUI:
         """
         计算文本中的中文字符和英文单词数量
         """
-        # 计算中文字符
-        chinese_count = len([char for char in text if '\u4e00' <= char <= '\u9fff'])
-        
-        # 计算英文单词
-        english_words = re.findall(r'\b[a-zA-Z]+\b', text)
-        english_word_count = len(english_words)
-
-        # 返回中文字符和英文单词的总数
-        return chinese_count + english_word_count
+        return count_chinese_and_english(text)
 
 # ----------------- 程序入口 -----------------
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
 # utils.py
 # -*- coding: utf-8 -*-
-import os
+import re
 import json
 
 def read_file(filename: str) -> str:
@@ -51,3 +51,9 @@ def save_data_to_json(data: dict, file_path: str) -> bool:
     except Exception as e:
         print(f"[save_data_to_json] 保存数据到JSON文件时出错: {e}")
         return False
+
+def count_chinese_and_english(text: str) -> int:
+    """计算文本中的中文字符和英文单词数量之和。"""
+    chinese_count = len([char for char in text if '一' <= char <= '鿿'])
+    english_word_count = len(re.findall(r'\b[a-zA-Z]+\b', text))
+    return chinese_count + english_word_count
@@ -0,0 +1,434 @@
+# vectorstore_maintenance.py
+# -*- coding: utf-8 -*-
+"""
+向量库维护工具：快照/恢复、二进制导出/导入、压缩去重、一致性校验。
+所有操作直接基于 chromadb 客户端，不需要重新调用 Embedding 接口。
+
+命令行用法示例：
+  python vectorstore_maintenance.py snapshot  <项目路径>
+  python vectorstore_maintenance.py restore   <项目路径> <快照.zip>
+  python vectorstore_maintenance.py export    <项目路径> <导出.ngvs>
+  python vectorstore_maintenance.py import    <项目路径> <导出.ngvs>
+  python vectorstore_maintenance.py compact   <项目路径>
+  python vectorstore_maintenance.py verify    <项目路径>
+"""
+import os
+import json
+import logging
+import shutil
+import sqlite3
+import struct
+import tempfile
+import time
+import traceback
+import zipfile
+from array import array
+from typing import Iterator, List, Optional, Tuple
+
+import chromadb
+from chromadb.config import Settings
+
+from novel_generator import get_vectorstore_dir
+from segment_dedup import invalidate_signature_index
+from import_manifest import ImportManifest
+
+CHROMA_SQLITE_FILE = "chroma.sqlite3"
+SNAPSHOT_DIR_NAME = "vectorstore_snapshots"
+
+# 导出文件格式：
+#   文件头 EXPORT_MAGIC + 1字节版本号
+#   之后为连续的记录，每条记录：
+#     <uint32 json长度><json><uint32 向量维度><float32 * 维度>
+#   json 中 type=collection 为集合头（携带集合元数据，维度为0），
+#   type=item 为一条分段（集合名、id、文本、元数据）。
+EXPORT_MAGIC = b"NGVS"
+EXPORT_VERSION = 1
+
+# 读写 Chroma 时的分页大小
+PAGE_SIZE = 1000
+
+
+# ============ 基础工具 ============
+
+def get_chroma_client(filepath: str):
+    """返回项目向量库目录对应的 chromadb 持久化客户端。"""
+    return chromadb.PersistentClient(
+        path=get_vectorstore_dir(filepath),
+        settings=Settings(anonymized_telemetry=False)
+    )
+
+def list_collection_names(client) -> List[str]:
+    """兼容新旧版本 chromadb：list_collections 可能返回集合对象或集合名。"""
+    return [c if isinstance(c, str) else c.name for c in client.list_collections()]
+
+def normalize_batch_metadatas(metadatas) -> Optional[list]:
+    """整批都没有元数据时返回 None，否则把空 dict 换成 None，避免旧版 chromadb 拒绝空元数据。"""
+    if not any(metadatas):
+        return None
+    return [m or None for m in metadatas]
+
+def iter_collection_items(collection, include_embeddings: bool = True) -> Iterator[Tuple[str, str, dict, Optional[List[float]]]]:
+    """分页遍历集合，逐条产出 (id, 文本, 元数据, 向量)。"""
+    include = ["documents", "metadatas"]
+    if include_embeddings:
+        include.append("embeddings")
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=PAGE_SIZE, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        documents = page.get("documents")
+        metadatas = page.get("metadatas")
+        embeddings = page.get("embeddings") if include_embeddings else None
+        for i, item_id in enumerate(ids):
+            doc = documents[i] if documents is not None else ""
+            meta = metadatas[i] if metadatas is not None else None
+            emb = None
+            if embeddings is not None and embeddings[i] is not None:
+                emb = [float(x) for x in embeddings[i]]
+            yield item_id, doc or "", meta or {}, emb
+        offset += len(ids)
+
+def collection_ids(collection) -> set:
+    """集合中全部分段 id（分页读取，不取文本与向量）。"""
+    result = set()
+    offset = 0
+    while True:
+        ids = collection.get(include=[], limit=PAGE_SIZE, offset=offset).get("ids") or []
+        if not ids:
+            break
+        result.update(ids)
+        offset += len(ids)
+    return result
+
+def sync_collection_indexes(filepath: str, name: str, collection, imported_entries: Optional[List[dict]] = None):
+    """
+    集合内容被导入或压缩改变后，同步两个派生索引：
+    - 导入清单：并入导出文件携带的条目，并去掉已不在集合中的分段 id；
+    - 分段签名索引：清除该集合的签名，下次去重时从向量库重建。
+    """
+    store_dir = get_vectorstore_dir(filepath)
+    try:
+        manifest = ImportManifest(store_dir)
+        merged = manifest.merge_entries(name, imported_entries or [])
+        pruned = manifest.prune_segment_ids(name, collection_ids(collection))
+        if merged or pruned:
+            manifest.save()
+            logging.info(f"Import manifest of '{name}': {merged} entries merged, {pruned} segment ids pruned.")
+    except Exception as e:
+        logging.warning(f"Failed to update import manifest of '{name}': {e}")
+        traceback.print_exc()
+    invalidate_signature_index(store_dir, name)
+
+
+# ============ 快照与恢复 ============
+
+def snapshot_vector_store(filepath: str, snapshot_path: Optional[str] = None) -> str:
+    """
+    将整个向量库打包为一个 zip 快照文件，返回快照路径。
+    chroma.sqlite3 通过 sqlite 的 backup 接口复制，程序运行中也能得到一致的副本。
+    """
+    store_dir = get_vectorstore_dir(filepath)
+    if not os.path.exists(store_dir):
+        raise FileNotFoundError(f"Vector store not found: {store_dir}")
+
+    if not snapshot_path:
+        snapshot_dir = os.path.join(filepath, SNAPSHOT_DIR_NAME)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        snapshot_path = os.path.join(snapshot_dir, f"vectorstore_{time.strftime('%Y%m%d_%H%M%S')}.zip")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with zipfile.ZipFile(snapshot_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for root, _, names in os.walk(store_dir):
+                for name in names:
+                    full_path = os.path.join(root, name)
+                    arcname = os.path.relpath(full_path, store_dir)
+                    if name == CHROMA_SQLITE_FILE and root == store_dir:
+                        db_copy = os.path.join(tmp_dir, CHROMA_SQLITE_FILE)
+                        src = sqlite3.connect(full_path)
+                        dst = sqlite3.connect(db_copy)
+                        try:
+                            src.backup(dst)
+                        finally:
+                            dst.close()
+                            src.close()
+                        zf.write(db_copy, arcname)
+                    else:
+                        zf.write(full_path, arcname)
+
+    logging.info(f"Vector store snapshot saved to {snapshot_path}")
+    return snapshot_path
+
+def restore_vector_store(filepath: str, snapshot_path: str) -> bool:
+    """
+    从 zip 快照恢复向量库。先解压到临时目录，再与现有目录整体替换；
+    原目录会被重命名为 vectorstore.bak_时间戳 保留，替换失败时不影响原数据。
+    """
+    store_dir = get_vectorstore_dir(filepath)
+    staging_dir = store_dir + ".restore_tmp"
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    try:
+        with zipfile.ZipFile(snapshot_path, "r") as zf:
+            zf.extractall(staging_dir)
+    except Exception as e:
+        logging.error(f"Failed to extract snapshot {snapshot_path}: {e}")
+        traceback.print_exc()
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return False
+
+    backup_dir = None
+    try:
+        if os.path.exists(store_dir):
+            backup_dir = f"{store_dir}.bak_{time.strftime('%Y%m%d_%H%M%S')}"
+            os.replace(store_dir, backup_dir)
+        os.replace(staging_dir, store_dir)
+        # 签名文件随快照一起恢复，丢弃内存中的旧索引
+        invalidate_signature_index(store_dir)
+    except Exception as e:
+        logging.error(f"无法替换向量库目录，请关闭程序后重试。\n {str(e)}")
+        traceback.print_exc()
+        if backup_dir and os.path.exists(backup_dir) and not os.path.exists(store_dir):
+            os.replace(backup_dir, store_dir)
+        return False
+
+    logging.info(f"Vector store restored from {snapshot_path}" + (f", previous store kept at {backup_dir}" if backup_dir else ""))
+    return True
+
+
+# ============ 二进制导出与导入 ============
+
+def _write_record(f, header: dict, embedding: Optional[List[float]] = None):
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    f.write(struct.pack("<I", len(header_bytes)))
+    f.write(header_bytes)
+    vec = array("f", embedding or [])
+    f.write(struct.pack("<I", len(vec)))
+    f.write(vec.tobytes())
+
+def _read_records(f) -> Iterator[Tuple[dict, List[float]]]:
+    while True:
+        raw_len = f.read(4)
+        if not raw_len:
+            break
+        (header_len,) = struct.unpack("<I", raw_len)
+        header = json.loads(f.read(header_len).decode("utf-8"))
+        (dim,) = struct.unpack("<I", f.read(4))
+        vec = array("f")
+        if dim:
+            vec.frombytes(f.read(dim * 4))
+        yield header, vec.tolist()
+
+def export_vector_store(filepath: str, export_path: str, collection_names: Optional[List[str]] = None) -> int:
+    """
+    将向量、文本与元数据导出为紧凑的二进制流文件（float32 存储向量）。
+    collection_names 为空时导出全部集合。返回导出的分段条数。
+    """
+    client = get_chroma_client(filepath)
+    names = collection_names or list_collection_names(client)
+    manifest = ImportManifest(get_vectorstore_dir(filepath))
+    total = 0
+    with open(export_path, "wb") as f:
+        f.write(EXPORT_MAGIC + bytes([EXPORT_VERSION]))
+        for name in names:
+            collection = client.get_collection(name)
+            # 集合头附带该集合的导入清单条目，导入端据此继续按文件跳过/增量导入
+            _write_record(f, {"type": "collection", "name": name, "metadata": collection.metadata or {},
+                              "manifest": manifest.collection_entries(name)})
+            for item_id, doc, meta, emb in iter_collection_items(collection):
+                _write_record(f, {"type": "item", "collection": name, "id": item_id, "document": doc, "metadata": meta}, emb)
+                total += 1
+    logging.info(f"Exported {total} segments from {len(names)} collections to {export_path}")
+    return total
+
+def import_vector_store(filepath: str, import_path: str, batch_size: int = 256) -> int:
+    """
+    从 export_vector_store 生成的文件导入，按 id upsert，重复导入不会产生重复数据。
+    直接使用文件中的向量，不会重新调用 Embedding 接口。返回导入的分段条数。
+    导入后同步各集合的导入清单与分段签名索引。
+    """
+    os.makedirs(get_vectorstore_dir(filepath), exist_ok=True)
+    client = get_chroma_client(filepath)
+    collections = {}
+    manifest_entries = {}
+    pending = {}
+    total = 0
+
+    def flush(name: str):
+        batch = pending.get(name)
+        if not batch:
+            return
+        ids, docs, metas, embs = zip(*batch)
+        collections[name].upsert(
+            ids=list(ids),
+            embeddings=list(embs),
+            documents=list(docs),
+            metadatas=normalize_batch_metadatas(metas)
+        )
+        pending[name] = []
+
+    with open(import_path, "rb") as f:
+        magic = f.read(len(EXPORT_MAGIC) + 1)
+        if magic[:len(EXPORT_MAGIC)] != EXPORT_MAGIC:
+            raise ValueError(f"Not a vector store export file: {import_path}")
+        if magic[len(EXPORT_MAGIC)] > EXPORT_VERSION:
+            raise ValueError(f"Unsupported export version: {magic[len(EXPORT_MAGIC)]}")
+
+        for header, vec in _read_records(f):
+            if header.get("type") == "collection":
+                name = header["name"]
+                collections[name] = client.get_or_create_collection(
+                    name=name,
+                    metadata=header.get("metadata") or None,
+                    embedding_function=None
+                )
+                manifest_entries[name] = header.get("manifest") or []
+                pending[name] = []
+                continue
+
+            name = header["collection"]
+            pending[name].append((header["id"], header.get("document", ""), header.get("metadata") or {}, vec))
+            total += 1
+            if len(pending[name]) >= batch_size:
+                flush(name)
+
+    for name in list(pending.keys()):
+        flush(name)
+    for name, collection in collections.items():
+        sync_collection_indexes(filepath, name, collection, manifest_entries.get(name))
+
+    logging.info(f"Imported {total} segments into {len(collections)} collections from {import_path}")
+    return total
+
+
+# ============ 压缩去重 ============
+
+def compact_vector_store(filepath: str, collection_names: Optional[List[str]] = None) -> dict:
+    """
+    删除每个集合中的空文本分段与重复文本分段（保留首次出现的一条），
+    然后对 chroma.sqlite3 执行 VACUUM 回收已删除数据占用的空间。
+    删除了分段的集合同步更新导入清单与分段签名索引。返回 {集合名: 删除条数}。
+    """
+    client = get_chroma_client(filepath)
+    names = collection_names or list_collection_names(client)
+    removed = {}
+    for name in names:
+        collection = client.get_collection(name)
+        seen = set()
+        to_delete = []
+        for item_id, doc, _, _ in iter_collection_items(collection, include_embeddings=False):
+            key = doc.strip()
+            if not key or key in seen:
+                to_delete.append(item_id)
+            else:
+                seen.add(key)
+        for i in range(0, len(to_delete), PAGE_SIZE):
+            collection.delete(ids=to_delete[i:i + PAGE_SIZE])
+        removed[name] = len(to_delete)
+        if to_delete:
+            sync_collection_indexes(filepath, name, collection)
+        logging.info(f"Compacted collection '{name}': {len(to_delete)} empty/duplicate segments removed.")
+
+    db_file = os.path.join(get_vectorstore_dir(filepath), CHROMA_SQLITE_FILE)
+    if os.path.exists(db_file):
+        try:
+            conn = sqlite3.connect(db_file)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        except Exception as e:
+            # 其他进程持有写锁时 VACUUM 会失败，不影响去重结果
+            logging.warning(f"VACUUM on {db_file} skipped: {e}")
+    return removed
+
+
+# ============ 一致性校验 ============
+
+def verify_vector_store(filepath: str, embedding_adapter=None) -> dict:
+    """
+    校验每个集合内的向量维度是否一致、是否存在缺失向量或空文本；
+    若传入 embedding_adapter，还会核对集合记录的模型指纹，并用一次 embed_query 的结果核对当前模型的向量维度。
+    返回 {"ok": bool, "collections": {集合名: 明细}, "model_dim": 维度或None}。
+    """
+    client = get_chroma_client(filepath)
+    model_dim = None
+    if embedding_adapter is not None:
+        try:
+            model_dim = len(embedding_adapter.embed_query("dimension probe")) or None
+        except Exception as e:
+            logging.warning(f"Embedding probe failed during verify: {e}")
+
+    report = {"ok": True, "collections": {}, "model_dim": model_dim}
+    for name in list_collection_names(client):
+        collection = client.get_collection(name)
+        dims = {}
+        missing_vectors = 0
+        empty_documents = 0
+        count = 0
+        for _, doc, _, emb in iter_collection_items(collection):
+            count += 1
+            if not doc.strip():
+                empty_documents += 1
+            if not emb:
+                missing_vectors += 1
+            else:
+                dims[len(emb)] = dims.get(len(emb), 0) + 1
+
+        problems = []
+        if len(dims) > 1:
+            problems.append(f"mixed dimensions: {dims}")
+        if missing_vectors:
+            problems.append(f"{missing_vectors} segments without vectors")
+        if empty_documents:
+            problems.append(f"{empty_documents} empty segments")
+        if model_dim and dims and set(dims) != {model_dim}:
+            problems.append(f"store dimension {sorted(dims)} != current model dimension {model_dim}")
+        stored_fp = (collection.metadata or {}).get("embedding_fingerprint", "")
+        current_fp = getattr(embedding_adapter, "fingerprint", "")
+        if stored_fp and current_fp and stored_fp != current_fp:
+            problems.append(f"built with embedding model '{stored_fp}', current model is '{current_fp}'")
+
+        report["collections"][name] = {
+            "count": count,
+            "dimensions": dims,
+            "metadata": collection.metadata or {},
+            "problems": problems
+        }
+        if problems:
+            report["ok"] = False
+            logging.warning(f"Collection '{name}' failed verification: {'; '.join(problems)}")
+        else:
+            logging.info(f"Collection '{name}' OK: {count} segments.")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Vector store maintenance tools")
+    parser.add_argument("action", choices=["snapshot", "restore", "export", "import", "compact", "verify"])
+    parser.add_argument("filepath", help="小说项目保存路径（包含 vectorstore 目录）")
+    parser.add_argument("target", nargs="?", help="快照/导出文件路径")
+    args = parser.parse_args()
+
+    if args.action in ("restore", "export", "import") and not args.target:
+        parser.error(f"{args.action} requires a target file")
+
+    if args.action == "snapshot":
+        print(snapshot_vector_store(args.filepath, args.target))
+    elif args.action == "restore":
+        raise SystemExit(0 if restore_vector_store(args.filepath, args.target) else 1)
+    elif args.action == "export":
+        print(export_vector_store(args.filepath, args.target))
+    elif args.action == "import":
+        print(import_vector_store(args.filepath, args.target))
+    elif args.action == "compact":
+        print(json.dumps(compact_vector_store(args.filepath), ensure_ascii=False, indent=2))
+    elif args.action == "verify":
+        result = verify_vector_store(args.filepath)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        raise SystemExit(0 if result["ok"] else 1)